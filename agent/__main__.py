@@ -14,6 +14,12 @@ def main() -> None:
 		default=8,
 		help="Maximum tool-call/response iterations per user message",
 	)
+	parser.add_argument(
+		"--tool-concurrency",
+		type=int,
+		default=4,
+		help="Worker threads for running a batch of read-only tool calls in parallel (1 = sequential)",
+	)
 	parser.add_argument(
 		"--history-path",
 		default=".agent/history.jsonl",
@@ -24,13 +30,33 @@ def main() -> None:
 		action="store_true",
 		help="Disable automatic plan generation for complex tasks",
 	)
+	parser.add_argument(
+		"--stream",
+		action="store_true",
+		help="Print assistant text as it is generated instead of waiting for the full reply",
+	)
+	parser.add_argument(
+		"--speculate",
+		action="store_true",
+		help="Send the first request while planning runs (faster replies, extra tokens when a plan is made)",
+	)
+	parser.add_argument(
+		"--endpoint",
+		choices=["responses", "chat_completions"],
+		default=None,
+		help="OpenAI API to call (otherwise uses OPENAI_ENDPOINT, default: responses)",
+	)
 	args = parser.parse_args()
 
 	agent_cfg = AgentConfig(
 		model=args.model,
 		max_tool_rounds=args.max_tool_rounds,
+		tool_concurrency=args.tool_concurrency,
 		debug=args.debug,
 		enable_planning=not args.no_plan,
+		stream=args.stream,
+		speculative_first_round=args.speculate,
+		endpoint=args.endpoint,
 	)
 	run_repl(agent_config=agent_cfg, history_path=args.history_path)
 
@@ -1,17 +1,29 @@
 from __future__ import annotations
 
-import json
+import hashlib
+import os
+import platform
+import sqlite3
+import sys
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
-from typing import Any, Callable
+from typing import Any, Final, Literal
 
+from .context import SUMMARY_HEADER, ContextManager
 from .history import HistoryStore
+from .jsonutil import dumps, dumps_pretty, iterdumps
+from .llm_cache import LLMCache
 from .llm_openai_compat import OpenAICompatClient
+from .planning import Plan, PlanCache, PlanStep, adapt_plan, generate_plan
+from .similarity import dedupe_similar
 from .tools import ToolRegistry
-from .ui_layer import get_theme, load_ui_config, render_markdown, supports_color, render_plan_banner
-from .planning import Plan, PlanStep, generate_plan
+from .ui_layer import get_theme, load_ui_config, render_markdown, render_plan_banner, supports_color
 
-
-DEFAULT_SYSTEM_PROMPT = """You are a small, careful coding assistant running in a local CLI with tool access.
+# Keep this byte-identical across sessions: it is the cacheable prefix of every request.
+# Per-session details belong in `_session_context_message`, never in here.
+DEFAULT_SYSTEM_PROMPT: Final[str] = """You are a small, careful coding assistant running in a local CLI with tool access.
 
 Your job:
 - Understand the user's request, gather only the context you need, then implement a correct, minimal change.
@@ -41,7 +53,7 @@ Response style:
 - Keep answers concise and actionable.
 """
 
-FINALIZE_PROMPT = """You are finalizing the response after executing a multi-step plan.
+FINALIZE_PROMPT: Final[str] = """You are finalizing the response after executing a multi-step plan.
 
 Given:
 - The original user request
@@ -57,45 +69,184 @@ Rules:
 - If no meaningful work was done, say that.
 """
 
+SUMMARY_PROMPT: Final[str] = """You compress the earlier part of a coding-assistant conversation.
+
+Write a short summary that lets the assistant continue the work without the original messages.
+Keep: the user's goals and constraints, decisions made, files and commands touched, key tool results, open issues.
+Drop: pleasantries, raw tool output that is no longer needed, repeated content.
+Reply with the summary only.
+"""
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class AgentConfig:
 	model: str | None = None
 	max_tool_rounds: int = 8
 	debug: bool = False
 	enable_planning: bool = True
+	# Max worker threads for a batch of read-only tool calls (1 = always sequential).
+	tool_concurrency: int = 4
+	# Stream assistant text to `on_text_delta` as it is generated.
+	stream: bool = False
+	# After the first round, send only new messages and reference the rest by
+	# `previous_response_id` (needs a backend that stores responses).
+	chain_responses: bool = False
+	# Summarize older messages once the conversation grows past this (0 = never).
+	max_context_messages: int = 64
+	# Reuse responses for repeated planning/finalize prompts; set a directory to persist them.
+	llm_cache: bool = True
+	llm_cache_dir: str | None = None
+	# Reuse completed plans for similar requests (the LLM adapts the old steps).
+	plan_cache_enabled: bool = False
+	plan_cache_path: str = ".agent/plan_cache.sqlite"
+	plan_cache_threshold: float = 0.9
+	# Cap each step output sent to the plan summary (0 = no cap).
+	max_intermediate_chars: int = 4000
+	# Send the first round while the planning call is in flight; if no plan is
+	# needed its reply is used as-is, otherwise it is discarded (costs tokens).
+	speculative_first_round: bool = False
+	# Let a local keyword model rule out planning before asking the LLM.
+	local_plan_classifier: bool = False
+	# OpenAI API flavor: "responses" or "chat_completions" (None = OPENAI_ENDPOINT, else "responses").
+	endpoint: Literal["responses", "chat_completions"] | None = None
 
 
 class Agent:
-	def __init__(self, history: HistoryStore, config: AgentConfig | None = None, ui_callback: Callable[[str], None] | None = None) -> None:
+	# Fixed attribute set (no per-instance __dict__). Every attribute assigned
+	# anywhere in the class must be listed here; subclasses that add their own
+	# attributes should declare `__slots__` as well, or drop back to a __dict__.
+	__slots__ = (
+		"_context",
+		"_debug_enabled",
+		"_debug_label_cache",
+		"_debug_label_styles",
+		"_debug_prefixes",
+		"_debug_printed_upto",
+		"_debug_role_labels",
+		"_debug_round_idx",
+		"_debug_theme",
+		"_last_response_id",
+		"_llm_cache",
+		"_plan_cache",
+		"_plan_in_context",
+		"_plan_intermediate_outputs",
+		"_prefix_hash",
+		"_prefix_len",
+		"_preview_cache",
+		"_sent_upto",
+		"_speculation_pool",
+		"_tool_names",
+		"_tool_names_csv",
+		"_tool_pool",
+		"_tool_schemas",
+		"client",
+		"config",
+		"current_plan",
+		"history",
+		"last_response_streamed",
+		"messages",
+		"on_text_delta",
+		"tools",
+		"ui_callback",
+		"usage",
+	)
+
+	def __init__(
+		self,
+		history: HistoryStore,
+		config: AgentConfig | None = None,
+		ui_callback: Callable[[str], None] | None = None,
+		on_text_delta: Callable[[str], None] | None = None,
+	) -> None:
 		self.history = history
 		self.config = config or AgentConfig()
 		self.tools = ToolRegistry()
-		self.client = OpenAICompatClient(model=self.config.model)
+		self._refresh_tool_schemas()
+		self.client = OpenAICompatClient(model=self.config.model, endpoint=self.config.endpoint)
+		self._llm_cache = LLMCache(directory=self.config.llm_cache_dir) if self.config.llm_cache else None
+		self._plan_cache = PlanCache(self.config.plan_cache_path) if self.config.plan_cache_enabled else None
+		# Read once: the chat loop checks this several times per tool call.
+		self._debug_enabled = self.config.debug
 		self._debug_theme = None
+		# Filled in by `_precompute_debug_labels` once the theme is resolved.
+		self._debug_role_labels: dict[str, str] = {}
+		self._debug_prefixes = ("[debug]", "[debug]")
+		self._debug_label_cache: dict[tuple[str, str], str] = {}
+		self._debug_label_styles: dict[str, Callable[[str], str]] = {}
 		self._debug_round_idx = 0
+		self._tool_pool: ThreadPoolExecutor | None = None
+		self._speculation_pool: ThreadPoolExecutor | None = None
+		self._context = ContextManager()
 		self.current_plan: Plan | None = None
+		# The plan whose header message has been appended to `self.messages`.
+		self._plan_in_context: Plan | None = None
 		self._plan_intermediate_outputs: list[dict[str, Any]] = []
 		self.ui_callback = ui_callback  # For updating banner
+		self.on_text_delta = on_text_delta  # Receives streamed assistant text (config.stream)
+		# True when the text returned by the last `chat` call was already streamed out.
+		self.last_response_streamed = False
+		# Running token totals reported by the backend (see `_record_usage`).
+		self.usage: dict[str, int] = {}
 		self.reset()
 
+	def _refresh_tool_schemas(self) -> None:
+		"""Snapshot the registry's schemas; tools are registered once, so this runs at init.
+
+		Call again after changing the registry's tools (and invalidating its cache).
+		"""
+		self._tool_schemas = self.tools.tool_schemas()
+		self._tool_names: list[str] = []
+		for item in self._tool_schemas:
+			name = ((item or {}).get("function") or {}).get("name")
+			if name:
+				self._tool_names.append(name)
+		self._tool_names_csv = ", ".join(self._tool_names)
+
 	def _finalize_plan_response(self, *, original_request: str, plan: Plan, intermediate_outputs: list[dict[str, Any]]) -> str:
 		"""Ask the LLM to produce a final user-facing summary of the plan execution."""
 		steps = [s.description for s in plan.steps]
+		limit = self.config.max_intermediate_chars
+		texts = (o.get("text") for o in intermediate_outputs)
+		# Later steps often restate earlier findings; send each finding once.
+		outputs = dedupe_similar([self._truncate(t, limit) if limit else t for t in texts if t])
 		payload = {
 			"original_request": original_request,
 			"plan_steps": steps,
-			"intermediate_outputs": [o.get("text", "") for o in intermediate_outputs if o.get("text")],
+			"intermediate_outputs": outputs,
 		}
-		resp = self.client.chat(
-			messages=[
-				{"role": "system", "content": FINALIZE_PROMPT},
-				{"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-			],
-			tools=None,
-		)
+		messages = [
+			self._system_message(FINALIZE_PROMPT),
+			{"role": "user", "content": dumps(payload)},
+		]
+		if self._llm_cache is not None:
+			key = self._llm_cache.make_key(self.client.model, messages, None)
+			resp = self._llm_cache.get_or_compute(key, lambda: self.client.chat(messages=messages, tools=None))
+			self._debug_print_cache_stats()
+		else:
+			resp = self.client.chat(messages=messages, tools=None)
+		self._record_usage(resp.get("usage"))
 		return (resp.get("message") or {}).get("content") or ""
 
+	def _debug_print_cache_stats(self) -> None:
+		if self._debug_enabled and self._llm_cache is not None:
+			stats = f"hits={self._llm_cache.hits} misses={self._llm_cache.misses}"
+			print(f"{self._debug_prefix()} {self._debug_label('llm cache', kind='dim')}: {stats}")
+
+	def _system_message(self, text: str) -> dict[str, Any]:
+		"""System message for static text, tagged as a cache breakpoint when the client supports it."""
+		if self.client.supports_cache_control():
+			return {"role": "system", "content": [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]}
+		return {"role": "system", "content": text}
+
+	def _record_usage(self, usage: dict[str, int] | None) -> None:
+		if not usage:
+			return
+		for key, value in usage.items():
+			self.usage[key] = self.usage.get(key, 0) + value
+		if self._debug_enabled:
+			parts = ", ".join(f"{k}={v}" for k, v in usage.items())
+			print(f"{self._debug_prefix()} {self._debug_label('usage', kind='dim')}: {parts}")
+
 	def _debug_render_md(self, text: str) -> str:
 		"""Render markdown in debug logs when color is available."""
 		theme = self._get_debug_theme()
@@ -111,51 +262,90 @@ class Agent:
 			return self._debug_theme
 		if not supports_color():
 			self._debug_theme = False
-			return self._debug_theme
-		cfg = load_ui_config(".agent/ui.json")
-		self._debug_theme = get_theme(cfg.get("theme"))
+		else:
+			cfg = load_ui_config(".agent/ui.json")
+			self._debug_theme = get_theme(cfg.get("theme"))
+		self._precompute_debug_labels(self._debug_theme)
 		return self._debug_theme
 
+	def _precompute_debug_labels(self, theme) -> None:
+		"""Color the fixed debug vocabulary once instead of on every printed line."""
+		self._debug_label_cache.clear()
+		if not theme:
+			self._debug_role_labels = {}
+			self._debug_prefixes = ("[debug]", "[debug]")
+			self._debug_label_styles = {}
+			return
+		self._debug_label_styles = {"dim": theme.d, "accent": theme.a, "ok": theme.ok, "err": theme.err}
+		self._debug_role_labels = {
+			"system": theme.d("system"),
+			"developer": theme.d("developer"),
+			"user": theme.a("user"),
+			"assistant": theme.t("assistant"),
+			"tool": theme.ok("tool"),
+		}
+		# Index 1 is the orange variant used for user/assistant lines.
+		self._debug_prefixes = (theme.d("[debug]"), theme.a("[debug]"))
+
 	def _debug_prefix(self, role: str | None = None) -> str:
 		"""Color the [debug] tag by role; default gray, user/assistant orange."""
-		theme = self._get_debug_theme()
-		if theme and theme is not False:
-			if role in {"user", "assistant"}:
-				return theme.a("[debug]")
-			return theme.d("[debug]")
-		return "[debug]"
+		self._get_debug_theme()
+		return self._debug_prefixes[role == "user" or role == "assistant"]
 
 	def _debug_role(self, role: str | None) -> str:
 		theme = self._get_debug_theme()
 		label = str(role or "?")
-		if not (theme and theme is not False):
-			return label
-		if label in {"system", "developer"}:
-			return theme.d(label)
-		if label == "user":
-			return theme.a(label)
-		if label == "assistant":
-			return theme.t(label)
-		if label == "tool":
-			return theme.ok(label)
-		return theme.t(label)
+		colored = self._debug_role_labels.get(label)
+		if colored is not None:
+			return colored
+		return theme.t(label) if theme else label
 
 	def _debug_label(self, label: str, *, kind: str = "dim") -> str:
 		theme = self._get_debug_theme()
-		if not (theme and theme is not False):
+		if not theme:
 			return label
-		if kind == "accent":
-			return theme.a(label)
-		if kind == "ok":
-			return theme.ok(label)
-		if kind == "err":
-			return theme.err(label)
-		return theme.d(label)
+		key = (label, kind)
+		colored = self._debug_label_cache.get(key)
+		if colored is None:
+			colored = self._debug_label_styles.get(kind, theme.d)(label)
+			self._debug_label_cache[key] = colored
+		return colored
 
 	def reset(self) -> None:
 		self.messages: list[dict[str, Any]] = [
-			{"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
+			self._system_message(DEFAULT_SYSTEM_PROMPT),
+			self._session_context_message(),
 		]
+		# Leading messages that compaction never touches. They form the cacheable
+		# prefix of every request, so nothing may rewrite them after this point.
+		self._prefix_len = len(self.messages)
+		self._prefix_hash = self._hash_prefix()
+		# A plan belongs to the conversation it was made in; drop it with the context.
+		self.current_plan = None
+		self._plan_in_context = None
+		self._plan_intermediate_outputs = []
+		# Debug previews parallel to `self.messages` (see `_message_previews`).
+		self._preview_cache: list[str] = []
+		# Messages before this index were already shown by `_debug_print_request_summary`.
+		self._debug_printed_upto = 0
+		self._reset_response_chain()
+
+	def _reset_response_chain(self) -> None:
+		"""Forget the server-side conversation; the next request resends everything."""
+		# Id of the last stored response and how many of `self.messages` it covers.
+		self._last_response_id: str | None = None
+		self._sent_upto = 0
+
+	@staticmethod
+	def _session_context_message() -> dict[str, Any]:
+		"""Dynamic preamble, kept out of the system prompt so that prefix stays cacheable."""
+		lines = [
+			"Session context:",
+			f"- Working directory: {os.getcwd()}",
+			f"- Platform: {platform.system()} {platform.release()}".rstrip(),
+			f"- Date: {time.strftime('%Y-%m-%d')}",
+		]
+		return {"role": "system", "content": "\n".join(lines)}
 
 	def _heuristic_plan_steps(self, user_text: str) -> list[str]:
 		"""Deprecated: previously returned hard-coded plan steps.
@@ -164,13 +354,14 @@ class Agent:
 		"""
 		return []
 
-	def dump_context(self) -> str:
-		return json.dumps(self.messages, indent=2, ensure_ascii=False)
+	def dump_context(self, *, pretty: bool = True) -> str:
+		"""The conversation as JSON; `pretty=False` skips indentation for large dumps."""
+		return (dumps_pretty if pretty else dumps)(self.messages)
 
 	def dump_tools(self, *, as_json: bool = False) -> str:
-		schemas = self.tools.tool_schemas()
+		schemas = self._tool_schemas
 		if as_json:
-			return json.dumps(schemas, indent=2, ensure_ascii=False)
+			return dumps_pretty(schemas)
 		lines: list[str] = []
 		for item in schemas:
 			fn = (item or {}).get("function") or {}
@@ -187,7 +378,9 @@ class Agent:
 		This delegates to the planning module's should_plan function.
 		"""
 		from .planning.detector import should_plan as planning_should_plan
-		return planning_should_plan(self.client, user_text, self.config.enable_planning)
+		return planning_should_plan(
+			self.client, user_text, self.config.enable_planning, self._llm_cache, self.config.local_plan_classifier
+		)
 
 
 	def _generate_plan(self, user_text: str) -> Plan | None:
@@ -195,16 +388,60 @@ class Agent:
 		
 		This delegates to the planning module's generate_plan function.
 		"""
-		return generate_plan(self.client, user_text, self.config.enable_planning)
+		if self._plan_cache is not None and self.config.enable_planning:
+			try:
+				hit = self._plan_cache.lookup(user_text, self.config.plan_cache_threshold)
+			except sqlite3.Error:
+				hit = None
+			if hit is not None:
+				prev_goal, prev_steps, _score = hit
+				plan = adapt_plan(self.client, user_text, prev_goal, prev_steps)
+				if plan is not None:
+					return plan
+		plan = generate_plan(
+			self.client, user_text, self.config.enable_planning, self._llm_cache, self.config.local_plan_classifier
+		)
+		self._debug_print_cache_stats()
+		return plan
+
+	def _remember_plan(self, plan: Plan, original_request: str) -> None:
+		"""Store a completed plan so similar requests can start from it."""
+		if self._plan_cache is None:
+			return
+		try:
+			self._plan_cache.record_success(plan.goal or original_request, [s.description for s in plan.steps])
+		except sqlite3.Error:
+			pass
 
 	def chat(self, user_text: str, *, auto_approve_plan: bool = False) -> str:
+		# History events are buffered and written once per turn instead of per event.
+		self.history.begin_batch()
+		try:
+			return self._chat(user_text, auto_approve_plan=auto_approve_plan)
+		finally:
+			self.history.end_batch()
+
+	def _chat(self, user_text: str, *, auto_approve_plan: bool) -> str:
+		self.last_response_streamed = False
 		self.history.append_event({"type": "user", "text": user_text})
 		original_request = user_text
 		
+		speculative: Future[dict[str, Any]] | None = None
 		# Check if we need a plan
 		if self.config.enable_planning and not self.current_plan:
-			plan = self._generate_plan(user_text)
+			if self.config.speculative_first_round:
+				speculative = self._start_speculative_round(user_text)
+			try:
+				plan = self._generate_plan(user_text)
+			except BaseException:
+				if speculative is not None:
+					self._discard_speculative(speculative)
+				raise
 			if plan:
+				# The speculative reply answered the unplanned request.
+				if speculative is not None:
+					self._discard_speculative(speculative)
+					speculative = None
 				self.current_plan = plan
 				self._plan_intermediate_outputs = []
 				# Return plan for approval (caller will handle display)
@@ -213,34 +450,50 @@ class Agent:
 				else:
 					self.current_plan.approved = True
 		
+		if self.current_plan is not None and self._plan_in_context is not self.current_plan:
+			# Appended once and never edited, so earlier turns stay a byte-stable prefix.
+			self.messages.append(self._plan_header_message(self.current_plan))
+			self._plan_in_context = self.current_plan
 		self.messages.append({"role": "user", "content": user_text})
 
 		for _round in range(self.config.max_tool_rounds):
-			if self.config.debug:
+			self._maybe_compact()
+			if self._debug_enabled:
 				self._debug_print_round_header(_round)
+				self._debug_check_prefix()
 				self._debug_print_request_summary(round_idx=_round)
 
-			resp = self.client.chat(
-				messages=self.messages,
-				tools=self.tools.tool_schemas(),
-			)
+			streamed = self.config.stream and self.on_text_delta is not None
+			if speculative is not None:
+				resp = speculative.result()
+				speculative = None
+			else:
+				resp = self._request_round(stream=streamed)
 
-			if self.config.debug:
+			if self._debug_enabled:
 				self.history.append_event({"type": "debug", "llm_raw": resp})
 				self._debug_print_response_summary(resp.get("message") or {})
+			self._record_usage(resp.get("usage"))
 
 			assistant_msg = resp["message"]
 			self.messages.append(assistant_msg)
+			if self.config.chain_responses:
+				response_id = (resp.get("raw") or {}).get("id")
+				self._last_response_id = response_id if isinstance(response_id, str) else None
+				self._sent_upto = len(self.messages)
 
-			tool_calls = assistant_msg.get("tool_calls") or []
+			tool_calls = assistant_msg.get("tool_calls")
 			if not tool_calls:
 				text = assistant_msg.get("content") or ""
 				self.history.append_event({"type": "assistant", "text": text})
-				if self.current_plan:
-					self._plan_intermediate_outputs.append({"step_idx": self.current_plan.current_step_idx, "text": text})
-				
+				# Common case: a plain answer with no plan in progress.
+				if self.current_plan is None:
+					self.last_response_streamed = streamed
+					return text
+				self._plan_intermediate_outputs.append({"step_idx": self.current_plan.current_step_idx, "text": text})
+
 				# Mark current plan step as complete
-				if self.current_plan and not self.current_plan.is_complete():
+				if not self.current_plan.is_complete():
 					self.current_plan.mark_current_complete()
 					if self.ui_callback:
 						self.ui_callback("plan_updated")
@@ -256,6 +509,7 @@ class Agent:
 						intermediate = list(self._plan_intermediate_outputs)
 						self.current_plan = None
 						self._plan_intermediate_outputs = []
+						self._remember_plan(completed_plan, original_request)
 						try:
 							final = self._finalize_plan_response(
 								original_request=original_request,
@@ -268,41 +522,41 @@ class Agent:
 						except Exception:
 							pass
 
+				self.last_response_streamed = streamed
 				return text
 
 			# Execute tool calls and feed tool results back.
+			calls: list[tuple[str, dict[str, Any]]] = []
 			for call in tool_calls:
 				tool_name = call["function"]["name"]
-				args_json = call["function"].get("arguments") or "{}"
-				try:
-					args = json.loads(args_json)
-				except json.JSONDecodeError:
-					args = {"_raw": args_json}
+				raw_args = call["function"].get("arguments")
+				# Some OpenAI-compatible servers (Ollama, vLLM, llama.cpp) send arguments as an
+				# object rather than a JSON string; the registry uses those as-is.
+				args = self.tools.decode_arguments(tool_name, raw_args)
 
-				if self.config.debug:
+				if self._debug_enabled:
+					args_json = raw_args if isinstance(raw_args, str) and raw_args else dumps(args)
 					print(
-						self._debug_prefix()
-						+ " "
-						+ self._debug_label("tool_call", kind="ok")
-						+ ": "
-						+ self._debug_label(tool_name, kind="accent")
-						+ f" args={args_json}"
+						f"{self._debug_prefix()} {self._debug_label('tool_call', kind='ok')}: "
+						f"{self._debug_label(tool_name, kind='accent')} args={args_json}"
 					)
 
 				self.history.append_event({"type": "tool_call", "name": tool_name, "args": args})
-				result = self.tools.execute(tool_name, args)
-				self.history.append_event({"type": "tool_result", "name": tool_name, "result": result})
-				if self.config.debug:
-					preview = self._truncate(json.dumps(result, ensure_ascii=False), 2000)
-					md_preview = self._debug_render_md("```\n" + preview + "\n```")
+				calls.append((tool_name, args))
+
+			results = self._execute_tool_calls(calls)
+
+			for call, (tool_name, _args), result in zip(tool_calls, calls, results):
+				# Serialize once: the same JSON feeds the history record, the tool message
+				# and the debug preview.
+				result_json = dumps(result)
+				self.history.append_event({"type": "tool_result", "name": tool_name}, encoded={"result": result_json})
+				if self._debug_enabled:
+					preview = self._truncate(result_json, 2000)
+					md_preview = self._debug_render_md(f"```\n{preview}\n```")
 					print(
-						self._debug_prefix()
-						+ " "
-						+ self._debug_label("tool_result", kind="ok")
-						+ ": "
-						+ self._debug_label(tool_name, kind="accent")
-						+ "\n"
-						+ md_preview
+						f"{self._debug_prefix()} {self._debug_label('tool_result', kind='ok')}: "
+						f"{self._debug_label(tool_name, kind='accent')}\n{md_preview}"
 					)
 
 				self.messages.append(
@@ -310,7 +564,7 @@ class Agent:
 						"role": "tool",
 						"tool_call_id": call["id"],
 						"name": tool_name,
-						"content": json.dumps(result, ensure_ascii=False),
+						"content": result_json,
 					}
 				)
 
@@ -319,12 +573,197 @@ class Agent:
 		self.history.append_event({"type": "assistant", "text": text})
 		return text
 
+	@staticmethod
+	def _plan_header_message(plan: Plan) -> dict[str, Any]:
+		lines = ["Approved plan:"]
+		lines.extend(f"{i}. {step.description}" for i, step in enumerate(plan.steps, start=1))
+		lines.append("Work through the steps in order; you will be prompted when to start each next step.")
+		return {"role": "system", "content": "\n".join(lines)}
+
+	def _plan_header_index(self) -> int | None:
+		"""Position of the active plan's header in `messages`, if it is there."""
+		if self.current_plan is None or self._plan_in_context is not self.current_plan:
+			return None
+		for i in range(len(self.messages) - 1, self._prefix_len - 1, -1):
+			m = self.messages[i]
+			if m.get("role") == "system" and str(m.get("content", "")).startswith("Approved plan:"):
+				return i
+		return None
+
+	def _hash_prefix(self) -> str:
+		"""Fingerprint of what providers prefix-cache: the tool block plus the leading messages."""
+		h = hashlib.sha256(self.tools.tool_schemas_json().encode("utf-8"))
+		h.update(dumps(self.messages[: self._prefix_len]).encode("utf-8"))
+		return h.hexdigest()
+
+	def _debug_check_prefix(self) -> None:
+		"""Warn if the cacheable prefix changed since `reset` (it would defeat prompt caching)."""
+		if self._hash_prefix() != self._prefix_hash:
+			print(f"{self._debug_prefix()} {self._debug_label('warning', kind='err')}: stable message prefix was modified")
+
+	def _maybe_compact(self) -> None:
+		"""Fold older messages into one summary once `max_context_messages` is exceeded.
+
+		The system prompt and session context stay as they are, followed by a single
+		"Prior context summary" message and the most recent half of the window. The
+		tail never starts with a tool result, so every tool output keeps the
+		assistant message that requested it. While a plan is active, everything up
+		to and including its header is kept, so the plan is never summarized away.
+		"""
+		limit = self.config.max_context_messages
+		if limit <= 0 or len(self.messages) <= limit:
+			return
+		keep_head = self._prefix_len
+		header_idx = self._plan_header_index()
+		if header_idx is not None:
+			keep_head = header_idx + 1
+		compacted = self._context.compact(
+			self.messages,
+			keep_head=keep_head,
+			keep_tail=limit // 2,
+			summarize=self._summarize_messages,
+			header=SUMMARY_HEADER,
+		)
+		if compacted is None:
+			return
+
+		folded = len(self.messages) - len(compacted) + 1
+		self.messages = compacted
+		self._preview_cache.clear()
+		self._debug_printed_upto = 0
+		# The server-side conversation no longer matches what we hold locally.
+		self._reset_response_chain()
+		self.history.append_event({"type": "context_compacted", "messages": folded})
+		if self._debug_enabled:
+			print(f"{self._debug_prefix()} {self._debug_label('context compacted', kind='accent')}: {folded} messages summarized")
+
+	def _summarize_messages(self, messages: list[dict[str, Any]]) -> str:
+		"""Summarize `messages` with one LLM call; fall back to a plain note on failure."""
+		lines: list[str] = []
+		for m in messages:
+			role = m.get("role") or "?"
+			content = m.get("content")
+			if content:
+				text = content if isinstance(content, str) else dumps(content)
+				lines.append(f"{role}: {self._truncate(text, 2000)}")
+			for call in m.get("tool_calls") or []:
+				fn = call.get("function") or {}
+				args = fn.get("arguments")
+				args_s = args if isinstance(args, str) else dumps(args or {})
+				lines.append(f"{role} called {fn.get('name', '?')}: {self._truncate(args_s, 500)}")
+		try:
+			resp = self.client.chat(
+				messages=[
+					{"role": "system", "content": SUMMARY_PROMPT},
+					{"role": "user", "content": "\n".join(lines)},
+				],
+				tools=None,
+			)
+			summary = ((resp.get("message") or {}).get("content") or "").strip()
+		except Exception:
+			summary = ""
+		return summary or f"({len(messages)} earlier messages omitted)"
+
+	def _start_speculative_round(self, user_text: str) -> Future[dict[str, Any]] | None:
+		"""Start round 0 for `user_text` in the background, or return None if it can't be predicted.
+
+		The request must match what the loop would send without a plan: compaction
+		runs first, and streamed or chained rounds are never speculated (text would
+		reach the user before planning decides, and the chain cursor would move).
+		"""
+		if (self.config.stream and self.on_text_delta is not None) or self.config.chain_responses:
+			return None
+		self._maybe_compact()
+		messages = [*self.messages, {"role": "user", "content": user_text}]
+		if self._speculation_pool is None:
+			self._speculation_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="agent-speculate")
+		return self._speculation_pool.submit(self._send, messages, stream=False)
+
+	def _discard_speculative(self, future: Future[dict[str, Any]]) -> None:
+		"""Abandon a speculative round: cancel it if it hasn't started, else drop its reply when it lands."""
+		if future.cancel():
+			return
+
+		def drain(f: Future[dict[str, Any]]) -> None:
+			# Retrieve the outcome so a failure is observed instead of silently lost.
+			err = f.exception()
+			if err is not None and self._debug_enabled:
+				print(f"{self._debug_prefix()} {self._debug_label('speculative round failed', kind='err')}: {err}")
+
+		future.add_done_callback(drain)
+
+	def _request_round(self, *, stream: bool) -> dict[str, Any]:
+		"""Send the current messages to the LLM, optionally streaming text as it arrives.
+
+		With `chain_responses`, only the messages appended since the last response
+		are sent. If the backend rejects the continuation (unsupported, or the stored
+		response expired), the chain is dropped and the full history is resent.
+		"""
+		prev_id = self._last_response_id if self.config.chain_responses else None
+		if prev_id is not None and self._sent_upto <= len(self.messages):
+			delta = self.messages[self._sent_upto :]
+			try:
+				return self._send(delta, stream=stream, previous_response_id=prev_id)
+			except RuntimeError as e:
+				if self._debug_enabled:
+					print(f"{self._debug_prefix()} {self._debug_label('response chain dropped', kind='err')}: {e}")
+				self._reset_response_chain()
+		return self._send(self.messages, stream=stream)
+
+	def _send(self, messages: list[dict[str, Any]], *, stream: bool, previous_response_id: str | None = None) -> dict[str, Any]:
+		tools = self._tool_schemas
+		if not stream:
+			if previous_response_id is not None:
+				return self.client.chat_with_prev(messages, tools, previous_response_id=previous_response_id)
+			return self.client.chat(messages=messages, tools=tools)
+
+		assert self.on_text_delta is not None
+		extra: dict[str, Any] = {}
+		if previous_response_id is not None:
+			extra["previous_response_id"] = previous_response_id
+		resp: dict[str, Any] | None = None
+		for event in self.client.chat_stream(messages=messages, tools=tools, **extra):
+			if event.get("type") == "text_delta":
+				self.on_text_delta(event["text"])
+			elif event.get("type") == "done":
+				resp = {"message": event["message"], "raw": event.get("raw"), "usage": event.get("usage")}
+		if resp is None:
+			raise RuntimeError("LLM stream ended without a final message")
+		return resp
+
+	def _execute_tool_calls(self, calls: list[tuple[str, dict[str, Any]]]) -> list[dict[str, Any]]:
+		"""Run one round of tool calls and return their results in call order.
+
+		Batches made up only of read-only tools are dispatched to a thread pool when
+		`tool_concurrency > 1`; anything that writes files or drives the shell runs
+		sequentially so side effects happen in the order the model asked for.
+		"""
+		workers = self.config.tool_concurrency
+		if workers <= 1 or len(calls) < 2 or not all(self.tools.is_read_only(name) for name, _ in calls):
+			return [self.tools.execute(name, args) for name, args in calls]
+
+		if self._tool_pool is None:
+			self._tool_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-tool")
+		futures = [self._tool_pool.submit(self.tools.execute, name, args) for name, args in calls]
+		wait(futures)
+		# One failing call must not take down the batch: report it like any other tool error.
+		results: list[dict[str, Any]] = []
+		for fut in futures:
+			try:
+				results.append(fut.result())
+			except Exception as e:
+				results.append({"ok": False, "error": str(e)})
+		return results
+
 	def _debug_print_round_header(self, round_idx: int) -> None:
 		self._debug_round_idx = round_idx
 		head = f"===== round {round_idx + 1}/{self.config.max_tool_rounds} ====="
-		print("\n" + self._debug_prefix() + " " + self._debug_label(head, kind="accent"))
+		print(f"\n{self._debug_prefix()} {self._debug_label(head, kind='accent')}")
 
 	def _debug_print_request_summary(self, *, round_idx: int) -> None:
+		if not self._debug_enabled:
+			return
+
 		# Default: print the full request/tools/messages summary only once (round 0).
 		# Subsequent rounds tend to be iterative tool calls, so re-printing the full
 		# message list is noisy. When executing a multi-step plan, we still print the
@@ -342,36 +781,46 @@ class Agent:
 				content = last.get("content")
 				if isinstance(content, str) and content.startswith("Continue with next step:"):
 					step_desc = content.split(":", 1)[1].strip() if ":" in content else content
-					print(
-						self._debug_prefix()
-						+ " "
-						+ self._debug_label("step", kind="accent")
-						+ ": "
-						+ self._truncate(step_desc, 200)
-					)
+					print(f"{self._debug_prefix()} {self._debug_label('step', kind='accent')}: {self._truncate(step_desc, 200)}")
 					return
 
-		tool_names = []
-		for item in self.tools.tool_schemas():
-			fn = (item or {}).get("function") or {}
-			name = fn.get("name")
-			if name:
-				tool_names.append(name)
-		print(self._debug_prefix() + " " + self._debug_label("tools", kind="dim") + ": " + ", ".join(tool_names))
-		print(self._debug_prefix() + " " + self._debug_label("messages", kind="dim") + f": {len(self.messages)}")
-		# Print a compact view of messages (role + preview)
-		for idx, m in enumerate(self.messages[-12:], start=max(0, len(self.messages) - 12)):
-			role = m.get("role")
+		prefix = self._debug_prefix()
+		lines = [
+			f"{prefix} {self._debug_label('tools', kind='dim')}: {self._tool_names_csv}",
+			f"{prefix} {self._debug_label('messages', kind='dim')}: {len(self.messages)}",
+		]
+		# Print a compact view of messages (role + preview), skipping ones already shown.
+		previews = self._message_previews()
+		start = max(self._debug_printed_upto, len(self.messages) - 12)
+		self._debug_printed_upto = len(self.messages)
+		# The theme is settled above; read the precomputed labels directly in the loop.
+		prefixes, role_labels = self._debug_prefixes, self._debug_role_labels
+		for idx in range(start, len(self.messages)):
+			role = self.messages[idx].get("role")
+			role_s = role_labels.get(role) if isinstance(role, str) else None
+			if role_s is None:
+				role_s = self._debug_role(role)
+			lines.append(f"{prefixes[role == 'user' or role == 'assistant']}   {idx}: {role_s}{previews[idx]}")
+		# One write for the whole block instead of a print per line.
+		lines.append("")
+		sys.stdout.write("\n".join(lines))
+		sys.stdout.flush()
+
+	def _message_previews(self) -> list[str]:
+		"""Debug preview per message, formatted once and extended as messages are appended."""
+		cache = self._preview_cache
+		if len(cache) > len(self.messages):
+			cache.clear()
+		for m in self.messages[len(cache) :]:
 			content = m.get("content")
 			name = m.get("name")
 			if isinstance(content, str):
 				preview = self._truncate(content.replace("\n", "\\n"), 200)
 			else:
-				preview = self._truncate(json.dumps(content, ensure_ascii=False), 200)
+				preview = self._json_preview(content, 200)
 			suffix = f" name={name}" if name else ""
-			role_s = self._debug_role(role)
-			line = f"  {idx}: {role_s}{suffix}: {preview}"
-			print(self._debug_prefix(role) + " " + line)
+			cache.append(f"{suffix}: {preview}")
+		return cache
 
 	def _debug_print_response_summary(self, assistant_msg: dict[str, Any]) -> None:
 		content = assistant_msg.get("content")
@@ -383,16 +832,21 @@ class Agent:
 		tool_calls = assistant_msg.get("tool_calls") or []
 		if tool_calls:
 			names = [c.get("function", {}).get("name", "?") for c in tool_calls]
-			print(
-				self._debug_prefix()
-				+ " "
-				+ self._debug_label("assistant requested tools", kind="ok")
-				+ ": "
-				+ ", ".join(names)
-			)
+			print(f"{self._debug_prefix()} {self._debug_label('assistant requested tools', kind='ok')}: {', '.join(names)}")
 
 	@staticmethod
 	def _truncate(s: str, n: int) -> str:
-		if len(s) <= n:
-			return s
-		return s[: n - 3] + "..."
+		return s if len(s) <= n else f"{s[: n - 3]}..."
+
+	@staticmethod
+	def _json_preview(value: Any, n: int) -> str:
+		"""JSON-encode `value` for a preview, stopping once more than `n` chars are produced."""
+		parts: list[str] = []
+		size = 0
+		# iterencode yields incrementally, so the preview can stop early.
+		for chunk in iterdumps(value):
+			parts.append(chunk)
+			size += len(chunk)
+			if size > n:
+				break
+		return Agent._truncate("".join(parts), n)
@@ -1,5 +1,5 @@
 """Context management module for handling, organizing, and compressing long context."""
 
-from .manager import ContextManager
+from .manager import SUMMARY_HEADER, ContextManager
 
-__all__ = ["ContextManager"]
+__all__ = ["ContextManager", "SUMMARY_HEADER"]
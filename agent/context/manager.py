@@ -2,9 +2,20 @@
 
 from __future__ import annotations
 
+import hashlib
+from collections.abc import Callable
 from dataclasses import dataclass, field
 from typing import Any
 
+from ..jsonutil import dumps_canonical
+
+SUMMARY_HEADER = "Prior context summary:"
+
+
+def estimate_tokens(text: str) -> int:
+	"""Rough token count: about four characters per token, rounded up."""
+	return (len(text) + 3) >> 2
+
 
 @dataclass
 class ContextMessage:
@@ -12,6 +23,28 @@ class ContextMessage:
 	role: str
 	content: str
 	metadata: dict[str, Any] = field(default_factory=dict)
+	# Cached estimate and export; call `invalidate()` after changing the message.
+	token_count: int | None = field(default=None, repr=False, compare=False)
+	_export: dict[str, Any] | None = field(default=None, init=False, repr=False, compare=False)
+
+	def tokens(self) -> int:
+		if self.token_count is None:
+			self.token_count = estimate_tokens(self.content)
+		return self.token_count
+
+	def to_dict(self) -> dict[str, Any]:
+		"""Chat-format dict for this message; cached, so treat it as read-only."""
+		if self._export is None:
+			self._export = {"role": self.role, "content": self.content, **self.metadata}
+		return self._export
+
+	def invalidate(self) -> None:
+		"""Drop cached values after `content` or `metadata` was edited in place.
+
+		Follow with `ContextManager.recount_tokens()` if the content changed.
+		"""
+		self.token_count = None
+		self._export = None
 
 
 @dataclass
@@ -21,32 +54,62 @@ class ContextManager:
 	messages: list[ContextMessage] = field(default_factory=list)
 	max_context_tokens: int = 100000
 	compression_threshold: int = 80000
+	max_cached_summaries: int = 32
+	# Messages kept verbatim (after the first) when `compress_context` fires.
+	keep_recent: int = 10
+	# Folds the dropped middle into one summary text; without it (or if it
+	# raises) compression falls back to a plain sliding window.
+	summarizer: Callable[[list[ContextMessage]], str] | None = None
+	# Summaries produced by `compact`, keyed by a hash of the folded slice.
+	_summaries: dict[str, str] = field(default_factory=dict, init=False, repr=False)
+	# Running sum of `ContextMessage.tokens()` over `messages`.
+	_total_tokens: int = field(default=0, init=False, repr=False)
+
+	def __post_init__(self) -> None:
+		self._total_tokens = sum(msg.tokens() for msg in self.messages)
 	
 	def add_message(self, role: str, content: str, metadata: dict[str, Any] | None = None) -> None:
 		"""Add a message to context."""
 		msg = ContextMessage(role=role, content=content, metadata=metadata or {})
 		self.messages.append(msg)
+		self._total_tokens += msg.tokens()
 	
 	def get_context_size(self) -> int:
 		"""Estimate context size in tokens (rough approximation)."""
-		total = 0
-		for msg in self.messages:
-			total += len(msg.content.split())  # Rough token count
-		return total
+		return self._total_tokens
+
+	def recount_tokens(self) -> int:
+		"""Recompute the running total after `messages` was edited directly."""
+		self._total_tokens = sum(msg.tokens() for msg in self.messages)
+		return self._total_tokens
 	
 	def should_compress(self) -> bool:
 		"""Check if context should be compressed."""
-		return self.get_context_size() > self.compression_threshold
+		return self._total_tokens > self.compression_threshold
 	
 	def compress_context(self) -> list[ContextMessage]:
-		"""Compress older messages while keeping recent ones."""
-		# Keep system message and last N messages
-		if len(self.messages) <= 10:
+		"""Compress older messages while keeping recent ones.
+
+		Keeps the first (system) message and the last `keep_recent`. Everything in
+		between becomes one summary message when a `summarizer` is set, and is
+		dropped otherwise.
+		"""
+		keep = max(1, self.keep_recent)
+		if len(self.messages) <= keep + 1:
 			return self.messages
-		
-		# Keep first (system) and last 10
-		compressed = [self.messages[0]] + self.messages[-10:]
+
+		head, middle, tail = self.messages[0], self.messages[1:-keep], self.messages[-keep:]
+		compressed = [head, *tail]
+		if self.summarizer is not None:
+			try:
+				summary = self.summarizer(middle)
+			except Exception:
+				summary = ""
+			if summary:
+				note = ContextMessage(role="system", content=f"{SUMMARY_HEADER}\n{summary}", metadata={"summary": True})
+				compressed = [head, note, *tail]
 		self.messages = compressed
+		self.recount_tokens()
 		return compressed
 	
 	def retrieve_recent(self, n: int = 20) -> list[ContextMessage]:
@@ -55,7 +118,37 @@ class ContextManager:
 	
 	def dump(self) -> list[dict[str, Any]]:
 		"""Export context as list of dicts."""
-		return [
-			{"role": msg.role, "content": msg.content, **msg.metadata}
-			for msg in self.messages
-		]
+		return [msg.to_dict() for msg in self.messages]
+
+	def compact(
+		self,
+		messages: list[dict[str, Any]],
+		*,
+		keep_head: int = 2,
+		keep_tail: int = 10,
+		summarize: Callable[[list[dict[str, Any]]], str],
+		header: str = SUMMARY_HEADER,
+	) -> list[dict[str, Any]] | None:
+		"""Fold the middle of a chat-format message list into one summary message.
+
+		Keeps the first `keep_head` messages and (at least) the last `keep_tail`;
+		the tail is widened so it never starts with a tool result, keeping every
+		tool output paired with the assistant message that requested it. The same
+		slice is only ever summarized once. Returns None when there is nothing to fold.
+		"""
+		start = len(messages) - max(1, keep_tail)
+		while start > keep_head and messages[start].get("role") == "tool":
+			start -= 1
+		if start <= keep_head + 1:
+			return None
+
+		middle = messages[keep_head:start]
+		blob = dumps_canonical(middle)
+		key = hashlib.sha256(blob.encode("utf-8")).hexdigest()
+		summary = self._summaries.get(key)
+		if summary is None:
+			summary = summarize(middle)
+			if len(self._summaries) >= self.max_cached_summaries:
+				self._summaries.pop(next(iter(self._summaries)))
+			self._summaries[key] = summary
+		return [*messages[:keep_head], {"role": "system", "content": f"{header}\n{summary}"}, *messages[start:]]
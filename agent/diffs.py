@@ -4,6 +4,9 @@ import difflib
 
 
 def unified_diff(path: str, old: str, new: str) -> str:
+	# Rewrites that change nothing are common; str equality is a length check + memcmp.
+	if old == new:
+		return ""
 	old_lines = old.splitlines(keepends=True)
 	new_lines = new.splitlines(keepends=True)
 	out = difflib.unified_diff(
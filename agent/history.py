@@ -1,29 +1,191 @@
 from __future__ import annotations
 
-import json
+import atexit
 import os
+import queue
+import threading
 import time
-from dataclasses import dataclass
-from typing import Any
+from dataclasses import dataclass, field
+from typing import Any, TextIO
+
+from .jsonutil import dumps
+
+# Read size for `tail`'s backward scan; larger blocks stop saving syscalls.
+_TAIL_BLOCK = 64 * 1024
 
 
 @dataclass
 class HistoryStore:
 	path: str
+	# Hand writes to a daemon thread that keeps the file open and coalesces
+	# queued lines. Ending a batch only queues its lines; `flush`/`tail`/`close`
+	# wait for the writer to catch up.
+	background: bool = False
+	# Serialized lines held back while a batch is open (see `begin_batch`).
+	_pending: list[str] = field(default_factory=list, init=False, repr=False)
+	_batch_depth: int = field(default=0, init=False, repr=False)
+	_queue: queue.Queue[str | None] | None = field(default=None, init=False, repr=False)
+	_writer: threading.Thread | None = field(default=None, init=False, repr=False)
+	_writer_error: Exception | None = field(default=None, init=False, repr=False)
+	# Set once the parent directory is known to exist.
+	_dir_ready: bool = field(default=False, init=False, repr=False)
+
+	def __post_init__(self) -> None:
+		if self.background:
+			self._queue = queue.Queue()
+			self._writer = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+			self._writer.start()
+			atexit.register(self.close)
+
+	def append_event(self, event: dict[str, Any], *, encoded: dict[str, str] | None = None) -> None:
+		"""Append one JSONL record.
 
-	def append_event(self, event: dict[str, Any]) -> None:
-		os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+		`encoded` maps extra keys to values that are already JSON text (e.g. a tool
+		result the caller serialized anyway); they are spliced in without re-encoding.
+		"""
+		self._raise_writer_error()
 		record = {"ts": time.time(), **event}
-		with open(self.path, "a", encoding="utf-8") as f:
-			f.write(json.dumps(record, ensure_ascii=False) + "\n")
+		line = dumps(record)
+		if encoded:
+			extra = ", ".join(f"{dumps(k)}: {v}" for k, v in encoded.items())
+			line = f"{line[:-1]}, {extra}}}"
+		line += "\n"
+		if self._batch_depth:
+			self._pending.append(line)
+			return
+		self._write(line)
+
+	def begin_batch(self) -> None:
+		"""Buffer events in memory until the matching `end_batch` (batches may nest)."""
+		self._batch_depth += 1
+
+	def end_batch(self) -> None:
+		"""Close a batch; the outermost one writes everything buffered in one go.
+
+		With a background writer the lines are only queued, not waited for.
+		"""
+		if self._batch_depth:
+			self._batch_depth -= 1
+		if not self._batch_depth:
+			self._write_pending()
+			self._raise_writer_error()
+
+	def flush(self) -> None:
+		"""Write buffered events now, keeping any open batch open."""
+		self._write_pending()
+		if self._queue is not None and self._writer_alive():
+			self._queue.join()
+		self._raise_writer_error()
+
+	def close(self) -> None:
+		"""Flush and stop the background writer (no-op for synchronous stores)."""
+		q = self._queue
+		if q is None:
+			return
+		try:
+			self.flush()
+		finally:
+			q.put(None)
+			if self._writer is not None:
+				self._writer.join()
+			self._queue = None
+			self._writer = None
+			atexit.unregister(self.close)
+
+	def _write_pending(self) -> None:
+		if self._pending:
+			data = "".join(self._pending)
+			self._pending.clear()
+			self._write(data)
+
+	def _raise_writer_error(self) -> None:
+		# A failed background write surfaces on the next call into the store.
+		if self._writer_error is not None:
+			err, self._writer_error = self._writer_error, None
+			raise err
+
+	def _writer_alive(self) -> bool:
+		return self._writer is not None and self._writer.is_alive()
+
+	def _write(self, data: str) -> None:
+		# Once the writer thread is gone, write synchronously rather than queue
+		# lines nobody will consume (and that flush would wait on forever).
+		if self._queue is not None and self._writer_alive():
+			self._queue.put(data)
+			return
+		with self._open_append() as f:
+			f.write(data)
+
+	def _open_append(self) -> TextIO:
+		if not self._dir_ready:
+			os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+			self._dir_ready = True
+		# Lone surrogates (from non-UTF-8 file names or bytes) are written as \udcXX,
+		# which is also their JSON escape, so every line stays valid JSON and UTF-8.
+		try:
+			return open(self.path, "a", encoding="utf-8", errors="backslashreplace")
+		except FileNotFoundError:
+			# The directory was removed after the first write; recreate it.
+			os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+			return open(self.path, "a", encoding="utf-8", errors="backslashreplace")
+
+	def _writer_loop(self) -> None:
+		q = self._queue
+		assert q is not None
+		f = None
+		try:
+			while True:
+				# Block for one item, then take whatever else is already queued.
+				batch = [q.get()]
+				try:
+					while True:
+						try:
+							batch.append(q.get_nowait())
+						except queue.Empty:
+							break
+					data = "".join(item for item in batch if item is not None)
+					if data:
+						if f is None:
+							f = self._open_append()
+						f.write(data)
+						f.flush()
+				except Exception as e:
+					# Reported by the next call into the store; the thread keeps serving the queue.
+					self._writer_error = e
+				finally:
+					for _ in batch:
+						q.task_done()
+				if None in batch:
+					return
+		finally:
+			if f is not None:
+				f.close()
 
 	def tail(self, n: int) -> str:
 		if n <= 0:
 			return ""
+		self.flush()
 		if not os.path.exists(self.path):
 			return "(no history yet)"
 
-		with open(self.path, "r", encoding="utf-8") as f:
-			lines = f.readlines()
-			chunk = lines[-n:]
-		return "".join(chunk)
+		# Read backwards from the end in blocks until the last `n` lines are in hand,
+		# so the cost tracks `n` rather than the size of the whole log.
+		with open(self.path, "rb") as f:
+			pos = f.seek(0, os.SEEK_END)
+			blocks: list[bytes] = []
+			newlines = 0
+			trailing = 0
+			while pos > 0:
+				step = min(_TAIL_BLOCK, pos)
+				pos -= step
+				f.seek(pos)
+				block = f.read(step)
+				if not blocks and block.endswith(b"\n"):
+					trailing = 1
+				blocks.append(block)
+				newlines += block.count(b"\n")
+				# One newline beyond the last `n` lines marks where the first of them starts.
+				if newlines - trailing >= n:
+					break
+		data = b"".join(reversed(blocks))
+		return b"".join(data.splitlines(keepends=True)[-n:]).decode("utf-8")
@@ -0,0 +1,51 @@
+"""Shared JSON encoders.
+
+`json.dumps` builds a fresh JSONEncoder on every call that passes non-default
+options (such as ensure_ascii=False), which adds up on hot paths. These are
+built once; all of them emit UTF-8-ready text without \\u escapes.
+"""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Iterator
+from typing import Any
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False)
+_ASCII_ENCODER = json.JSONEncoder()
+_PRETTY_ENCODER = json.JSONEncoder(ensure_ascii=False, indent=2)
+# Stable text for hashing and cache keys: sorted keys, no whitespace, and
+# anything non-JSON (paths, sets) stringified instead of raising.
+_CANONICAL_ENCODER = json.JSONEncoder(ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+
+loads = json.loads
+
+
+def dumps(value: Any) -> str:
+	return _ENCODER.encode(value)
+
+
+def dumps_utf8(value: Any) -> bytes:
+	"""UTF-8 JSON bytes, e.g. for a request body.
+
+	Lone surrogates (tool output for non-UTF-8 file names or bytes) cannot be
+	encoded as UTF-8; such values are sent with every non-ASCII character escaped
+	instead, which turns them into valid \\udcXX escapes.
+	"""
+	try:
+		return _ENCODER.encode(value).encode("utf-8")
+	except UnicodeEncodeError:
+		return _ASCII_ENCODER.encode(value).encode("ascii")
+
+
+def dumps_pretty(value: Any) -> str:
+	return _PRETTY_ENCODER.encode(value)
+
+
+def dumps_canonical(value: Any) -> str:
+	return _CANONICAL_ENCODER.encode(value)
+
+
+def iterdumps(value: Any) -> Iterator[str]:
+	"""Encode `value` in chunks, so callers can stop early (e.g. for previews)."""
+	return _ENCODER.iterencode(value)
@@ -0,0 +1,98 @@
+"""Content-addressed cache for deterministic LLM calls (planning, plan finalization)."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from .jsonutil import dumps_canonical
+
+
+@dataclass
+class LLMCache:
+	"""In-memory LRU of chat responses, optionally mirrored to one JSON file per key on disk."""
+	directory: str | None = None
+	max_entries: int = 256
+	hits: int = 0
+	misses: int = 0
+	_memory: OrderedDict[str, dict[str, Any]] = field(default_factory=OrderedDict, init=False, repr=False)
+	_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+	@staticmethod
+	def make_key(model: str | None, messages: list[dict[str, Any]], tools: list[dict[str, Any]] | None) -> str:
+		tool_names = sorted(((t.get("function") or {}).get("name") or "") for t in tools or [])
+		blob = dumps_canonical({"model": model, "messages": messages, "tools": tool_names})
+		return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+	def get(self, key: str) -> dict[str, Any] | None:
+		with self._lock:
+			resp = self._memory.get(key)
+			if resp is not None:
+				self._memory.move_to_end(key)
+				return resp
+		resp = self._read_disk(key)
+		if resp is not None:
+			self._remember(key, resp)
+		return resp
+
+	def set(self, key: str, resp: dict[str, Any]) -> None:
+		# Only the message is needed to replay a call; the raw payload can be large.
+		entry = {"message": resp.get("message") or {}}
+		self._remember(key, entry)
+		self._write_disk(key, entry)
+
+	def get_or_compute(self, key: str, compute: Callable[[], dict[str, Any]], *, no_cache: bool = False) -> dict[str, Any]:
+		"""Return the cached response for `key`, or call `compute` and store its result.
+
+		Pass `no_cache=True` for prompts that embed volatile data (timestamps, file
+		contents that may change), which must always reach the LLM.
+		"""
+		if no_cache:
+			return compute()
+		cached = self.get(key)
+		if cached is not None:
+			self.hits += 1
+			return cached
+		self.misses += 1
+		resp = compute()
+		self.set(key, resp)
+		return resp
+
+	def _remember(self, key: str, entry: dict[str, Any]) -> None:
+		with self._lock:
+			self._memory[key] = entry
+			self._memory.move_to_end(key)
+			while len(self._memory) > self.max_entries:
+				self._memory.popitem(last=False)
+
+	def _path(self, key: str) -> str:
+		assert self.directory is not None
+		return os.path.join(self.directory, f"{key}.json")
+
+	def _read_disk(self, key: str) -> dict[str, Any] | None:
+		if not self.directory:
+			return None
+		try:
+			with open(self._path(key), "r", encoding="utf-8") as f:
+				entry = json.load(f)
+		except (OSError, ValueError):
+			return None
+		return entry if isinstance(entry, dict) else None
+
+	def _write_disk(self, key: str, entry: dict[str, Any]) -> None:
+		if not self.directory:
+			return
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+			tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+			with open(tmp, "w", encoding="utf-8") as f:
+				json.dump(entry, f, ensure_ascii=False)
+			os.replace(tmp, self._path(key))
+		except OSError:
+			pass
@@ -1,13 +1,113 @@
 from __future__ import annotations
 
-import json
+import base64
+import hashlib
+import http.client
 import os
 import random
+import ssl
+import threading
 import time
 import urllib.error
+import urllib.parse
 import urllib.request
-from dataclasses import dataclass
-from typing import Any
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+from .jsonutil import dumps, dumps_utf8, loads
+
+# Seconds to wait before each retry (the last value repeats).
+_BACKOFF_TABLE = (0.5, 1.0, 2.0, 4.0, 8.0)
+
+# Responses API content block types.
+_INPUT_TEXT = "input_text"
+_OUTPUT_TEXT = "output_text"
+
+# (scheme, host, port, proxy URL tunnelled through, or "" for a direct connection)
+Origin = tuple[str, str, int, str]
+
+
+class _ConnectionPool:
+	"""Idle keep-alive connections shared by every client in the process, keyed by origin."""
+
+	def __init__(self, max_idle_per_origin: int = 16) -> None:
+		self.max_idle_per_origin = max_idle_per_origin
+		self._idle: dict[Origin, list[http.client.HTTPConnection]] = {}
+		self._lock = threading.Lock()
+		self._ssl_context: ssl.SSLContext | None = None
+
+	def checkout(self, origin: Origin, timeout: float) -> http.client.HTTPConnection | None:
+		"""Return an idle connection to `origin`, or None when there isn't one."""
+		with self._lock:
+			idle = self._idle.get(origin)
+			conn = idle.pop() if idle else None
+		if conn is not None and conn.sock is not None:
+			conn.sock.settimeout(timeout)
+		return conn
+
+	def connect(self, origin: Origin, timeout: float) -> http.client.HTTPConnection:
+		scheme, host, port, proxy = origin
+		if scheme == "https":
+			with self._lock:
+				if self._ssl_context is None:
+					self._ssl_context = ssl.create_default_context()
+			if proxy:
+				# CONNECT tunnel: TLS runs end to end and the tunnel stays up between requests.
+				p = urllib.parse.urlsplit(proxy)
+				conn = http.client.HTTPSConnection(p.hostname or "", p.port or 80, timeout=timeout, context=self._ssl_context)
+				tunnel_headers = {}
+				if p.username:
+					creds = f"{urllib.parse.unquote(p.username)}:{urllib.parse.unquote(p.password or '')}"
+					tunnel_headers["Proxy-Authorization"] = "Basic " + base64.b64encode(creds.encode("utf-8")).decode("ascii")
+				conn.set_tunnel(host, port, headers=tunnel_headers)
+				return conn
+			return http.client.HTTPSConnection(host, port, timeout=timeout, context=self._ssl_context)
+		return http.client.HTTPConnection(host, port, timeout=timeout)
+
+	def release(self, origin: Origin, conn: http.client.HTTPConnection) -> None:
+		with self._lock:
+			idle = self._idle.setdefault(origin, [])
+			if len(idle) < self.max_idle_per_origin:
+				idle.append(conn)
+				return
+		conn.close()
+
+
+_POOL = _ConnectionPool()
+
+
+class _PooledResponse:
+	"""HTTP response that hands its connection back to the pool once fully read."""
+
+	def __init__(self, origin: Origin, conn: http.client.HTTPConnection, resp: http.client.HTTPResponse) -> None:
+		self._origin = origin
+		self._conn: http.client.HTTPConnection | None = conn
+		self._resp = resp
+		self.status = resp.status
+
+	def read(self) -> bytes:
+		return self._resp.read()
+
+	def __iter__(self) -> Iterator[bytes]:
+		return iter(self._resp)
+
+	def close(self) -> None:
+		conn, self._conn = self._conn, None
+		if conn is None:
+			return
+		# Only a response read to the end leaves the connection ready for the next request.
+		if self._resp.isclosed() and not self._resp.will_close:
+			_POOL.release(self._origin, conn)
+		else:
+			self._resp.close()
+			conn.close()
+
+	def __enter__(self) -> _PooledResponse:
+		return self
+
+	def __exit__(self, *exc: object) -> None:
+		self.close()
 
 
 @dataclass
@@ -15,13 +115,116 @@ class OpenAICompatClient:
 	model: str | None = None
 	timeout_s: int = 120
 	max_retries: int = 4
-
-	def chat(self, messages: list[dict[str, Any]], tools: list[dict[str, Any]]) -> dict[str, Any]:
-		"""Call OpenAI using the Responses API and return a chat-completions-like shape.
+	# Mark static blocks with `cache_control` breakpoints (Anthropic-style prompt caching).
+	# Also enabled by OPENAI_CACHE_CONTROL=1.
+	cache_control: bool = False
+	# "chat_completions" talks to `/chat/completions` for backends without the Responses API.
+	# Response chaining (`chat_with_prev`) and token streaming need "responses".
+	# None reads OPENAI_ENDPOINT, defaulting to "responses".
+	endpoint: Literal["responses", "chat_completions"] | None = None
+	# Last `_to_responses_tools` conversion: (tools list, its length, cache_last, result).
+	_tools_converted: tuple[list[dict[str, Any]], int, bool, list[dict[str, Any]]] | None = field(
+		default=None, init=False, repr=False, compare=False
+	)
+
+	def __post_init__(self) -> None:
+		if self.endpoint is None:
+			self.endpoint = os.environ.get("OPENAI_ENDPOINT") or "responses"  # type: ignore[assignment]
+		if self.endpoint not in ("responses", "chat_completions"):
+			raise ValueError(f"Unknown OpenAI endpoint: {self.endpoint!r} (expected 'responses' or 'chat_completions')")
+
+	def supports_cache_control(self) -> bool:
+		if self.cache_control:
+			return True
+		return os.environ.get("OPENAI_CACHE_CONTROL", "").lower() in {"1", "true", "yes"}
+
+	def chat(self, messages: list[dict[str, Any]], tools: list[dict[str, Any]] | None) -> dict[str, Any]:
+		"""Call OpenAI and return a chat-completions-like shape.
 
 		We keep this signature stable so the rest of the project (agent loop + tests)
 		doesn't need to care whether the backend is chat.completions or responses.
 		"""
+		url, payload, api_key = self._build_request(messages, tools)
+		obj = self._post_json(url, payload, api_key=api_key)
+		msg = self._to_chat_message(obj)
+		return {"message": msg, "raw": obj, "usage": self._extract_usage(obj)}
+
+	def chat_with_prev(
+		self,
+		messages_delta: list[dict[str, Any]],
+		tools: list[dict[str, Any]] | None,
+		*,
+		previous_response_id: str,
+	) -> dict[str, Any]:
+		"""Like `chat`, but continue a stored response and send only the new messages.
+
+		The server already holds every turn up to `previous_response_id`, so
+		`messages_delta` should contain only what was appended since then (tool
+		outputs, follow-up user turns).
+		"""
+		url, payload, api_key = self._build_request(messages_delta, tools, previous_response_id=previous_response_id)
+		obj = self._post_json(url, payload, api_key=api_key)
+		msg = self._responses_to_chat_message(obj)
+		return {"message": msg, "raw": obj, "usage": self._extract_usage(obj)}
+
+	def chat_stream(
+		self,
+		messages: list[dict[str, Any]],
+		tools: list[dict[str, Any]] | None,
+		*,
+		previous_response_id: str | None = None,
+	) -> Iterator[dict[str, Any]]:
+		"""Like `chat`, but streams the response as it is generated.
+
+		Yields `{"type": "text_delta", "text": ...}` events while output text arrives and
+		finishes with a single `{"type": "done", "message": ..., "raw": ..., "has_tool_calls": ...}`
+		event whose message has the same shape `chat` returns (tool calls included). Pass
+		`previous_response_id` to stream a continuation (see `chat_with_prev`).
+
+		The chat_completions endpoint does not stream here: its reply arrives as one
+		text delta followed by the done event.
+		"""
+		if self.endpoint == "chat_completions":
+			if previous_response_id:
+				raise RuntimeError("previous_response_id requires the responses endpoint")
+			out = self.chat(messages, tools)
+			msg = out["message"]
+			if msg["content"]:
+				yield {"type": "text_delta", "text": msg["content"]}
+			yield {**out, "type": "done", "has_tool_calls": bool(msg["tool_calls"])}
+			return
+		url, payload, api_key = self._build_request(messages, tools, previous_response_id=previous_response_id)
+		payload["stream"] = True
+		with self._open(url, payload, api_key=api_key) as resp:
+			for event in self._iter_sse_events(resp):
+				etype = event.get("type")
+				if etype == "response.output_text.delta":
+					delta = event.get("delta")
+					if isinstance(delta, str) and delta:
+						yield {"type": "text_delta", "text": delta}
+				elif etype == "response.completed":
+					obj = event.get("response") or {}
+					msg = self._responses_to_chat_message(obj)
+					yield {
+						"type": "done",
+						"message": msg,
+						"raw": obj,
+						"usage": self._extract_usage(obj),
+						"has_tool_calls": bool(msg["tool_calls"]),
+					}
+					return
+				elif etype in {"response.failed", "response.incomplete", "error"}:
+					err = (event.get("response") or {}).get("error") or event.get("error") or event
+					raise RuntimeError(f"OpenAI stream {etype}: {dumps(err)}")
+		raise RuntimeError("OpenAI stream ended before response.completed")
+
+	def _build_request(
+		self,
+		messages: list[dict[str, Any]],
+		tools: list[dict[str, Any]] | None,
+		*,
+		previous_response_id: str | None = None,
+	) -> tuple[str, dict[str, Any], str]:
 		api_key = os.environ.get("OPENAI_API_KEY") or os.environ.get("SHISHIR_OPENAI_API_KEY")
 		if not api_key:
 			raise RuntimeError("OPENAI_API_KEY is required")
@@ -29,143 +232,306 @@ class OpenAICompatClient:
 		base_url = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
 		model = self.model or os.environ.get("OPENAI_MODEL", "gpt-5.2")
 
-		url = f"{base_url}/responses"
-		payload: dict[str, Any] = {
-			"model": model,
-			"input": self._to_responses_input(messages),
-			"tools": self._to_responses_tools(tools),
-			"temperature": 0.2,
-			"text": {"format": {"type": "text"}},
-		}
+		payload: dict[str, Any]
+		if self.endpoint == "chat_completions":
+			if previous_response_id:
+				raise RuntimeError("previous_response_id requires the responses endpoint")
+			# Messages and tools are already in chat-completions shape.
+			url = f"{base_url}/chat/completions"
+			payload = {"model": model, "messages": self._to_chat_completions_messages(messages), "temperature": 0.2}
+			if tools:
+				payload["tools"] = tools
+		else:
+			url = f"{base_url}/responses"
+			payload = {
+				"model": model,
+				"input": self._to_responses_input(messages),
+				"tools": self._converted_tools(tools or [], cache_last=self.supports_cache_control()),
+				"temperature": 0.2,
+				"text": {"format": {"type": "text"}},
+			}
+			if previous_response_id:
+				payload["previous_response_id"] = previous_response_id
 
 		# Optional knobs (avoid sending fields models might reject unless set)
 		reasoning_effort = os.environ.get("OPENAI_REASONING_EFFORT")
 		if reasoning_effort:
-			payload["reasoning"] = {"effort": reasoning_effort}
+			if self.endpoint == "chat_completions":
+				payload["reasoning_effort"] = reasoning_effort
+			else:
+				payload["reasoning"] = {"effort": reasoning_effort}
 
 		store = os.environ.get("OPENAI_STORE")
 		if store is not None:
 			payload["store"] = store.lower() in {"1", "true", "yes"}
 
-		obj = self._post_json(url, payload, api_key=api_key)
-		msg = self._responses_to_chat_message(obj)
-		return {"message": msg, "raw": obj}
+		# Route requests sharing a system prompt to the same prompt cache.
+		prompt_cache = os.environ.get("OPENAI_PROMPT_CACHE")
+		if prompt_cache is not None and prompt_cache.lower() in {"1", "true", "yes"}:
+			cache_key = self._prompt_cache_key(messages)
+			if cache_key:
+				payload["prompt_cache_key"] = cache_key
+
+		return url, payload, api_key
+
+	@staticmethod
+	def _to_chat_completions_messages(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+		# Assistant turns are stored with `"tool_calls": []`; Chat Completions
+		# rejects an empty array, so the key is dropped instead.
+		return [
+			{k: v for k, v in m.items() if k != "tool_calls"} if "tool_calls" in m and not m["tool_calls"] else m
+			for m in messages
+		]
 
 	def _post_json(self, url: str, payload: dict[str, Any], *, api_key: str) -> dict[str, Any]:
-		data = json.dumps(payload).encode("utf-8")
-		req = urllib.request.Request(
-			url,
-			data=data,
-			method="POST",
-			headers={
-				"Content-Type": "application/json",
-				"Authorization": f"Bearer {api_key}",
-			},
+		with self._open(url, payload, api_key=api_key) as resp:
+			body = resp.read()
+		# json.loads takes UTF-8 bytes directly; no intermediate str copy.
+		return loads(body)
+
+	def _open(self, url: str, payload: dict[str, Any], *, api_key: str):
+		"""POST `payload` and return the open HTTP response, retrying transient failures.
+
+		Requests reuse process-wide keep-alive connections, so later rounds skip the
+		TCP/TLS handshake. HTTPS through a plain-HTTP proxy is pooled as a CONNECT
+		tunnel; any other proxy setup is left to urllib, which knows how to route it.
+		"""
+		data = dumps_utf8(payload)
+		headers = {
+			"Content-Type": "application/json",
+			"Authorization": f"Bearer {api_key}",
+		}
+		parts = urllib.parse.urlsplit(url)
+		proxy = self._proxy_url(parts)
+		pooled = parts.scheme in {"http", "https"} and (
+			proxy is None or (parts.scheme == "https" and proxy.startswith("http://"))
+		)
+		origin: Origin = (
+			parts.scheme,
+			parts.hostname or "",
+			parts.port or (443 if parts.scheme == "https" else 80),
+			proxy or "",
 		)
+		path = f"{parts.path or '/'}?{parts.query}" if parts.query else parts.path or "/"
 
 		last_err: Exception | None = None
+		# Retries share one budget, so a run of failures can't stall far past the timeout.
+		deadline = time.monotonic() + self.timeout_s * (self.max_retries + 1)
 		for attempt in range(self.max_retries + 1):
 			try:
-				with urllib.request.urlopen(req, timeout=self.timeout_s) as resp:
-					body = resp.read().decode("utf-8")
-					return json.loads(body)
+				if pooled:
+					resp = self._pooled_post(origin, path, data, headers)
+				else:
+					req = urllib.request.Request(url, data=data, method="POST", headers=headers)
+					resp = urllib.request.urlopen(req, timeout=self.timeout_s)
 			except urllib.error.HTTPError as e:
+				resp = e
+			except (OSError, http.client.HTTPException) as e:
 				last_err = e
-				status = getattr(e, "code", None)
-				# Try to parse error body for better messages
-				try:
-					err_body = e.read().decode("utf-8", errors="replace")
-					err_obj = json.loads(err_body)
-				except Exception:
-					err_body = ""
-					err_obj = {}
-
-				# Retry on transient errors
-				if status in {429, 500, 502, 503, 504} and attempt < self.max_retries:
-					self._sleep_backoff(attempt)
+				if attempt < self.max_retries and self._sleep_backoff(attempt, deadline):
 					continue
+				raise
 
-				# Friendlier error messages for rate limits
-				if status == 429:
-					err_msg = err_obj.get("error", {}).get("message", "")
-					if err_msg:
-						raise RuntimeError(f"Rate limit exceeded: {err_msg}") from e
-					raise RuntimeError(f"OpenAI HTTP 429: {err_body}".strip()) from e
+			status = getattr(resp, "status", None)
+			if status is not None and status < 400:
+				return resp
 
-				# Generic error
-				raise RuntimeError(f"OpenAI HTTP {status}: {err_body}".strip()) from e
-			except (urllib.error.URLError, TimeoutError) as e:
-				last_err = e
-				if attempt < self.max_retries:
-					self._sleep_backoff(attempt)
-					continue
-				raise
+			# Try to parse error body for better messages
+			try:
+				err_body = resp.read().decode("utf-8", errors="replace")
+				err_obj = loads(err_body)
+			except Exception:
+				err_body = ""
+				err_obj = {}
+			finally:
+				resp.close()
+			last_err = RuntimeError(f"OpenAI HTTP {status}: {err_body}".strip())
+
+			# Retry on transient errors
+			if status in {429, 500, 502, 503, 504} and attempt < self.max_retries and self._sleep_backoff(attempt, deadline):
+				continue
+
+			# Friendlier error messages for rate limits
+			if status == 429:
+				err_msg = err_obj.get("error", {}).get("message", "") if isinstance(err_obj, dict) else ""
+				if err_msg:
+					raise RuntimeError(f"Rate limit exceeded: {err_msg}")
+				raise RuntimeError(f"OpenAI HTTP 429: {err_body}".strip())
+
+			# Generic error
+			raise last_err
 
 		assert last_err is not None
 		raise last_err
 
+	def _pooled_post(self, origin: Origin, path: str, data: bytes, headers: dict[str, str]) -> _PooledResponse:
+		conn = _POOL.checkout(origin, self.timeout_s)
+		if conn is not None:
+			try:
+				conn.request("POST", path, body=data, headers=headers)
+				return _PooledResponse(origin, conn, conn.getresponse())
+			except (ConnectionError, http.client.HTTPException):
+				# The server closed the idle connection; redial below without spending a retry.
+				conn.close()
+			except BaseException:
+				conn.close()
+				raise
+
+		conn = _POOL.connect(origin, self.timeout_s)
+		try:
+			conn.request("POST", path, body=data, headers=headers)
+			return _PooledResponse(origin, conn, conn.getresponse())
+		except BaseException:
+			conn.close()
+			raise
+
+	@staticmethod
+	def _proxy_url(parts: urllib.parse.SplitResult) -> str | None:
+		"""Proxy URL configured for this request's scheme and host, if any."""
+		proxy = urllib.request.getproxies().get(parts.scheme)
+		if not proxy or urllib.request.proxy_bypass(parts.hostname or ""):
+			return None
+		return proxy
+
 	@staticmethod
-	def _sleep_backoff(attempt: int) -> None:
+	def _iter_sse_events(lines: Iterable[bytes]) -> Iterator[dict[str, Any]]:
+		"""Decode the `data:` payloads of a server-sent-events stream into dicts."""
+		for raw in lines:
+			line = raw.strip()
+			if not line.startswith(b"data:"):
+				continue
+			data = line[5:].strip()
+			if not data or data == b"[DONE]":
+				continue
+			try:
+				event = loads(data)
+			except ValueError:
+				continue
+			if isinstance(event, dict):
+				yield event
+
+	@staticmethod
+	def _prompt_cache_key(messages: list[dict[str, Any]]) -> str | None:
+		"""Hash of the leading system message, or None when there isn't one."""
+		first = messages[0] if messages else {}
+		content = first.get("content")
+		if isinstance(content, list):
+			content = "".join(b.get("text", "") for b in content if isinstance(b, dict))
+		if first.get("role") != "system" or not isinstance(content, str):
+			return None
+		return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+	@staticmethod
+	def _extract_usage(resp: dict[str, Any]) -> dict[str, int]:
+		"""Token counts from a response, including prompt-cache reads and writes.
+
+		Understands both the Responses API shape (`input_tokens_details.cached_tokens`)
+		and Anthropic-style fields (`cache_read_input_tokens`, `cache_creation_input_tokens`).
+		"""
+		usage = resp.get("usage")
+		if not isinstance(usage, dict):
+			return {}
+		details = usage.get("input_tokens_details") or usage.get("prompt_tokens_details") or {}
+		cached = details.get("cached_tokens") if isinstance(details, dict) else None
+		if cached is None:
+			cached = usage.get("cache_read_input_tokens")
+		out = {
+			"input_tokens": usage.get("input_tokens", usage.get("prompt_tokens")),
+			"output_tokens": usage.get("output_tokens", usage.get("completion_tokens")),
+			"cached_input_tokens": cached,
+			"cache_creation_input_tokens": usage.get("cache_creation_input_tokens"),
+		}
+		return {k: int(v) for k, v in out.items() if isinstance(v, (int, float))}
+
+	@staticmethod
+	def _sleep_backoff(attempt: int, deadline: float | None = None) -> bool:
+		"""Sleep before retry `attempt + 1`; False (without sleeping) if that would pass `deadline`."""
 		# Exponential backoff with jitter
-		base = min(8.0, 0.5 * (2**attempt))
-		time.sleep(base + random.random() * 0.2)
+		delay = _BACKOFF_TABLE[min(attempt, len(_BACKOFF_TABLE) - 1)] + random.random() * 0.2
+		if deadline is not None and time.monotonic() + delay > deadline:
+			return False
+		time.sleep(delay)
+		return True
 
 	@staticmethod
 	def _to_responses_input(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
 		"""Convert chat-completions-like messages into Responses API input items."""
+		# Runs over the whole history every round: one pass, one `get` per key.
 		items: list[dict[str, Any]] = []
+		append = items.append
 		for m in messages:
 			role = m.get("role")
 			content = m.get("content")
-			tool_calls = m.get("tool_calls")
-
-			if role == "system":
-				role = "developer"
 
 			if role == "tool":
 				call_id = m.get("tool_call_id")
 				if call_id:
-					items.append({"type": "function_call_output", "call_id": call_id, "output": str(content or "")})
+					append({"type": "function_call_output", "call_id": call_id, "output": str(content or "")})
 				continue
 
-			# If an assistant message included tool calls, represent them explicitly so that
-			# subsequent function_call_output items can be validated by the API.
-			if role == "assistant" and tool_calls:
-				if isinstance(tool_calls, list):
+			if role == "assistant":
+				block_type = _OUTPUT_TEXT
+				# If an assistant message included tool calls, represent them explicitly so that
+				# subsequent function_call_output items can be validated by the API.
+				tool_calls = m.get("tool_calls")
+				if tool_calls and isinstance(tool_calls, list):
 					for call in tool_calls:
 						if not isinstance(call, dict):
 							continue
 						call_id = call.get("id")
 						fn = call.get("function") or {}
 						name = fn.get("name")
-						args = fn.get("arguments")
 						if not call_id or not name:
 							continue
+						args = fn.get("arguments")
 						# Responses expects `arguments` to be a string (typically JSON).
 						if isinstance(args, str):
 							arguments = args
 						elif args is None:
 							arguments = "{}"
 						else:
-							arguments = json.dumps(args)
-						items.append({"type": "function_call", "call_id": str(call_id), "name": str(name), "arguments": arguments})
+							arguments = dumps(args)
+						append({"type": "function_call", "call_id": str(call_id), "name": str(name), "arguments": arguments})
+			else:
+				# Per Responses API conventions: only assistant content uses output_text.
+				block_type = _INPUT_TEXT
+				if role == "system":
+					role = "developer"
 
 			if content is None:
 				continue
 
-			# Per Responses API conventions: assistant content uses output_text.
-			block_type = "output_text" if role == "assistant" else "input_text"
-			text_key = "text" if block_type in {"input_text", "output_text"} else "text"
-
 			if isinstance(content, str):
-				items.append({"role": role, "content": [{"type": block_type, text_key: content}]})
+				append({"role": role, "content": [{"type": block_type, "text": content}]})
+			elif isinstance(content, list) and all(isinstance(b, dict) and b.get("type") == "text" for b in content):
+				# Text blocks, possibly carrying `cache_control` breakpoints.
+				blocks = []
+				for b in content:
+					block = {"type": block_type, "text": b.get("text", "")}
+					if "cache_control" in b:
+						block["cache_control"] = b["cache_control"]
+					blocks.append(block)
+				append({"role": role, "content": blocks})
 			else:
 				# Best-effort: stringify non-text content
-				items.append({"role": role, "content": [{"type": block_type, text_key: json.dumps(content)}]})
+				append({"role": role, "content": [{"type": block_type, "text": dumps(content)}]})
 		return items
 
+	def _converted_tools(self, tools: list[dict[str, Any]], *, cache_last: bool) -> list[dict[str, Any]]:
+		"""`_to_responses_tools`, reused while the caller keeps passing the same list.
+
+		The agent sends the same schema list object every round, so identity (plus a
+		length check against in-place appends) is enough to key the cache.
+		"""
+		cached = self._tools_converted
+		if cached is not None and cached[0] is tools and cached[1] == len(tools) and cached[2] == cache_last:
+			return cached[3]
+		out = self._to_responses_tools(tools, cache_last=cache_last)
+		self._tools_converted = (tools, len(tools), cache_last, out)
+		return out
+
 	@staticmethod
-	def _to_responses_tools(tools: list[dict[str, Any]]) -> list[dict[str, Any]]:
+	def _to_responses_tools(tools: list[dict[str, Any]], *, cache_last: bool = False) -> list[dict[str, Any]]:
 		"""Convert chat-completions tool schema to Responses API tool schema.
 
 		Chat-completions shape:
@@ -173,6 +539,9 @@ class OpenAICompatClient:
 
 		Responses shape:
 		  {"type":"function","name":...,"description":...,"parameters":...}
+
+		With `cache_last`, the last tool carries a `cache_control` breakpoint so the
+		whole (rarely changing) tool block can be served from the prompt cache.
 		"""
 		out: list[dict[str, Any]] = []
 		for t in tools:
@@ -194,15 +563,45 @@ class OpenAICompatClient:
 				out.append(tool_obj)
 			else:
 				out.append(t)
+		if cache_last and out:
+			out[-1] = {**out[-1], "cache_control": {"type": "ephemeral"}}
 		return out
 
+	def _to_chat_message(self, resp: dict[str, Any]) -> dict[str, Any]:
+		if self.endpoint == "chat_completions":
+			return self._completions_to_chat_message(resp)
+		return self._responses_to_chat_message(resp)
+
+	@staticmethod
+	def _completions_to_chat_message(resp: dict[str, Any]) -> dict[str, Any]:
+		"""Normalize a `/chat/completions` reply to the assistant message shape `chat` returns."""
+		choices = resp.get("choices")
+		message = choices[0].get("message") if isinstance(choices, list) and choices and isinstance(choices[0], dict) else None
+		if not isinstance(message, dict):
+			return {"role": "assistant", "content": "", "tool_calls": []}
+		content = message.get("content")
+		tool_calls = [
+			c for c in message.get("tool_calls") or [] if isinstance(c, dict) and isinstance(c.get("function"), dict)
+		]
+		return {"role": "assistant", "content": content.strip() if isinstance(content, str) else "", "tool_calls": tool_calls}
+
 	@staticmethod
 	def _responses_to_chat_message(resp: dict[str, Any]) -> dict[str, Any]:
 		"""Parse a Responses API response into a chat-completions-like assistant message."""
+		output = resp.get("output")
+		# Dominant shape: one message item holding one text block, no tool calls.
+		if isinstance(output, list) and len(output) == 1:
+			item = output[0]
+			content = item.get("content") if isinstance(item, dict) and item.get("type") == "message" else None
+			if isinstance(content, list) and len(content) == 1:
+				block = content[0]
+				if isinstance(block, dict) and block.get("type") == _OUTPUT_TEXT:
+					text = block.get("text")
+					if isinstance(text, str):
+						return {"role": "assistant", "content": text.strip(), "tool_calls": []}
+
 		text_parts: list[str] = []
 		tool_calls: list[dict[str, Any]] = []
-
-		output = resp.get("output")
 		if isinstance(output, list):
 			for item in output:
 				if not isinstance(item, dict):
@@ -212,7 +611,7 @@ class OpenAICompatClient:
 					content = item.get("content")
 					if isinstance(content, list):
 						for block in content:
-							if isinstance(block, dict) and block.get("type") == "output_text":
+							if isinstance(block, dict) and block.get("type") == _OUTPUT_TEXT:
 								text = block.get("text")
 								if isinstance(text, str):
 									text_parts.append(text)
@@ -224,7 +623,7 @@ class OpenAICompatClient:
 					name = item.get("name")
 					args = item.get("arguments")
 					if isinstance(args, dict):
-						args_json = json.dumps(args)
+						args_json = dumps(args)
 					elif isinstance(args, str):
 						args_json = args
 					else:
@@ -245,5 +644,10 @@ class OpenAICompatClient:
 			if isinstance(out_text, str):
 				text_parts.append(out_text)
 
-		content_text = "".join(text_parts).strip() if text_parts else None
+		if not text_parts:
+			content_text = None
+		elif len(text_parts) == 1:
+			content_text = text_parts[0].strip()
+		else:
+			content_text = "".join(text_parts).strip()
 		return {"role": "assistant", "content": content_text, "tool_calls": tool_calls}
@@ -17,8 +17,8 @@ eg:
 from __future__ import annotations
 
 import os
+from collections.abc import Callable, Iterable
 from dataclasses import dataclass
-from typing import Iterable
 
 
 class PatchError(Exception):
@@ -30,37 +30,68 @@ class UpdateChunk:
 	lines: list[str]
 
 
+# Line kinds, tagged once per patch so the parser compares ints instead of prefixes.
+# Every kind >= _K_ACTION is a "*** " marker line.
+_K_TEXT = 0
+_K_HUNK = 1  # "@@ ..."
+_K_ACTION = 2  # any other "*** " line
+_K_BEGIN = 3
+_K_END = 4
+_K_ADD = 5
+_K_DELETE = 6
+_K_UPDATE = 7
+
+_MARKERS = (
+	("*** Begin Patch", _K_BEGIN),
+	("*** End Patch", _K_END),
+	("*** Add File:", _K_ADD),
+	("*** Delete File:", _K_DELETE),
+	("*** Update File:", _K_UPDATE),
+)
+
+
+def _line_kind(line: str) -> int:
+	if line.startswith("@@"):
+		return _K_HUNK
+	if not line.startswith("*** "):
+		return _K_TEXT
+	for prefix, kind in _MARKERS:
+		if line.startswith(prefix):
+			return kind
+	return _K_ACTION
+
+
 def apply_v4a_patch(patch_text: str) -> dict:
 	lines = patch_text.splitlines()
-	if not any(l.startswith("*** Begin Patch") for l in lines):
-		raise PatchError("Patch must start with '*** Begin Patch'")
-
-	i = 0
-	# Seek begin
-	while i < len(lines) and not lines[i].startswith("*** Begin Patch"):
-		i += 1
-	i += 1
+	kinds = [_line_kind(l) for l in lines]
+	n = len(lines)
+	try:
+		# Seek begin
+		i = kinds.index(_K_BEGIN) + 1
+	except ValueError:
+		raise PatchError("Patch must start with '*** Begin Patch'") from None
 
 	applied: list[dict] = []
-	while i < len(lines):
+	while i < n:
 		line = lines[i]
-		if line.startswith("*** End Patch"):
+		kind = kinds[i]
+		if kind == _K_END:
 			break
 
-		if line.startswith("*** Add File:"):
+		if kind == _K_ADD:
 			path = line.split(":", 1)[1].strip()
 			i += 1
 			content_lines: list[str] = []
-			while i < len(lines) and not lines[i].startswith("*** "):
+			while i < n and kinds[i] < _K_ACTION:
 				l = lines[i]
 				# allow optional leading '+' for file content
-				content_lines.append(l[1:] if l.startswith("+") else l)
+				content_lines.append(l[1:] if l[:1] == "+" else l)
 				i += 1
 			_write_text(path, "\n".join(content_lines) + ("\n" if content_lines else ""))
 			applied.append({"action": "add", "path": path})
 			continue
 
-		if line.startswith("*** Delete File:"):
+		if kind == _K_DELETE:
 			path = line.split(":", 1)[1].strip()
 			i += 1
 			if os.path.exists(path):
@@ -68,26 +99,24 @@ def apply_v4a_patch(patch_text: str) -> dict:
 			applied.append({"action": "delete", "path": path})
 			continue
 
-		if line.startswith("*** Update File:"):
+		if kind == _K_UPDATE:
 			path = line.split(":", 1)[1].strip()
 			i += 1
 			chunks: list[UpdateChunk] = []
 			# If no @@ markers, treat until next action as one chunk
-			if i < len(lines) and not lines[i].startswith("@@"):
-				chunk_lines: list[str] = []
-				while i < len(lines) and not lines[i].startswith("*** "):
-					chunk_lines.append(lines[i])
+			if i < n and kinds[i] != _K_HUNK:
+				start = i
+				while i < n and kinds[i] < _K_ACTION:
 					i += 1
-				chunks.append(UpdateChunk(lines=chunk_lines))
+				chunks.append(UpdateChunk(lines=lines[start:i]))
 			else:
-				while i < len(lines) and lines[i].startswith("@@"):
+				while i < n and kinds[i] == _K_HUNK:
 					# consume '@@' header
 					i += 1
-					chunk_lines = []
-					while i < len(lines) and not lines[i].startswith("@@") and not lines[i].startswith("*** "):
-						chunk_lines.append(lines[i])
+					start = i
+					while i < n and kinds[i] == _K_TEXT:
 						i += 1
-					chunks.append(UpdateChunk(lines=chunk_lines))
+					chunks.append(UpdateChunk(lines=lines[start:i]))
 
 			_apply_update(path, chunks)
 			applied.append({"action": "update", "path": path, "chunks": len(chunks)})
@@ -99,26 +128,35 @@ def apply_v4a_patch(patch_text: str) -> dict:
 
 
 def _apply_update(path: str, chunks: list[UpdateChunk]) -> None:
-	old_text = ""
-	if os.path.exists(path):
+	try:
 		with open(path, "r", encoding="utf-8") as f:
 			old_text = f.read()
+	except FileNotFoundError:
+		old_text = ""
 
 	file_lines = old_text.splitlines()
+	# Canonicalized copies of file_lines for the fuzzy fallbacks: built the first
+	# time a chunk needs one, then patched alongside file_lines after every edit.
+	variants: dict[Callable[[str], str], list[str]] = {}
 
 	for chunk in chunks:
 		pattern, replacement = _compile_chunk(chunk.lines)
-		start = _find_subsequence(file_lines, pattern)
-		if start is None:
-			# fallback: rstrip match
-			start = _find_subsequence(file_lines, pattern, canonical=_rstrip)
-		if start is None:
-			# fallback: strip match
-			start = _find_subsequence(file_lines, pattern, canonical=_strip)
+		start = _find_lines(file_lines, pattern)
+		# fallbacks: rstrip match, then strip match
+		for canonical in (_rstrip, _strip):
+			if start is not None:
+				break
+			lines = variants.get(canonical)
+			if lines is None:
+				lines = variants[canonical] = [canonical(x) for x in file_lines]
+			start = _find_lines(lines, [canonical(x) for x in pattern])
 		if start is None:
 			raise PatchError(f"Could not find chunk to apply in {path} (pattern length={len(pattern)})")
 
-		file_lines[start : start + len(pattern)] = replacement
+		end = start + len(pattern)
+		file_lines[start:end] = replacement
+		for canonical, lines in variants.items():
+			lines[start:end] = [canonical(x) for x in replacement]
 
 	_write_text(path, "\n".join(file_lines) + ("\n" if file_lines else ""))
 
@@ -136,30 +174,34 @@ def _compile_chunk(lines: list[str]) -> tuple[list[str], list[str]]:
 	pattern: list[str] = []
 	replacement: list[str] = []
 	for raw in lines:
-		if raw.startswith("+"):
+		lead = raw[:1]
+		if lead == "+":
 			replacement.append(raw[1:])
-			continue
-		if raw.startswith("-"):
+		elif lead == "-":
 			pattern.append(raw[1:])
-			continue
-		# context
-		ctx = raw[1:] if raw.startswith(" ") else raw
-		pattern.append(ctx)
-		replacement.append(ctx)
+		else:
+			# context
+			ctx = raw[1:] if lead == " " else raw
+			pattern.append(ctx)
+			replacement.append(ctx)
 	return pattern, replacement
 
 
-def _find_subsequence(haystack: list[str], needle: list[str], canonical=None) -> int | None:
-	if canonical is None:
-		canonical = lambda s: s
+def _find_lines(haystack: list[str], needle: list[str]) -> int | None:
+	"""Index of the first run of `haystack` equal to `needle`, or None."""
 	if not needle:
 		return 0
-	H = [canonical(x) for x in haystack]
-	N = [canonical(x) for x in needle]
-	for i in range(0, len(H) - len(N) + 1):
-		if H[i : i + len(N)] == N:
-			return i
-	return None
+	if len(needle) > len(haystack):
+		return None
+	# Lines never contain "\n" (they come from splitlines), so wrapping both sides in
+	# newlines makes str.find match whole lines only, and the C search replaces a
+	# Python loop of slice comparisons.
+	H = "\n" + "\n".join(haystack) + "\n"
+	N = "\n" + "\n".join(needle) + "\n"
+	idx = H.find(N)
+	if idx < 0:
+		return None
+	return H.count("\n", 0, idx)
 
 
 def _rstrip(s: str) -> str:
@@ -170,7 +212,23 @@ def _strip(s: str) -> str:
 	return s.strip()
 
 
+# Large patched files go out in 64 KiB writes instead of the 8 KiB default.
+_WRITE_BUFFER = 64 * 1024
+
+# Parent directories already created by `_write_text` in this process.
+_dirs_seen: set[str] = set()
+
+
 def _write_text(path: str, content: str) -> None:
-	os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-	with open(path, "w", encoding="utf-8") as f:
-		f.write(content)
+	parent = os.path.dirname(path) or "."
+	if parent not in _dirs_seen:
+		os.makedirs(parent, exist_ok=True)
+		_dirs_seen.add(parent)
+	try:
+		with open(path, "w", encoding="utf-8", buffering=_WRITE_BUFFER) as f:
+			f.write(content)
+	except FileNotFoundError:
+		# Removed since we last saw it.
+		os.makedirs(parent, exist_ok=True)
+		with open(path, "w", encoding="utf-8", buffering=_WRITE_BUFFER) as f:
+			f.write(content)
@@ -1,6 +1,7 @@
 """Planning module for multi-step task orchestration."""
 
-from .models import Plan, PlanStep, PLANNING_PROMPT
-from .detector import should_plan, generate_plan
+from .cache import PlanCache
+from .detector import adapt_plan, generate_plan, should_plan
+from .models import PLANNING_PROMPT, Plan, PlanStep
 
-__all__ = ["Plan", "PlanStep", "PLANNING_PROMPT", "should_plan", "generate_plan"]
+__all__ = ["Plan", "PlanStep", "PLANNING_PROMPT", "should_plan", "generate_plan", "adapt_plan", "PlanCache"]
@@ -0,0 +1,74 @@
+"""Persistent store of completed plans, looked up by request similarity."""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+
+from ..jsonutil import dumps
+from ..similarity import text_similarity
+
+# File paths and file names are specific to one request; strip them from stored steps.
+# Only path-shaped text counts: a leading "/", "./", "../" or "~/", or a file
+# extension, so prose like "and/or" and "I/O" is kept.
+_PATH_RE = re.compile(
+	r"(?<![\w./~-])(?:~|\.{1,2})?/[\w.-][\w./-]*"
+	r"|\b(?:[\w.-]+/)*[\w-]+\.(?:py|pyi|js|jsx|ts|tsx|json|toml|ya?ml|md|txt|cfg|ini|sh|go|rs|c|h|cpp|java|rb)\b"
+)
+
+
+@dataclass
+class PlanCache:
+	"""SQLite table of `(goal, steps, success_count)` for plans that ran to completion."""
+	path: str = ".agent/plan_cache.sqlite"
+	_conn: sqlite3.Connection | None = field(default=None, init=False, repr=False)
+	_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+	def _connect(self) -> sqlite3.Connection:
+		if self._conn is None:
+			os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+			conn = sqlite3.connect(self.path, check_same_thread=False)
+			conn.execute(
+				"CREATE TABLE IF NOT EXISTS plans ("
+				"goal TEXT PRIMARY KEY, plan_json TEXT NOT NULL, success_count INTEGER NOT NULL DEFAULT 0)"
+			)
+			self._conn = conn
+		return self._conn
+
+	def lookup(self, goal: str, threshold: float = 0.9) -> tuple[str, list[str], float] | None:
+		"""Best stored `(goal, steps, similarity)` at or above `threshold`, else None."""
+		best: tuple[str, list[str], float] | None = None
+		best_rank = (threshold, -1)
+		with self._lock:
+			rows = self._connect().execute("SELECT goal, plan_json, success_count FROM plans").fetchall()
+		for stored_goal, plan_json, success_count in rows:
+			score = text_similarity(goal, stored_goal)
+			# Prefer the closest match; break ties with the most proven plan.
+			if (score, success_count) >= best_rank:
+				try:
+					steps = json.loads(plan_json)
+				except ValueError:
+					continue
+				best, best_rank = (stored_goal, steps, score), (score, success_count)
+		return best
+
+	def record_success(self, goal: str, steps: list[str]) -> None:
+		anonymized = [_PATH_RE.sub("<path>", s) for s in steps]
+		with self._lock:
+			conn = self._connect()
+			conn.execute(
+				"INSERT INTO plans (goal, plan_json, success_count) VALUES (?, ?, 1) "
+				"ON CONFLICT(goal) DO UPDATE SET plan_json = excluded.plan_json, success_count = success_count + 1",
+				(goal, dumps(anonymized)),
+			)
+			conn.commit()
+
+	def close(self) -> None:
+		with self._lock:
+			if self._conn is not None:
+				self._conn.close()
+				self._conn = None
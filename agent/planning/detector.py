@@ -3,39 +3,80 @@
 from __future__ import annotations
 
 import json
-from typing import TYPE_CHECKING
+import re
+from typing import TYPE_CHECKING, Any
 
-from .models import Plan, PlanStep, PLANNING_PROMPT
+from .detector_local import NO_PLAN_BELOW, plan_probability
+from .models import ADAPT_PLAN_PROMPT, PLANNING_PROMPT, Plan, PlanStep
 
 if TYPE_CHECKING:
+	from ..llm_cache import LLMCache
 	from ..llm_openai_compat import OpenAICompatClient
 
+_JSON_FENCE_RE = re.compile(r"```(?:json)?[ \t]*\n(.*?)```", re.DOTALL)
+_DECODER = json.JSONDecoder()
+# Question words (whole words only) or a question mark: a short request like this is a lookup.
+_QUICK_RE = re.compile(r"\b(?:what|how|why|show|list)\b|\?", re.IGNORECASE)
 
-def should_plan(client: OpenAICompatClient, user_text: str, enable_planning: bool = True) -> tuple[bool, list[str], str]:
+
+def _extract_json_object(content: str) -> dict[str, Any] | None:
+	"""First JSON object in an LLM reply: a fenced block if present, else the first `{`.
+
+	`raw_decode` stops at the end of the object, so trailing prose (or braces
+	in it) doesn't matter.
+	"""
+	fenced = _JSON_FENCE_RE.search(content)
+	if fenced:
+		content = fenced.group(1)
+	idx = content.find("{")
+	if idx < 0:
+		return None
+	try:
+		data, _end = _DECODER.raw_decode(content, idx)
+	except ValueError:
+		return None
+	return data if isinstance(data, dict) else None
+
+
+def should_plan(
+	client: OpenAICompatClient,
+	user_text: str,
+	enable_planning: bool = True,
+	cache: LLMCache | None = None,
+	local_classifier: bool = False,
+) -> tuple[bool, list[str], str]:
 	"""Determine if request needs a plan.
 	
 	Returns: (needs_plan, steps, reasoning)
+
+	The analysis depends only on `user_text`, so with a `cache` repeated requests
+	skip the LLM call. With `local_classifier`, requests the local model scores as
+	unlikely to need a plan skip it too (the LLM still writes the steps otherwise).
 	"""
 	if not enable_planning:
 		return False, [], "planning disabled"
 
 	# Quick heuristics for obviously simple queries
-	if len(user_text.split()) < 10 and any(q in user_text.lower() for q in ["what", "how", "why", "show", "list", "?"]):
+	# maxsplit bounds the work on long requests; only "fewer than 10 words" matters.
+	if len(user_text.split(maxsplit=10)) < 10 and _QUICK_RE.search(user_text):
 		return False, [], "simple query"
+
+	if local_classifier and plan_probability(user_text) < NO_PLAN_BELOW:
+		return False, [], "local classifier"
 	
 	# Ask LLM to analyze
 	try:
 		prompt = PLANNING_PROMPT.format(user_request=user_text)
-		resp = client.chat(
-			messages=[{"role": "user", "content": prompt}],
-			tools=None,
-		)
+		messages = [{"role": "user", "content": prompt}]
+		if cache is not None:
+			key = cache.make_key(getattr(client, "model", None), messages, None)
+			resp = cache.get_or_compute(key, lambda: client.chat(messages=messages, tools=None))
+		else:
+			resp = client.chat(messages=messages, tools=None)
 		content = resp["message"].get("content", "")
 		
-		# Extract JSON
-		if "{" in content and "}" in content:
-			json_str = content[content.find("{"):content.rfind("}") + 1]
-			data = json.loads(json_str)
+		data = _extract_json_object(content or "")
+		if data is not None:
 			needs_plan = bool(data.get("needs_plan", False))
 			steps = data.get("steps", [])
 			reasoning = data.get("reasoning", "")
@@ -48,9 +89,15 @@ def should_plan(client: OpenAICompatClient, user_text: str, enable_planning: boo
 	return False, [], "planning analysis failed"
 
 
-def generate_plan(client: OpenAICompatClient, user_text: str, enable_planning: bool = True) -> Plan | None:
+def generate_plan(
+	client: OpenAICompatClient,
+	user_text: str,
+	enable_planning: bool = True,
+	cache: LLMCache | None = None,
+	local_classifier: bool = False,
+) -> Plan | None:
 	"""Generate a plan for the user's request."""
-	needs_plan, steps, _reasoning = should_plan(client, user_text, enable_planning)
+	needs_plan, steps, _reasoning = should_plan(client, user_text, enable_planning, cache, local_classifier)
 	
 	if not needs_plan or not steps:
 		return None
@@ -58,5 +105,28 @@ def generate_plan(client: OpenAICompatClient, user_text: str, enable_planning: b
 	plan = Plan(
 		steps=[PlanStep(description=s) for s in steps],
 		approved=False,
+		goal=user_text,
 	)
 	return plan
+
+
+def adapt_plan(client: OpenAICompatClient, user_text: str, previous_request: str, previous_steps: list[str]) -> Plan | None:
+	"""Ask the LLM to adapt a known-good plan to a similar new request.
+
+	Cheaper than a full decomposition: the model edits a short list instead of
+	planning from scratch. Returns None if the reply can't be used.
+	"""
+	prompt = ADAPT_PLAN_PROMPT.format(
+		previous_request=previous_request,
+		previous_steps="\n".join(f"- {s}" for s in previous_steps),
+		user_request=user_text,
+	)
+	try:
+		resp = client.chat(messages=[{"role": "user", "content": prompt}], tools=None)
+		data = _extract_json_object(resp["message"].get("content", "") or "")
+	except Exception:
+		return None
+	steps = data.get("steps") if data is not None else None
+	if not isinstance(steps, list) or not steps:
+		return None
+	return Plan(steps=[PlanStep(description=str(s)) for s in steps], approved=False, goal=user_text)
@@ -0,0 +1,87 @@
+"""Local (no-LLM) estimate of whether a request needs a multi-step plan.
+
+A hand-weighted logistic score over content words and a few shape features.
+It only needs to be confident on the clear cases: `should_plan` trusts it to
+skip the LLM when a plan is unlikely and asks the LLM about everything else.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+
+from ..similarity import word_counts
+
+# Probability below which the request is treated as "no plan" without asking the LLM.
+NO_PLAN_BELOW = 0.35
+
+_BIAS = -1.0
+
+# Words that point at multi-step work (+) or at a single lookup/edit (-).
+_WEIGHTS: dict[str, float] = {
+	"refactor": 1.5,
+	"restructure": 2.0,
+	"migrate": 2.0,
+	"migration": 1.5,
+	"rewrite": 1.5,
+	"port": 1.2,
+	"implement": 1.2,
+	"integrate": 1.2,
+	"design": 1.0,
+	"feature": 0.8,
+	"pipeline": 0.8,
+	"split": 0.8,
+	"build": 0.6,
+	"add": 0.4,
+	"update": 0.4,
+	"replace": 0.5,
+	"support": 0.5,
+	"across": 1.5,
+	"multiple": 1.2,
+	"several": 1.0,
+	"every": 0.8,
+	"all": 0.6,
+	"codebase": 1.0,
+	"modules": 1.0,
+	"components": 1.0,
+	"packages": 0.8,
+	"files": 0.8,
+	"repository": 0.6,
+	"repo": 0.6,
+	"tests": 0.5,
+	"then": 0.8,
+	"also": 0.5,
+	"explain": -1.5,
+	"describe": -1.2,
+	"mean": -1.0,
+	"where": -1.0,
+	"which": -0.8,
+	"typo": -2.0,
+	"show": -1.0,
+	"print": -0.8,
+	"list": -0.8,
+	"read": -0.8,
+	"find": -0.5,
+	"quick": -1.0,
+	"just": -0.8,
+	"only": -0.6,
+	"single": -1.0,
+	"one": -0.5,
+	"line": -0.8,
+	"comment": -0.8,
+	"docstring": -0.6,
+	"variable": -0.5,
+}
+
+# Separators that usually split a request into several asks.
+_CLAUSE_RE = re.compile(r"[,;]|\n\s*(?:[-*]|\d+[.)])\s")
+
+
+def plan_probability(user_text: str) -> float:
+	"""Estimated probability in (0, 1) that `user_text` needs a plan."""
+	counts = word_counts(user_text)
+	score = _BIAS + sum(_WEIGHTS.get(w, 0.0) * n for w, n in counts.items())
+	# Longer requests and ones listing several clauses tend to be multi-step.
+	score += min(max(len(user_text.split()) - 12, 0) * 0.04, 1.5)
+	score += min(len(_CLAUSE_RE.findall(user_text)) * 0.3, 1.2)
+	return 1.0 / (1.0 + math.exp(-score))
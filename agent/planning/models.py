@@ -5,19 +5,20 @@ from __future__ import annotations
 from dataclasses import dataclass, field
 
 
-@dataclass
+@dataclass(slots=True)
 class PlanStep:
 	"""Represents a single step in an execution plan."""
 	description: str
 	completed: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class Plan:
 	"""Multi-step execution plan."""
 	steps: list[PlanStep] = field(default_factory=list)
 	current_step_idx: int = 0
 	approved: bool = False
+	goal: str = ""  # The user request the plan was made for
 
 	def mark_current_complete(self) -> None:
 		"""Mark current step as completed and advance."""
@@ -57,3 +58,20 @@ Does NOT need a plan if:
 - Quick lookup/search
 - 1-2 trivial steps
 """
+
+ADAPT_PLAN_PROMPT = """A previous, similar request was completed with this plan:
+
+Previous request: {previous_request}
+Previous steps:
+{previous_steps}
+
+Adapt the steps for the new request below. Keep steps that still apply, rewrite ones that need new
+names/paths, and drop or add steps as needed.
+
+New request: {user_request}
+
+Respond with JSON only:
+{{
+  "steps": ["step 1", "step 2", ...]
+}}
+"""
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 import atexit
-import shlex
 import os
+import re
+import shlex
+import sys
+from collections.abc import Callable
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-import re
 
 from .agent_loop import Agent, AgentConfig, Plan
 from .history import HistoryStore
@@ -34,6 +37,8 @@ _READLINE_ENABLED = False
 
 
 _ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+# Characters that make shlex.split differ from str.split.
+_SHLEX_SPECIAL = frozenset("\"'\\")
 
 
 def _readline_safe_prompt(prompt: str) -> str:
@@ -44,7 +49,13 @@ def _readline_safe_prompt(prompt: str) -> str:
 	"""
 	if not supports_color():
 		return prompt
-	# Wrap each ANSI SGR sequence.
+	return _wrap_ansi(prompt)
+
+
+@lru_cache(maxsize=8)
+def _wrap_ansi(prompt: str) -> str:
+	# Wrap each ANSI SGR sequence. The prompt only changes with the theme, so this
+	# runs once per distinct prompt rather than once per input line.
 	return _ANSI_RE.sub(lambda m: "\001" + m.group(0) + "\002", prompt)
 
 
@@ -111,7 +122,7 @@ Type anything else to chat.
 def run_repl(*, agent_config: AgentConfig | None = None, history_path: str | None = None) -> None:
 	cfg = ReplConfig(history_path=history_path or ReplConfig().history_path)
 	_setup_readline(history_path=cfg.repl_history_path)
-	history = HistoryStore(cfg.history_path)
+	history = HistoryStore(cfg.history_path, background=True)
 	
 	# UI/theme setup first (needed for callback)
 	theme = run_onboarding(ui_config_path=cfg.ui_config_path)
@@ -125,7 +136,16 @@ def run_repl(*, agent_config: AgentConfig | None = None, history_path: str | Non
 			print(render_plan_banner(agent.current_plan, theme))
 			print()
 	
-	agent = Agent(history=history, config=agent_config, ui_callback=update_plan_banner)
+	def print_text_delta(text: str) -> None:
+		sys.stdout.write(text)
+		sys.stdout.flush()
+
+	agent = Agent(
+		history=history,
+		config=agent_config,
+		ui_callback=update_plan_banner,
+		on_text_delta=print_text_delta if agent_config is not None and agent_config.stream else None,
+	)
 
 	# Display banner
 	agent_cfg = getattr(agent, "config", None)
@@ -141,8 +161,9 @@ def run_repl(*, agent_config: AgentConfig | None = None, history_path: str | Non
 
 	while True:
 		try:
-			prompt = theme.a("> ") if supports_color() else "> "
-			if _READLINE_ENABLED and supports_color():
+			color = supports_color()
+			prompt = theme.a("> ") if color else "> "
+			if _READLINE_ENABLED and color:
 				prompt = _readline_safe_prompt(prompt)
 			raw = input(prompt).rstrip("\n")
 		except (EOFError, KeyboardInterrupt):
@@ -184,6 +205,11 @@ def run_repl(*, agent_config: AgentConfig | None = None, history_path: str | Non
 					print(theme.err("\n✗ Plan cancelled"))
 					continue
 		
+		if getattr(agent, "last_response_streamed", False):
+			# The answer was already printed token by token; just end the line.
+			print()
+			continue
+
 		# In debug mode, tool traces and the final rendered answer can visually run together.
 		# Add a clear separator before printing the final response.
 		agent_cfg = getattr(agent, "config", None)
@@ -193,47 +219,81 @@ def run_repl(*, agent_config: AgentConfig | None = None, history_path: str | Non
 		print(render_markdown(answer, theme))
 
 
-def _handle_command(raw: str, agent: Agent, history: HistoryStore, cfg: ReplConfig) -> bool:
-	parts = shlex.split(raw)
-	cmd = parts[0]
+def _cmd_exit(args: list[str], agent: Agent, history: HistoryStore, cfg: ReplConfig) -> bool:
+	return True
 
-	if cmd == "/exit":
-		return True
-	if cmd == "/help":
-		print(HELP_TEXT)
-		return False
-	if cmd == "/reset":
-		agent.reset()
-		print("(context reset)")
-		return False
-	if cmd == "/context":
-		print(agent.dump_context())
-		return False
-	if cmd == "/tools":
-		as_json = len(parts) > 1 and parts[1].lower() == "json"
-		print(agent.dump_tools(as_json=as_json))
-		return False
-	if cmd == "/history":
-		n = 10
-		if len(parts) > 1:
-			try:
-				n = int(parts[1])
-			except ValueError:
-				print("usage: /history [n]")
-				return False
-		print(history.tail(n))
-		return False
-	if cmd == "/clear":
-		clear_screen()
-		return False
-	if cmd == "/theme":
-		# Allow changing theme even if onboarding is disabled.
-		os.environ.pop("AGENT_NO_ONBOARDING", None)
-		new_theme = run_onboarding(ui_config_path=cfg.ui_config_path)
-		ui_cfg = load_ui_config(cfg.ui_config_path)
-		ui_cfg["theme"] = new_theme.id
-		save_ui_config(cfg.ui_config_path, ui_cfg)
-		return False
 
-	print("unknown command; try /help")
+def _cmd_help(args: list[str], agent: Agent, history: HistoryStore, cfg: ReplConfig) -> bool:
+	print(HELP_TEXT)
+	return False
+
+
+def _cmd_reset(args: list[str], agent: Agent, history: HistoryStore, cfg: ReplConfig) -> bool:
+	agent.reset()
+	print("(context reset)")
+	return False
+
+
+def _cmd_context(args: list[str], agent: Agent, history: HistoryStore, cfg: ReplConfig) -> bool:
+	print(agent.dump_context())
+	return False
+
+
+def _cmd_tools(args: list[str], agent: Agent, history: HistoryStore, cfg: ReplConfig) -> bool:
+	as_json = bool(args) and args[0].lower() == "json"
+	print(agent.dump_tools(as_json=as_json))
+	return False
+
+
+def _cmd_history(args: list[str], agent: Agent, history: HistoryStore, cfg: ReplConfig) -> bool:
+	n = 10
+	if args:
+		try:
+			n = int(args[0])
+		except ValueError:
+			print("usage: /history [n]")
+			return False
+	print(history.tail(n))
+	return False
+
+
+def _cmd_clear(args: list[str], agent: Agent, history: HistoryStore, cfg: ReplConfig) -> bool:
+	clear_screen()
+	return False
+
+
+def _cmd_theme(args: list[str], agent: Agent, history: HistoryStore, cfg: ReplConfig) -> bool:
+	# Allow changing theme even if onboarding is disabled.
+	os.environ.pop("AGENT_NO_ONBOARDING", None)
+	new_theme = run_onboarding(ui_config_path=cfg.ui_config_path)
+	ui_cfg = load_ui_config(cfg.ui_config_path)
+	ui_cfg["theme"] = new_theme.id
+	save_ui_config(cfg.ui_config_path, ui_cfg)
 	return False
+
+
+# Command word -> (handler, whether it takes arguments). A handler returns True to exit the REPL.
+_HANDLERS: dict[str, tuple[Callable[[list[str], Agent, HistoryStore, ReplConfig], bool], bool]] = {
+	"/exit": (_cmd_exit, False),
+	"/help": (_cmd_help, False),
+	"/reset": (_cmd_reset, False),
+	"/context": (_cmd_context, False),
+	"/tools": (_cmd_tools, True),
+	"/history": (_cmd_history, True),
+	"/clear": (_cmd_clear, False),
+	"/theme": (_cmd_theme, False),
+}
+
+
+def _handle_command(raw: str, agent: Agent, history: HistoryStore, cfg: ReplConfig) -> bool:
+	word, *rest = raw.split(None, 1)
+	entry = _HANDLERS.get(word)
+	if entry is None:
+		print("unknown command; try /help")
+		return False
+	handler, takes_args = entry
+	args: list[str] = []
+	if takes_args and rest:
+		# Without quotes or escapes shlex would just split on whitespace; skip the lexer.
+		args = shlex.split(rest[0]) if _SHLEX_SPECIAL.intersection(rest[0]) else rest[0].split()
+	return handler(args, agent, history, cfg)
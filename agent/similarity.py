@@ -0,0 +1,72 @@
+"""Cheap lexical text similarity (bag-of-words cosine; no embeddings)."""
+
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+# Words with their inner dots, slashes and dashes ("config.py", "src/app", "v1.2").
+_TOKEN_RE = re.compile(r"[\w./-]*\w")
+
+# Function words carry no meaning for "is this the same request?".
+_STOPWORDS = frozenset(
+	"a an and are as at be by can do for from how i in is it me my of on or please should that the this to "
+	"we what with you your".split()
+)
+
+
+def word_counts(text: str) -> Counter[str]:
+	"""Lowercased content-word counts of `text`."""
+	return Counter(w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS)
+
+
+def cosine(a: Counter[str], b: Counter[str]) -> float:
+	if not a or not b:
+		return 0.0
+	if len(a) > len(b):
+		a, b = b, a
+	dot = sum(n * b.get(w, 0) for w, n in a.items())
+	if not dot:
+		return 0.0
+	norm = math.sqrt(sum(n * n for n in a.values())) * math.sqrt(sum(n * n for n in b.values()))
+	return dot / norm
+
+
+def text_similarity(a: str, b: str) -> float:
+	"""Similarity of two texts in [0, 1]; 1.0 means the same content words."""
+	return cosine(word_counts(a), word_counts(b))
+
+
+def fact_tokens(text: str) -> frozenset[str]:
+	"""Tokens a summary must not lose: numbers, paths and dotted names."""
+	return frozenset(t for t in _TOKEN_RE.findall(text) if "/" in t or "." in t or any(c.isdigit() for c in t))
+
+
+@lru_cache(maxsize=256)
+def _cached_features(text: str) -> tuple[Counter[str], frozenset[str]]:
+	# Shared between callers: treat the result as read-only.
+	return word_counts(text), fact_tokens(text)
+
+
+def dedupe_similar(texts: list[str], threshold: float = 0.85) -> list[str]:
+	"""Drop restatements of earlier texts.
+
+	Greedy clustering in input order: a text joins the first earlier cluster it
+	is at least `threshold` similar to and shares exactly the same numbers and
+	paths with ("3 tests failed" never merges with "0 tests failed"). Each
+	cluster keeps its latest member, at the position where the cluster first
+	appeared.
+	"""
+	kept: list[tuple[str, Counter[str], frozenset[str]]] = []
+	for text in texts:
+		counts, facts = _cached_features(text)
+		for i, (_, rep_counts, rep_facts) in enumerate(kept):
+			if facts == rep_facts and cosine(counts, rep_counts) >= threshold:
+				kept[i] = (text, counts, facts)
+				break
+		else:
+			kept.append((text, counts, facts))
+	return [text for text, _, _ in kept]
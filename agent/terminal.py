@@ -1,18 +1,115 @@
 from __future__ import annotations
 
+import atexit
 import json
 import os
+import selectors
 import subprocess
 import time
 import uuid
+from collections import deque
 from dataclasses import dataclass
-from typing import Any, TextIO
+from typing import IO, Any
+
+from .jsonutil import dumps
+
+# Shell output is read in chunks of this size rather than line by line.
+_READ_CHUNK = 64 * 1024
+
+# Minimum number of log lines kept in memory per polled background process.
+_TAIL_KEEP = 200
 
 
 class TerminalError(Exception):
 	pass
 
 
+def _read_bytes(path: str, offset: int = 0) -> bytes | None:
+	"""Contents of `path` from `offset` on, or None if it does not exist.
+
+	Uses raw fd reads (open, fstat, read) rather than an exists() check plus a
+	buffered text file, since the log/status files are polled repeatedly. A file
+	now shorter than `offset` (truncated) is read from the start instead.
+	"""
+	try:
+		fd = os.open(path, os.O_RDONLY)
+	except FileNotFoundError:
+		return None
+	try:
+		size = os.fstat(fd).st_size
+		if 0 < offset <= size:
+			os.lseek(fd, offset, os.SEEK_SET)
+			size -= offset
+		elif offset:
+			raise _Truncated
+		chunks = []
+		while True:
+			# One read normally covers the file; keep going if it grew meanwhile.
+			chunk = os.read(fd, max(size, _READ_CHUNK))
+			if not chunk:
+				break
+			chunks.append(chunk)
+		return b"".join(chunks)
+	finally:
+		os.close(fd)
+
+
+# Linux exposes per-process state (and a start time that tells a reused PID apart) in /proc.
+_HAS_PROC = os.path.exists("/proc/self/stat")
+# How long a live PID's recorded start time is trusted before /proc is read again.
+# Reuse needs the process to exit and the PID space to wrap, which takes far longer.
+_PID_RECHECK_S = 2.0
+
+
+def _proc_stat(pid: int) -> tuple[str, int] | None:
+	"""(state, start time) of `pid` from /proc/<pid>/stat, or None if there is no such process."""
+	data = _read_bytes(f"/proc/{pid}/stat")
+	if not data:
+		return None
+	# The command name may itself contain spaces or parentheses; fields resume after the last ")".
+	fields = data[data.rfind(b")") + 2 :].split()
+	try:
+		return fields[0].decode("ascii"), int(fields[19])
+	except (IndexError, ValueError):
+		return None
+
+
+class _Truncated(Exception):
+	"""The file got shorter than the offset it was being read from."""
+
+
+@dataclass
+class _LogTail:
+	"""The last lines of a background log, advanced by reading only what was appended."""
+
+	lines: deque[str]
+	offset: int = 0
+	# Bytes after the last newline read so far.
+	partial: bytes = b""
+
+	def update(self, path: str) -> None:
+		try:
+			data = _read_bytes(path, self.offset)
+		except _Truncated:
+			self.lines.clear()
+			self.offset, self.partial = 0, b""
+			data = _read_bytes(path)
+		if not data:
+			return
+		self.offset += len(data)
+		data = self.partial + data
+		cut = data.rfind(b"\n") + 1
+		if cut:
+			self.lines.extend(data[:cut].decode("utf-8", errors="replace").splitlines())
+		self.partial = data[cut:]
+
+	def tail(self, n: int) -> list[str]:
+		lines = list(self.lines)
+		if self.partial:
+			lines.append(self.partial.decode("utf-8", errors="replace"))
+		return lines[-n:] if n > 0 else []
+
+
 @dataclass
 class BackgroundProcess:
 	process_id: str
@@ -48,21 +145,56 @@ class TerminalManager:
 			self.state_dir = os.path.abspath(os.path.join(self.workdir, state_dir))
 		self.shell_path = shell_path
 
-		self._proc: subprocess.Popen[str] | None = None
-		self._stdin: TextIO | None = None
-		self._stdout: TextIO | None = None
-
-		self._index_path = os.path.join(self.state_dir, "proc", "index.json")
+		self._proc: subprocess.Popen[bytes] | None = None
+		self._stdin: IO[bytes] | None = None
+		self._stdout: IO[bytes] | None = None
+		# Shell output read but not yet consumed (e.g. lines after an end marker).
+		self._buf = bytearray()
+		# Watches the shell's stdout so reads never block past a deadline.
+		self._selector: selectors.BaseSelector | None = None
+
+		# Append-only: one JSON object per started process, read once into `_index_cache`.
+		self._index_path = os.path.join(self.state_dir, "proc", "index.jsonl")
+		# Whole-list index written by older versions; still read so their processes stay known.
+		self._legacy_index_path = os.path.join(self.state_dir, "proc", "index.json")
+		self._index_cache: dict[str, dict[str, Any]] | None = None
+		# The log ends in a partial line; the next append must start on a fresh line.
+		self._index_torn = False
+		# The index holds legacy or damaged data; `flush_index` rewrites it cleanly.
+		self._index_needs_rewrite = False
+		# Lines appended since the last `flush_index` that may not be on disk yet.
+		self._index_unsynced = False
+		# In-memory log tails of polled background processes, by process_id.
+		self._tails: dict[str, _LogTail] = {}
+		# Start time of each background PID when first seen, and when it was last
+		# confirmed (monotonic), to detect PID reuse.
+		self._liveness: dict[int, tuple[int, float]] = {}
+		# `close` is registered with atexit while there is a shell or index to clean up.
+		self._exit_hooked = False
 
 	def close(self) -> None:
+		"""Sync (and compact) the process index and stop the shell; also runs at exit."""
+		if self._exit_hooked:
+			atexit.unregister(self.close)
+			self._exit_hooked = False
+		try:
+			self.flush_index()
+		except OSError:
+			pass
+
 		proc = self._proc
 		stdin = self._stdin
 		stdout = self._stdout
+		selector = self._selector
 
 		self._proc = None
 		self._stdin = None
 		self._stdout = None
+		self._selector = None
+		self._buf.clear()
 
+		if selector:
+			selector.close()
 		try:
 			if stdin:
 				stdin.close()
@@ -85,9 +217,15 @@ class TerminalManager:
 				except Exception:
 					pass
 
+	def _hook_exit(self) -> None:
+		if not self._exit_hooked:
+			atexit.register(self.close)
+			self._exit_hooked = True
+
 	def _ensure_shell(self) -> None:
 		if self._proc and self._proc.poll() is None:
 			return
+		self._hook_exit()
 
 		os.makedirs(os.path.join(self.state_dir, "proc"), exist_ok=True)
 		# Start a persistent shell. We avoid -i to reduce prompt/noise.
@@ -96,13 +234,20 @@ class TerminalManager:
 			stdin=subprocess.PIPE,
 			stdout=subprocess.PIPE,
 			stderr=subprocess.STDOUT,
-			text=True,
-			bufsize=1,
+			# Binary pipes with a block buffer: each command goes out in one write+flush,
+			# and output is read in chunks by `_read_chunk`, never through line buffering.
+			text=False,
+			bufsize=_READ_CHUNK,
 		)
 		assert self._proc.stdin is not None
 		assert self._proc.stdout is not None
 		self._stdin = self._proc.stdin  # type: ignore[assignment]
 		self._stdout = self._proc.stdout  # type: ignore[assignment]
+		self._buf.clear()
+		if self._selector:
+			self._selector.close()
+		self._selector = selectors.DefaultSelector()
+		self._selector.register(self._stdout.fileno(), selectors.EVENT_READ)
 
 		# Set initial working directory.
 		self._write_line(f'cd "{self.workdir}"')
@@ -182,128 +327,220 @@ class TerminalManager:
 		log_path = info["log_path"]
 		status_path = info["status_path"]
 
-		output = ""
-		if os.path.exists(log_path):
-			with open(log_path, "r", encoding="utf-8", errors="replace") as f:
-				lines = f.read().splitlines()
-				if tail_lines is not None:
-					lines = lines[-tail_lines:]
-				output = "\n".join(lines)
+		if tail_lines is None:
+			data = _read_bytes(log_path)
+			output = "\n".join(data.decode("utf-8", errors="replace").splitlines()) if data else ""
+		else:
+			# Repeated polls read only what the process appended since the last one.
+			tail = self._tails.get(process_id)
+			if tail is None or (tail.lines.maxlen or 0) < tail_lines:
+				tail = self._tails[process_id] = _LogTail(deque(maxlen=max(tail_lines, _TAIL_KEEP)))
+			tail.update(log_path)
+			output = "\n".join(tail.tail(tail_lines))
 
 		exit_code = None
-		if os.path.exists(status_path):
+		status = _read_bytes(status_path)
+		if status is not None:
 			try:
-				with open(status_path, "r", encoding="utf-8") as f:
-					exit_code = int(f.read().strip())
-			except Exception:
+				exit_code = int(status)
+			except ValueError:
 				exit_code = None
 
-		running = True
-		try:
-			os.kill(int(info["pid"]), 0)
-		except OSError:
-			running = False
-
+		# A status file means the process finished; only probe the PID otherwise.
 		done = exit_code is not None
+		running = not done and self._pid_alive(int(info["pid"]))
 		return {
 			"ok": True,
 			"process_id": process_id,
 			"pid": info["pid"],
-			"running": running and not done,
+			"running": running,
 			"exit_code": exit_code,
 			"output": output,
 		}
 
+	def _pid_alive(self, pid: int) -> bool:
+		# One syscall per poll; /proc is read only to record the start time, or to
+		# re-confirm it once it is older than _PID_RECHECK_S.
+		try:
+			os.kill(pid, 0)
+		except OSError:
+			return False
+		if not _HAS_PROC:
+			return True
+		now = time.monotonic()
+		seen = self._liveness.get(pid)
+		if seen is not None and now - seen[1] < _PID_RECHECK_S:
+			return True
+		st = _proc_stat(pid)
+		if st is None or st[0] in {"Z", "X"}:
+			return False
+		if seen is not None and seen[0] != st[1]:
+			# A different start time means the PID now belongs to another process.
+			return False
+		self._liveness[pid] = (st[1], now)
+		return True
+
 	def list_processes(self) -> dict[str, Any]:
 		return {"ok": True, "processes": self._index_all()}
 
 	def _write_line(self, s: str) -> None:
 		assert self._stdin is not None
-		self._stdin.write(s + "\n")
+		self._stdin.write((s + "\n").encode("utf-8"))
 		self._stdin.flush()
 
-	def _read_until_end_marker(self, end_marker_prefix: str, *, timeout_s: int) -> tuple[list[str], int]:
-		assert self._stdout is not None
-		start_time = time.time()
-		out_lines: list[str] = []
-		exit_code: int | None = None
+	def _read_chunk(self, deadline: float) -> bool:
+		"""Append the next chunk of shell output to the buffer.
 
+		Waits at most until `deadline` (a `time.monotonic()` value) and returns False
+		if no output arrived by then.
+		"""
+		assert self._stdout is not None and self._selector is not None
+		remaining = deadline - time.monotonic()
+		if remaining <= 0 or not self._selector.select(remaining):
+			return False
+		chunk = os.read(self._stdout.fileno(), _READ_CHUNK)
+		if not chunk:
+			raise TerminalError("Shell terminated unexpectedly")
+		self._buf += chunk
+		return True
+
+	def _read_marker_line(self, marker: str, *, timeout_s: int, timeout_msg: str) -> tuple[bytes, bytes]:
+		"""Read until a complete line containing `marker`.
+
+		Returns the output before the marker and the rest of the marker's line;
+		anything after that line stays buffered for the next read.
+		"""
+		needle = marker.encode("utf-8")
+		buf = self._buf
+		deadline = time.monotonic() + timeout_s
+		scan_from = 0
 		while True:
-			if time.time() - start_time > timeout_s:
-				raise TerminalError(f"Timeout waiting for command to finish ({timeout_s}s)")
-
-			line = self._stdout.readline()
-			if line == "":
-				raise TerminalError("Shell terminated unexpectedly")
-			line = line.rstrip("\n")
+			idx = buf.find(needle, scan_from)
+			if idx >= 0:
+				nl = buf.find(b"\n", idx)
+				if nl >= 0:
+					before = bytes(buf[:idx])
+					rest = bytes(buf[idx + len(needle) : nl])
+					del buf[: nl + 1]
+					return before, rest
+			else:
+				# Only the tail can still hold the start of a marker split across chunks.
+				scan_from = max(0, len(buf) - len(needle) + 1)
+			if not self._read_chunk(deadline):
+				raise TerminalError(timeout_msg)
 
-			if line.startswith(end_marker_prefix + ":"):
-				try:
-					exit_code = int(line.split(":", 1)[1])
-				except Exception:
-					exit_code = 0
-				break
-
-			# Skip the start marker line if it somehow appears in output
-			if line.startswith("__AGENT_CMD_START__"):
-				continue
-
-			out_lines.append(line)
+	def _read_until_end_marker(self, end_marker_prefix: str, *, timeout_s: int) -> tuple[list[str], int]:
+		before, rest = self._read_marker_line(
+			end_marker_prefix + ":",
+			timeout_s=timeout_s,
+			timeout_msg=f"Timeout waiting for command to finish ({timeout_s}s)",
+		)
+		try:
+			exit_code = int(rest)
+		except ValueError:
+			exit_code = 0
 
-		return out_lines, int(exit_code or 0)
+		# Decode once; skip the start marker line if it somehow appears in output.
+		text = before.decode("utf-8", errors="replace")
+		out_lines = [line for line in text.splitlines() if not line.startswith("__AGENT_CMD_START__")]
+		return out_lines, exit_code
 
 	def _read_bg_pid(self, marker_prefix: str, *, timeout_s: int) -> int:
-		assert self._stdout is not None
-		start_time = time.time()
-		while True:
-			if time.time() - start_time > timeout_s:
-				raise TerminalError("Timeout waiting for background PID")
-			line = self._stdout.readline()
-			if line == "":
-				raise TerminalError("Shell terminated unexpectedly")
-			line = line.strip()
-			if line.startswith(marker_prefix + ":PID:"):
-				pid_s = line.split(":PID:", 1)[1]
-				return int(pid_s)
+		_, rest = self._read_marker_line(
+			marker_prefix + ":PID:", timeout_s=timeout_s, timeout_msg="Timeout waiting for background PID"
+		)
+		return int(rest)
 
 	def _drain_nonblocking(self, max_seconds: float) -> None:
-		# Best-effort: read a little if available. We avoid selectors for simplicity.
-		# This is only used at startup.
-		assert self._stdout is not None
-		end = time.time() + max_seconds
-		self._stdout.flush()
-		while time.time() < end:
-			# readline() will block, so don't do it. We just break.
-			break
+		"""Discard whatever the shell prints within `max_seconds` (startup noise)."""
+		deadline = time.monotonic() + max_seconds
+		while self._read_chunk(deadline):
+			pass
+		self._buf.clear()
 
-	def _index_all(self) -> list[dict[str, Any]]:
-		if not os.path.exists(self._index_path):
-			return []
+	def _load_index(self) -> dict[str, dict[str, Any]]:
+		if self._index_cache is not None:
+			return self._index_cache
+		self._hook_exit()
+		cache: dict[str, dict[str, Any]] = {}
+		try:
+			with open(self._legacy_index_path, "r", encoding="utf-8") as f:
+				legacy = json.load(f)
+			for item in legacy if isinstance(legacy, list) else []:
+				if isinstance(item, dict) and item.get("process_id"):
+					cache[item["process_id"]] = item
+			self._index_needs_rewrite = True
+		except (OSError, ValueError):
+			pass
 		try:
 			with open(self._index_path, "r", encoding="utf-8") as f:
-				return json.load(f)
-		except Exception:
-			return []
+				line = ""
+				for line in f:
+					try:
+						item = json.loads(line)
+					except ValueError:
+						# A partial last line from an interrupted write.
+						self._index_needs_rewrite = True
+						continue
+					if isinstance(item, dict) and item.get("process_id"):
+						cache[item["process_id"]] = item
+				self._index_torn = bool(line) and not line.endswith("\n")
+		except OSError:
+			pass
+		self._index_cache = cache
+		return cache
+
+	def _index_all(self) -> list[dict[str, Any]]:
+		return list(self._load_index().values())
 
 	def _index_put(self, proc: BackgroundProcess) -> None:
-		items = self._index_all()
-		items.append(
-			{
-				"process_id": proc.process_id,
-				"pid": proc.pid,
-				"command": proc.command,
-				"cwd": proc.cwd,
-				"log_path": proc.log_path,
-				"status_path": proc.status_path,
-				"started_at": proc.started_at,
-			}
-		)
+		item = {
+			"process_id": proc.process_id,
+			"pid": proc.pid,
+			"command": proc.command,
+			"cwd": proc.cwd,
+			"log_path": proc.log_path,
+			"status_path": proc.status_path,
+			"started_at": proc.started_at,
+		}
+		cache = self._load_index()
 		os.makedirs(os.path.dirname(self._index_path), exist_ok=True)
-		with open(self._index_path, "w", encoding="utf-8") as f:
-			json.dump(items, f, indent=2)
+		with open(self._index_path, "a", encoding="utf-8") as f:
+			f.write(("\n" if self._index_torn else "") + dumps(item) + "\n")
+		self._index_torn = False
+		self._index_unsynced = True
+		cache[proc.process_id] = item
+
+	def flush_index(self) -> None:
+		"""Make the process index durable (called by `close`, so also at exit).
+
+		Appends are not fsynced one by one; this syncs them in one go. An index
+		that held torn lines or came from the legacy index.json is first rewritten
+		from memory into a temp file and swapped in with `os.replace`, so a crash
+		leaves either the old or the new file, never a partial one.
+		"""
+		if self._index_cache is None:
+			return
+		if self._index_needs_rewrite:
+			# No makedirs: if the state directory is gone there is nothing to compact.
+			tmp = self._index_path + ".tmp"
+			with open(tmp, "w", encoding="utf-8") as f:
+				f.writelines(dumps(item) + "\n" for item in self._index_cache.values())
+				f.flush()
+				os.fsync(f.fileno())
+			os.replace(tmp, self._index_path)
+			try:
+				os.unlink(self._legacy_index_path)
+			except FileNotFoundError:
+				pass
+			self._index_needs_rewrite = self._index_torn = False
+		elif self._index_unsynced:
+			fd = os.open(self._index_path, os.O_RDONLY)
+			try:
+				os.fsync(fd)
+			finally:
+				os.close(fd)
+		self._index_unsynced = False
 
 	def _index_get(self, process_id: str) -> dict[str, Any] | None:
-		for item in self._index_all():
-			if item.get("process_id") == process_id:
-				return item
-		return None
+		return self._load_index().get(process_id)
@@ -2,20 +2,149 @@
 
 from __future__ import annotations
 
+import itertools
+import json
+import mmap
 import os
 import re
-from dataclasses import dataclass
+import stat
+import uuid
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Any
 
-from ..patches import apply_v4a_patch
 from ..diffs import unified_diff
+from ..jsonutil import dumps_canonical
+from ..patches import apply_v4a_patch
 from ..terminal import TerminalManager
 
+# Threads scanning files for grep_search (file reads release the GIL). Files go
+# out in batches to keep per-task overhead low, and the in-flight window keeps
+# results in walk order without listing the whole tree first.
+_GREP_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+_GREP_BATCH = 16
+_GREP_WINDOW = _GREP_WORKERS * 2
+
+# Directories grep_search never descends into.
+_GREP_SKIP_DIRS = frozenset({".git", "node_modules", "__pycache__", ".agent"})
+# Files larger than this, or with a NUL byte in their first _GREP_SNIFF bytes, are not searched.
+_GREP_MAX_BYTES = 16 * 1024 * 1024
+_GREP_SNIFF = 512
+
+# Tools that only inspect the workspace; a batch of these may run concurrently.
+# The process tools are left out: they share the lazily created TerminalManager
+# and its per-process log tails, which are not thread-safe.
+READ_ONLY_TOOLS = frozenset({"read_file", "list_dir", "grep_search", "create_diff"})
+
+
+def _scan_file(path: str, rx: re.Pattern[str], limit: int, literal: bytes | None = None) -> list[tuple[int, str]]:
+	"""Up to `limit` (line number, line text) pairs of lines in `path` matching `rx`.
+
+	`rx` is matched against each decoded line, without its line ending, so the
+	pattern means the same as in a line-by-line text scan. When the pattern is a
+	plain string, pass it as `literal`: the memory-mapped bytes are then searched
+	with `find`, and only matching lines are counted and decoded.
+	Empty, oversized, and binary files yield no hits.
+	"""
+	hits: list[tuple[int, str]] = []
+	with open(path, "rb") as f:
+		size = os.fstat(f.fileno()).st_size
+		if size == 0 or size > _GREP_MAX_BYTES:
+			return hits
+		with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+			if mm.find(b"\0", 0, _GREP_SNIFF) >= 0:
+				return hits
+			if literal is None:
+				text = mm[:].decode("utf-8", errors="replace").removesuffix("\n")
+				for lineno, line in enumerate(text.split("\n"), start=1):
+					line = line.removesuffix("\r")
+					if rx.search(line):
+						hits.append((lineno, line))
+						if len(hits) >= limit:
+							break
+				return hits
+			pos = 0
+			lineno = 1
+			counted = 0
+			while pos <= size and len(hits) < limit:
+				start = mm.find(literal, pos)
+				if start < 0:
+					break
+				line_start = mm.rfind(b"\n", 0, start) + 1
+				line_end = mm.find(b"\n", start)
+				if line_end < 0:
+					line_end = size
+				lineno += mm[counted:line_start].count(b"\n")
+				counted = line_start
+				text = mm[line_start:line_end].removesuffix(b"\r")
+				hits.append((lineno, text.decode("utf-8", errors="replace")))
+				# One hit per line, like a line-by-line scan.
+				pos = line_end + 1
+	return hits
+
+
+@lru_cache(maxsize=256)
+def _compile_grep(pattern: str) -> tuple[re.Pattern[str], bytes | None]:
+	"""The regex for a grep pattern, plus its UTF-8 bytes when it is a plain string."""
+	rx = re.compile(pattern)
+	# Patterns without metacharacters (the common case) are found with a plain substring search.
+	literal = pattern.encode("utf-8") if pattern and re.escape(pattern) == pattern else None
+	return rx, literal
+
+
+def _walk_files(root: str) -> Iterator[str]:
+	"""Paths of the files under `root`, in `os.walk` (top-down) order.
+
+	`os.scandir` entries carry their type, so classifying them needs no extra
+	stat calls; symlinked directories are listed but not followed.
+	"""
+	try:
+		with os.scandir(root) as it:
+			subdirs: list[str] = []
+			for entry in it:
+				try:
+					is_dir = entry.is_dir()
+				except OSError:
+					is_dir = False
+				if not is_dir:
+					yield entry.path
+				elif entry.name not in _GREP_SKIP_DIRS and not entry.is_symlink():
+					subdirs.append(entry.path)
+	except OSError:
+		return
+	for sub in subdirs:
+		yield from _walk_files(sub)
+
+
+def _scan_files(
+	paths: list[str], rx: re.Pattern[str], limit: int, literal: bytes | None = None
+) -> list[tuple[str, list[tuple[int, str]]]]:
+	"""`_scan_file` over a batch, skipping unreadable files and stopping after `limit` hits."""
+	out: list[tuple[str, list[tuple[int, str]]]] = []
+	for path in paths:
+		try:
+			hits = _scan_file(path, rx, limit, literal)
+		except (OSError, ValueError):
+			continue
+		if hits:
+			out.append((path, hits))
+			limit -= len(hits)
+			if limit <= 0:
+				break
+	return out
+
 
 @dataclass
 class ToolRegistry:
 	"""Registry for available tools and their execution."""
 	terminal: TerminalManager | None = None
+	_schemas: list[dict[str, Any]] | None = field(default=None, init=False, repr=False)
+	_schemas_json: str | None = field(default=None, init=False, repr=False)
+	# Per tool: (required argument names, schema defaults), derived from the schemas.
+	_arg_specs: dict[str, tuple[tuple[str, ...], dict[str, Any]]] | None = field(default=None, init=False, repr=False)
 
 	def _terminal(self) -> TerminalManager:
 		if self.terminal is None:
@@ -23,6 +152,59 @@ class ToolRegistry:
 		return self.terminal
 
 	def tool_schemas(self) -> list[dict[str, Any]]:
+		"""Return the tool schemas; built once and shared, so treat the result as read-only."""
+		if self._schemas is None:
+			self._schemas = self._build_tool_schemas()
+		return self._schemas
+
+	def tool_schemas_json(self) -> str:
+		"""Canonical (sorted-key, compact) JSON of `tool_schemas()`, serialized once.
+
+		The same bytes every time, so it doubles as a fingerprint of the tool block
+		that providers prefix-cache.
+		"""
+		if self._schemas_json is None:
+			self._schemas_json = dumps_canonical(self.tool_schemas())
+		return self._schemas_json
+
+	def invalidate_schema_cache(self) -> None:
+		"""Drop cached schemas (call after changing the set of available tools)."""
+		self._schemas = None
+		self._schemas_json = None
+		self._arg_specs = None
+
+	def _argument_specs(self) -> dict[str, tuple[tuple[str, ...], dict[str, Any]]]:
+		if self._arg_specs is None:
+			specs: dict[str, tuple[tuple[str, ...], dict[str, Any]]] = {}
+			for item in self.tool_schemas():
+				fn = (item or {}).get("function") or {}
+				name = fn.get("name")
+				if not name:
+					continue
+				params = fn.get("parameters") or {}
+				props = params.get("properties") or {}
+				defaults = {k: p["default"] for k, p in props.items() if isinstance(p, dict) and "default" in p}
+				specs[name] = (tuple(params.get("required") or ()), defaults)
+			self._arg_specs = specs
+		return self._arg_specs
+
+	def decode_arguments(self, name: str, raw: Any) -> dict[str, Any]:
+		"""Turn a tool call's `arguments` (JSON string, dict, or empty) into a dict.
+
+		Arguments that don't decode to a JSON object come back as `{"_raw": raw}`,
+		which `execute` reports as invalid.
+		"""
+		if isinstance(raw, dict):
+			return raw
+		if not raw:
+			return {}
+		try:
+			args = json.loads(raw)
+		except (TypeError, json.JSONDecodeError):
+			return {"_raw": raw}
+		return args if isinstance(args, dict) else {"_raw": raw}
+
+	def _build_tool_schemas(self) -> list[dict[str, Any]]:
 		# OpenAI function-tool schema
 		return [
 			{
@@ -153,7 +335,20 @@ class ToolRegistry:
 			},
 		]
 
+	def is_read_only(self, name: str) -> bool:
+		return name in READ_ONLY_TOOLS
+
 	def execute(self, name: str, args: dict[str, Any]) -> dict[str, Any]:
+		spec = self._argument_specs().get(name)
+		if spec is not None:
+			required, defaults = spec
+			if "_raw" in args and len(args) == 1:
+				return {"ok": False, "error": f"Invalid JSON arguments for {name}: {args['_raw']!r}"}
+			missing = [k for k in required if k not in args]
+			if missing:
+				return {"ok": False, "error": f"Missing required argument(s) for {name}: {', '.join(missing)}"}
+			if defaults:
+				args = {**defaults, **args}
 		try:
 			if name == "read_file":
 				return self._read_file(args)
@@ -183,14 +378,17 @@ class ToolRegistry:
 		end = args.get("end_line")
 		end_i = int(end) if end is not None else None
 
-		with open(path, "r", encoding="utf-8") as f:
-			lines = f.read().splitlines()
-
 		start_idx = max(start - 1, 0)
-		end_idx = end_i if end_i is not None else len(lines)
-		end_idx = min(end_idx, len(lines))
-		selected = lines[start_idx:end_idx]
-		return {"ok": True, "path": path, "start_line": start, "end_line": end_i or len(lines), "content": "\n".join(selected)}
+		# Stream up to end_line instead of reading and splitting the whole file.
+		with open(path, "r", encoding="utf-8") as f:
+			if end_i is None:
+				lines = f.readlines()
+				end_i = len(lines)
+				selected = lines[start_idx:]
+			else:
+				selected = list(itertools.islice(f, start_idx, max(end_i, start_idx)))
+		content = "".join(selected).removesuffix("\n")
+		return {"ok": True, "path": path, "start_line": start, "end_line": end_i, "content": content}
 
 	def _list_dir(self, args: dict[str, Any]) -> dict[str, Any]:
 		path = args["path"]
@@ -204,33 +402,78 @@ class ToolRegistry:
 		root = args.get("root", ".")
 		pattern = args["pattern"]
 		max_results = int(args.get("max_results", 20) or 20)
-		rx = re.compile(pattern)
+		rx, literal = _compile_grep(pattern)
+
+		def batches():
+			batch: list[str] = []
+			for full in _walk_files(root):
+				batch.append(full)
+				if len(batch) >= _GREP_BATCH:
+					yield batch
+					batch = []
+			if batch:
+				yield batch
 
 		results: list[dict[str, Any]] = []
-		for dirpath, dirnames, filenames in os.walk(root):
-			# skip common noisy dirs
-			dirnames[:] = [d for d in dirnames if d not in {".git", "node_modules", "__pycache__", ".agent"}]
-			for fn in filenames:
-				full = os.path.join(dirpath, fn)
-				try:
-					with open(full, "r", encoding="utf-8") as f:
-						for i, line in enumerate(f, start=1):
-							if rx.search(line):
-								results.append({"path": full, "line": i, "text": line.rstrip("\n")})
-								if len(results) >= max_results:
-									return {"ok": True, "pattern": pattern, "results": results}
-				except Exception:
-					continue
+		pending: deque[Future[list[tuple[str, list[tuple[int, str]]]]]] = deque()
+
+		def collect() -> bool:
+			"""Take the oldest batch's hits; True once max_results is reached."""
+			for full, hits in pending.popleft().result():
+				results.extend({"path": full, "line": i, "text": text} for i, text in hits[: max_results - len(results)])
+				if len(results) >= max_results:
+					return True
+			return False
+
+		# Batches are scanned ahead in parallel, but hits are taken in walk order,
+		# so the results match a sequential search.
+		pool = ThreadPoolExecutor(max_workers=_GREP_WORKERS, thread_name_prefix="grep")
+		try:
+			for batch in batches():
+				pending.append(pool.submit(_scan_files, batch, rx, max_results, literal))
+				if len(pending) >= _GREP_WINDOW and collect():
+					break
+			else:
+				while pending and not collect():
+					pass
+		finally:
+			pool.shutdown(wait=False, cancel_futures=True)
 
 		return {"ok": True, "pattern": pattern, "results": results}
 
 	def _write_file(self, args: dict[str, Any]) -> dict[str, Any]:
 		path = args["path"]
-		content = args["content"]
-		os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-		with open(path, "w", encoding="utf-8") as f:
-			f.write(content)
-		return {"ok": True, "path": path, "bytes": len(content.encode("utf-8"))}
+		data = args["content"].encode("utf-8")
+		# Write through a symlink to the file it points at rather than replacing the link.
+		target = os.path.realpath(path) if os.path.islink(path) else path
+		parent = os.path.dirname(target) or "."
+		os.makedirs(parent, exist_ok=True)
+		try:
+			mode: int | None = stat.S_IMODE(os.stat(target).st_mode)
+		except FileNotFoundError:
+			mode = None
+
+		# Write a sibling temp file and rename it into place, so readers never see a
+		# partial file. New files get the usual 0o666 & ~umask permissions.
+		tmp = os.path.join(parent, f".{os.path.basename(target)}.{uuid.uuid4().hex[:8]}.tmp")
+		fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+		try:
+			try:
+				if mode is not None:
+					os.fchmod(fd, mode)
+				view = memoryview(data)
+				while view:
+					view = view[os.write(fd, view) :]
+			finally:
+				os.close(fd)
+			os.replace(tmp, target)
+		except BaseException:
+			try:
+				os.unlink(tmp)
+			except OSError:
+				pass
+			raise
+		return {"ok": True, "path": path, "bytes": len(data)}
 
 	def _apply_patch(self, args: dict[str, Any]) -> dict[str, Any]:
 		patch = args["patch"]
@@ -240,12 +483,19 @@ class ToolRegistry:
 	def _create_diff(self, args: dict[str, Any]) -> dict[str, Any]:
 		path = args["path"]
 		new_content = args["new_content"]
-		old = ""
 		try:
-			with open(path, "r", encoding="utf-8") as f:
-				old = f.read()
+			with open(path, "rb") as f:
+				data = f.read()
 		except FileNotFoundError:
-			old = ""
+			data = b""
+		# Unchanged content (the common case) needs neither a decode nor a diff;
+		# bytes equality compares lengths first.
+		if data == new_content.encode("utf-8"):
+			return {"ok": True, "path": path, "diff": ""}
+		old = data.decode("utf-8")
+		if "\r" in old:
+			# Same newline translation as reading in text mode.
+			old = old.replace("\r\n", "\n").replace("\r", "\n")
 		d = unified_diff(path, old, new_content)
 		return {"ok": True, "path": path, "diff": d}
 
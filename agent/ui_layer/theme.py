@@ -2,45 +2,76 @@ from __future__ import annotations
 
 import json
 import os
+import re
 import shutil
+import signal
 import sys
 from dataclasses import dataclass
+from functools import cached_property, lru_cache
 from typing import Any
 
+# Any CSI escape sequence (colors, cursor movement, ...).
+_ANSI_RE = re.compile(r"\x1b\[[0-?]*[ -/]*[@-~]")
+# `code` or [text](url), whichever starts first.
+_CODE_OR_LINK_RE = re.compile(r"`([^`]*)`|\[([^\]]*)\]\(([^)]*)\)")
+# **bold** (possibly empty), then *italic* whose text neither starts nor ends with whitespace.
+_BOLD_RE = re.compile(r"\*\*(.*?)\*\*")
+_ITALIC_RE = re.compile(r"\*([^\s*](?:[^*]*[^\s*])?)\*")
+# What the plain-mode renderer would change: inline code/link/emphasis
+# characters, line breaks other than "\n" (splitlines normalizes them), and
+# lines opening a heading, quote or list ("\w" because list numbers are checked
+# with str.isdigit()). Line starts are found via "\n": a MULTILINE "^" is
+# tried at every position and is several times slower.
+_MD_INLINE_CHARS = "`*[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+_MD_FIRST_BLOCK_RE = re.compile(r"\s*(?:[#>]|- |\w+\. )")
+_MD_NEXT_BLOCK_RE = re.compile(r"\n\s*(?:[#>]|- |\w+\. )")
+
 
 def _isatty() -> bool:
+	return _streams_are_tty(sys.stdin, sys.stdout)
+
+
+def _stream_is_tty(stream: Any) -> bool:
 	try:
-		return bool(sys.stdin.isatty() and sys.stdout.isatty())
+		fd = stream.fileno()
+	except (AttributeError, OSError, ValueError):
+		# No usable fd (StringIO, some IDE consoles): take the stream's own answer.
+		return bool(stream.isatty())
+	return os.isatty(fd)
+
+
+@lru_cache(maxsize=1)
+def _streams_are_tty(stdin: Any, stdout: Any) -> bool:
+	# Keyed on the stream objects so redirected/replaced streams are re-probed; one
+	# entry, so a replaced stream is not kept alive past the next probe.
+	try:
+		return _stream_is_tty(stdin) and _stream_is_tty(stdout)
 	except Exception:
 		return False
 
 
 def supports_color() -> bool:
-	if os.environ.get("NO_COLOR") is not None:
-		return False
-	if os.environ.get("TERM", "") == "dumb":
+	# The environment is re-read (cheap dict lookups, and tests patch it); the TTY
+	# probe, which costs syscalls, is cached per stream pair.
+	environ = os.environ
+	if "NO_COLOR" in environ or environ.get("TERM") == "dumb":
 		return False
 	return _isatty()
 
 
+_CLEAR_SCREEN = "\033[2J\033[H"
+
+
 def clear_screen() -> None:
 	# ANSI clear screen + move cursor to home.
 	if _isatty():
-		print("\033[2J\033[H", end="")
+		print(_CLEAR_SCREEN, end="")
 
 
-def _ansi(code: str) -> str:
-	if not supports_color():
-		return ""
-	return code
-
-
-def _bold(s: str) -> str:
-	return f"{_ansi('\033[1m')}{s}{_ansi('\033[0m')}" if supports_color() else s
-
-
-def _underline(s: str) -> str:
-	return f"{_ansi('\033[4m')}{s}{_ansi('\033[0m')}" if supports_color() else s
+def _write_frame(frame: str) -> None:
+	# A whole screen in one write: no partial frames, no flicker between clear and redraw.
+	sys.stdout.write(_CLEAR_SCREEN + frame)
+	sys.stdout.flush()
 
 
 @dataclass(frozen=True)
@@ -55,28 +86,37 @@ class Theme:
 	error: str
 	reset: str = "\033[0m"
 
-	def _wrap(self, s: str, code: str) -> str:
-		if not supports_color():
-			return s
-		return f"{code}{s}{self.reset}"
-
 	def b(self, s: str) -> str:
-		return self._wrap(s, self.border)
+		return f"{self.border}{s}{self.reset}" if supports_color() else s
 
 	def a(self, s: str) -> str:
-		return self._wrap(s, self.accent)
+		return f"{self.accent}{s}{self.reset}" if supports_color() else s
 
 	def d(self, s: str) -> str:
-		return self._wrap(s, self.dim)
+		return f"{self.dim}{s}{self.reset}" if supports_color() else s
 
 	def t(self, s: str) -> str:
-		return self._wrap(s, self.text)
+		return f"{self.text}{s}{self.reset}" if supports_color() else s
 
 	def ok(self, s: str) -> str:
-		return self._wrap(s, self.success)
+		return f"{self.success}{s}{self.reset}" if supports_color() else s
 
 	def err(self, s: str) -> str:
-		return self._wrap(s, self.error)
+		return f"{self.error}{s}{self.reset}" if supports_color() else s
+
+	# Styled fragments `render_markdown` puts on many lines, built once per theme
+	# (color mode only; plain output uses the bare text).
+	@cached_property
+	def _bullet_prefix(self) -> str:
+		return f"{self.accent}•{self.reset} "
+
+	@cached_property
+	def _quote_prefix(self) -> str:
+		return f"{self.dim}│ {self.reset}"
+
+	@cached_property
+	def _code_prefix(self) -> str:
+		return f"{self.dim}  "
 
 
 THEMES: list[Theme] = [
@@ -142,6 +182,8 @@ THEMES: list[Theme] = [
 	),
 ]
 
+_THEME_INDEX_BY_ID: dict[str, int] = {t.id: i for i, t in enumerate(THEMES)}
+
 
 def render_app_banner(theme: Theme) -> str:
 	"""Large ASCII banner, inspired by modern CLI onboarding.
@@ -209,118 +251,113 @@ def render_plan_banner(plan: Any, theme: Theme) -> str:
 
 
 def get_theme(theme_id: str | None) -> Theme:
-	if theme_id:
-		for t in THEMES:
-			if t.id == theme_id:
-				return t
-	return THEMES[0]
+	return THEMES[_THEME_INDEX_BY_ID.get(theme_id, 0)] if theme_id else THEMES[0]
+
+
+# Terminal width, cached until the window is resized (SIGWINCH).
+_TERM_WIDTH: int | None = None
+_SIGWINCH_HOOKED = False
+
+
+def _on_sigwinch(signum: int, frame: Any, previous: Any = None) -> None:
+	global _TERM_WIDTH
+	_TERM_WIDTH = None
+	if callable(previous):
+		previous(signum, frame)
+
+
+def _hook_sigwinch() -> None:
+	global _SIGWINCH_HOOKED
+	_SIGWINCH_HOOKED = True
+	sigwinch = getattr(signal, "SIGWINCH", None)
+	if sigwinch is None:
+		return
+	try:
+		previous = signal.getsignal(sigwinch)
+		signal.signal(sigwinch, lambda signum, frame: _on_sigwinch(signum, frame, previous))
+	except ValueError:
+		# Not the main thread: without the hook, don't trust a cached width.
+		_SIGWINCH_HOOKED = False
 
 
 def _term_width(default: int = 80) -> int:
+	global _TERM_WIDTH
+	if _TERM_WIDTH is not None:
+		return _TERM_WIDTH
+	if not _SIGWINCH_HOOKED:
+		_hook_sigwinch()
 	try:
-		return shutil.get_terminal_size((default, 24)).columns
+		width = shutil.get_terminal_size((default, 24)).columns
 	except Exception:
 		return default
+	if _SIGWINCH_HOOKED:
+		_TERM_WIDTH = width
+	return width
 
 
 def _box(lines: list[str], *, theme: Theme, pad_x: int = 1) -> str:
-	width = max((len(_strip_ansi(l)) for l in lines), default=0)
+	# Visible width of each line, measured once.
+	widths = [len(_strip_ansi(l)) for l in lines]
+	width = max(widths, default=0)
 	inner_w = width + pad_x * 2
 	top = theme.b("┌" + "─" * inner_w + "┐")
 	bot = theme.b("└" + "─" * inner_w + "┘")
+	# Border and left padding are the same on every line.
+	side = theme.b("│")
+	left = side + " " * pad_x
 	out = [top]
-	for l in lines:
-		pad = " " * pad_x
-		plain_len = len(_strip_ansi(l))
-		out.append(theme.b("│") + pad + l + " " * (inner_w - plain_len - pad_x) + theme.b("│"))
+	for l, plain_len in zip(lines, widths):
+		out.append(f"{left}{l}{' ' * (inner_w - plain_len - pad_x)}{side}")
 	out.append(bot)
 	return "\n".join(out)
 
 
 def _strip_ansi(s: str) -> str:
-	# Tiny ANSI stripper for width calculations.
-	out = []
-	i = 0
-	while i < len(s):
-		if s[i] == "\033" and i + 1 < len(s) and s[i + 1] == "[":
-			i += 2
-			while i < len(s) and s[i] != "m":
-				i += 1
-			i += 1
-			continue
-		out.append(s[i])
-		i += 1
-	return "".join(out)
+	# ANSI stripper for width calculations; plain lines skip the regex.
+	return _ANSI_RE.sub("", s) if "\x1b" in s else s
+
+
+# Replacement templates for emphasis, styled and plain.
+_BOLD_SUB = "\033[1m\\1\033[0m"
+_ITALIC_SUB = "\033[4m\\1\033[0m"
+_PLAIN_SUB = r"\1"
 
 
-def _render_inlines(s: str, theme: Theme) -> str:
+def _render_inlines(s: str, theme: Theme, color: bool) -> str:
 	"""Very small inline markdown renderer.
 
 	Handles:
 	- `code`
 	- **bold** and *italic* (stripped or styled)
 	- [text](url)
-	"""
-	# Links: [text](url) -> text (url)
-	out: list[str] = []
-	i = 0
-	while i < len(s):
-		# Inline code `...`
-		if s[i] == "`":
-			j = s.find("`", i + 1)
-			if j != -1:
-				code = s[i + 1 : j]
-				styled = theme.a(code) if supports_color() else f"`{code}`"
-				out.append(styled)
-				i = j + 1
-				continue
-		# Link [text](url)
-		if s[i] == "[":
-			j = s.find("]", i + 1)
-			k = s.find("(", j + 1) if j != -1 else -1
-			m = s.find(")", k + 1) if k != -1 else -1
-			if j != -1 and k == j + 1 and m != -1:
-				text = s[i + 1 : j]
-				url = s[k + 1 : m]
-				out.append(text)
-				if url:
-					out.append(" ")
-					out.append(theme.d(f"({url})") if supports_color() else f"({url})")
-				i = m + 1
-				continue
-		out.append(s[i])
-		i += 1
 
-	res = "".join(out)
+	`color` is the caller's supports_color(), read once per render.
+	"""
+	res = s
+	if "`" in s or "[" in s:
+
+		def code_or_link(m: re.Match[str]) -> str:
+			code = m[1]
+			if code is not None:
+				return f"{theme.accent}{code}{theme.reset}" if color else f"`{code}`"
+			# Links: [text](url) -> text (url)
+			text, url = m[2], m[3]
+			if not url:
+				return text
+			return f"{text} {theme.dim}({url}){theme.reset}" if color else f"{text} ({url})"
+
+		res = _CODE_OR_LINK_RE.sub(code_or_link, s)
+
+	# Bold/italic: styled when color is on, otherwise just unwrapped. A lone or
+	# whitespace-flanked '*' (list marker, multiplication) is left alone.
+	if "*" in res:
+		res = _BOLD_RE.sub(_BOLD_SUB if color else _PLAIN_SUB, res)
+		res = _ITALIC_RE.sub(_ITALIC_SUB if color else _PLAIN_SUB, res)
+	return res
 
-	# Bold/italic: apply simple stripping first to avoid complex nesting.
-	# **bold**
-	while "**" in res:
-		start = res.find("**")
-		end = res.find("**", start + 2)
-		if end == -1:
-			break
-		inner = res[start + 2 : end]
-		repl = _bold(inner) if supports_color() else inner
-		res = res[:start] + repl + res[end + 2 :]
-
-	# *italic* (only when surrounded by non-space; best-effort)
-	while "*" in res:
-		start = res.find("*")
-		end = res.find("*", start + 1)
-		if end == -1:
-			break
-		inner = res[start + 1 : end]
-		if not inner or inner.strip() != inner:
-			# Likely list marker or whitespace emphasis; skip this '*'
-			res = res[:start] + "\u0001" + res[start + 1 :]
-			continue
-		repl = _underline(inner) if supports_color() else inner
-		res = res[:start] + repl + res[end + 1 :]
 
-	# Restore skipped asterisks
-	res = res.replace("\u0001", "*")
-	return res
+# Texts longer than this are rendered without going through the cache.
+_RENDER_CACHE_MAX_CHARS = 64 * 1024
 
 
 def render_markdown(text: str, theme: Theme) -> str:
@@ -329,50 +366,107 @@ def render_markdown(text: str, theme: Theme) -> str:
 	This is intentionally lightweight (stdlib-only). It's designed for LLM responses:
 	headings, lists, blockquotes, code fences, and basic inlines.
 	"""
+	color = supports_color()
+	if not color and not _has_markdown(text):
+		# Plain prose renders to itself, less trailing whitespace.
+		return text.rstrip() + ("\n" if text.endswith("\n") else "")
+	if len(text) > _RENDER_CACHE_MAX_CHARS:
+		return _render_markdown(text, theme, color)
+	# The output depends only on (text, theme, color mode); repaints and repeated
+	# debug output are served from the cache.
+	return _render_markdown_cached(text, theme, color)
+
+
+def _has_markdown(text: str) -> bool:
+	"""Whether plain-mode rendering could change `text` beyond trailing whitespace."""
+	return (
+		any(c in text for c in _MD_INLINE_CHARS)
+		or _MD_FIRST_BLOCK_RE.match(text) is not None
+		or _MD_NEXT_BLOCK_RE.search(text) is not None
+	)
+
+
+@lru_cache(maxsize=256)
+def _render_markdown_cached(text: str, theme: Theme, color: bool) -> str:
+	return _render_markdown(text, theme, color)
+
+
+@lru_cache(maxsize=64)
+def _fence_label(code_lang: str, theme: Theme, color: bool) -> str:
+	# Fence labels repeat (a handful of languages per transcript): build each once.
+	label = f"code ({code_lang})" if code_lang else "code"
+	return f"{theme.dim}{label}{theme.reset}\n" if color else f"{label}\n"
+
+
+def _fence_end(lines: list[str], start: int) -> int:
+	"""Index of the first fence line (```...) at or after `start`, or len(lines)."""
+	for i in range(start, len(lines)):
+		line = lines[i]
+		# The substring test (C speed) rules out almost every line before the strip.
+		if "```" in line and line.lstrip().startswith("```"):
+			return i
+	return len(lines)
+
+
+def _render_markdown(text: str, theme: Theme, color: bool) -> str:
 	lines = text.splitlines()
-	out_lines: list[str] = []
-	in_code = False
-	code_lang = ""
+	# Flat buffer of fragments with explicit newlines, so prefixes and content
+	# are never concatenated into throwaway intermediate strings.
+	out: list[str] = []
+	push = out.append
+	n = len(lines)
+	i = 0
 
-	for raw in lines:
-		line = raw.rstrip("\n")
+	while i < n:
+		line = lines[i]
+		i += 1
 		stripped = line.strip()
 
-		# Fenced code blocks
+		# Fenced code block: emitted verbatim, with a small indent, in one piece.
 		if stripped.startswith("```"):
-			if not in_code:
-				in_code = True
-				code_lang = stripped[3:].strip()
-				label = f"code" + (f" ({code_lang})" if code_lang else "")
-				out_lines.append(theme.d(label) if supports_color() else label)
-			else:
-				in_code = False
-				code_lang = ""
-				out_lines.append("")
-			continue
-
-		if in_code:
-			# Preserve code verbatim, with a small indent.
-			out_lines.append(theme.d("  " + line) if supports_color() else "  " + line)
+			push(_fence_label(stripped[3:].strip(), theme, color))
+			end = _fence_end(lines, i)
+			if end > i:
+				code = lines[i:end]
+				if color:
+					push(theme._code_prefix)
+					push(f"{theme.reset}\n{theme._code_prefix}".join(code))
+					push(theme.reset)
+				else:
+					push("  ")
+					push("\n  ".join(code))
+				push("\n")
+			if end < n:
+				# The closing fence becomes a blank line.
+				push("\n")
+			i = end + 1
 			continue
 
 		# Headings: #, ##, ###...
 		if stripped.startswith("#"):
 			hash_count = len(stripped) - len(stripped.lstrip("#"))
 			head = stripped[hash_count:].strip()
-			head = _render_inlines(head, theme)
-			head_line = theme.a(_bold(head) if supports_color() else head)
-			out_lines.append(head_line)
-			if not supports_color():
-				out_lines.append("-" * max(len(head), 3))
+			head = _render_inlines(head, theme, color)
+			if color:
+				push(theme.accent)
+				push("\033[1m")
+				push(head)
+				push("\033[0m")
+				push(theme.reset)
+				push("\n")
+			else:
+				push(head)
+				push("\n")
+				push("-" * max(len(head), 3))
+				push("\n")
 			continue
 
 		# Blockquote
 		if stripped.startswith(">"):
 			q = stripped[1:].lstrip()
-			q = _render_inlines(q, theme)
-			prefix = theme.d("│ ") if supports_color() else "| "
-			out_lines.append(prefix + q)
+			push(theme._quote_prefix if color else "| ")
+			push(_render_inlines(q, theme, color))
+			push("\n")
 			continue
 
 		# Lists: -, *, 1.
@@ -389,15 +483,34 @@ def render_markdown(text: str, theme: Theme) -> str:
 				content = stripped[dot + 2 :]
 
 		if bullet is not None and content is not None:
-			content = _render_inlines(content, theme)
-			b = theme.a(bullet) if supports_color() else bullet
-			out_lines.append(f"{b} {content}")
+			if not color:
+				push(bullet)
+				push(" ")
+			elif bullet == "•":
+				push(theme._bullet_prefix)
+			else:
+				push(theme.accent)
+				push(bullet)
+				push(theme.reset)
+				push(" ")
+			push(_render_inlines(content, theme, color))
+			push("\n")
 			continue
 
 		# Normal paragraph/text
-		out_lines.append(_render_inlines(line, theme))
-
-	return "\n".join(out_lines).rstrip() + ("\n" if text.endswith("\n") else "")
+		push(_render_inlines(line, theme, color))
+		push("\n")
+
+	# Trailing whitespace (including the newline after the last line) is trimmed
+	# on the fragments: rstrip() and "+" on the joined text would each copy it
+	# again, which for long transcripts is most of the peak memory.
+	while out and (not out[-1] or out[-1].isspace()):
+		out.pop()
+	if out:
+		out[-1] = out[-1].rstrip()
+	if text.endswith("\n"):
+		push("\n")
+	return "".join(out)
 
 
 def render_theme_screen(*, theme: Theme, selected_index: int) -> str:
@@ -448,13 +561,21 @@ def render_preview(theme: Theme) -> str:
 
 
 def load_ui_config(path: str) -> dict[str, Any]:
+	try:
+		st = os.stat(path)
+	except OSError:
+		return {}
+	# Parsed once per (path, mtime, size); callers get their own copy to mutate.
+	return dict(_load_ui_config_cached(path, st.st_mtime_ns, st.st_size))
+
+
+@lru_cache(maxsize=4)
+def _load_ui_config_cached(path: str, mtime_ns: int, size: int) -> dict[str, Any]:
 	try:
 		with open(path, "r", encoding="utf-8") as f:
 			data = json.load(f)
 		if isinstance(data, dict):
 			return data
-	except FileNotFoundError:
-		return {}
 	except Exception:
 		return {}
 	return {}
@@ -462,15 +583,26 @@ def load_ui_config(path: str) -> dict[str, Any]:
 
 def save_ui_config(path: str, data: dict[str, Any]) -> None:
 	os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-	with open(path, "w", encoding="utf-8") as f:
-		json.dump(data, f, indent=2, sort_keys=True)
-		f.write("\n")
+	payload = json.dumps(data, indent=2, sort_keys=True) + "\n"
+	# One write to a temp file, then an atomic rename: a crash never leaves a torn config.
+	tmp = f"{path}.{os.getpid()}.tmp"
+	try:
+		with open(tmp, "w", encoding="utf-8") as f:
+			f.write(payload)
+		os.replace(tmp, path)
+	except BaseException:
+		try:
+			os.unlink(tmp)
+		except OSError:
+			pass
+		raise
+	_load_ui_config_cached.cache_clear()
 
 
 def run_onboarding(*, ui_config_path: str) -> Theme:
 	cfg = load_ui_config(ui_config_path)
 	theme = get_theme(cfg.get("theme"))
-	selected = next((i for i, t in enumerate(THEMES) if t.id == theme.id), 0)
+	selected = _THEME_INDEX_BY_ID.get(theme.id, 0)
 
 	# Skip onboarding in non-interactive contexts.
 	if os.environ.get("AGENT_NO_ONBOARDING") is not None or not _isatty():
@@ -480,11 +612,11 @@ def run_onboarding(*, ui_config_path: str) -> Theme:
 		return theme
 
 	while True:
-		clear_screen()
 		theme = THEMES[selected]
-		print(render_theme_screen(theme=theme, selected_index=selected))
+		prompt = theme.a("> ") if supports_color() else "> "
+		_write_frame(render_theme_screen(theme=theme, selected_index=selected) + "\n" + prompt)
 		try:
-			raw = input(theme.a("> ") if supports_color() else "> ").strip()
+			raw = input("").strip()
 		except (EOFError, KeyboardInterrupt):
 			raw = ""
 
@@ -500,8 +632,7 @@ def run_onboarding(*, ui_config_path: str) -> Theme:
 	cfg["theme"] = THEMES[selected].id
 	cfg["onboarded"] = True
 	save_ui_config(ui_config_path, cfg)
-	clear_screen()
-	print(THEMES[selected].ok("Login successful.") + " " + THEMES[selected].d("Press Enter to continue"))
+	_write_frame(THEMES[selected].ok("Login successful.") + " " + THEMES[selected].d("Press Enter to continue") + "\n")
 	try:
 		input("")
 	except (EOFError, KeyboardInterrupt):
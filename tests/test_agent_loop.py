@@ -1,17 +1,28 @@
 from __future__ import annotations
 
+import dataclasses
 import io
 import json
 import os
 import tempfile
+import threading
 import unittest
+from concurrent.futures import Future
 from contextlib import redirect_stdout
+from unittest import mock
 
-from agent.agent_loop import Agent, AgentConfig
+from agent.agent_loop import DEFAULT_SYSTEM_PROMPT, Agent, AgentConfig
 from agent.history import HistoryStore
 
 
 class TestAgentLoop(unittest.TestCase):
+	# Config is immutable and hashable so it can key caches.
+	def test_agent_config_is_frozen(self) -> None:
+		cfg = AgentConfig(model="m")
+		self.assertEqual(hash(cfg), hash(AgentConfig(model="m")))
+		with self.assertRaises(dataclasses.FrozenInstanceError):
+			cfg.debug = True  # type: ignore[misc]
+
 	# Verifies a tool call is executed and the assistant consumes the tool output.
 	def test_tool_call_round_trip(self) -> None:
 		with tempfile.TemporaryDirectory() as td:
@@ -68,6 +79,239 @@ class TestAgentLoop(unittest.TestCase):
 			out = buf.getvalue()
 			self.assertIn("[debug]", out)
 
+	# Later turns list only the messages that were not already shown.
+	def test_debug_summary_prints_only_new_messages(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			hs = HistoryStore(os.path.join(td, "h.jsonl"))
+			agent = Agent(history=hs, config=AgentConfig(debug=True, enable_planning=False))
+			agent.client.chat = lambda *, messages, tools: {"message": {"role": "assistant", "content": "hi", "tool_calls": []}}  # type: ignore[attr-defined]
+
+			with redirect_stdout(io.StringIO()):
+				agent.chat("hello")
+			buf = io.StringIO()
+			with redirect_stdout(buf):
+				agent.chat("again")
+			out = buf.getvalue()
+			self.assertNotIn("   0: ", out)
+			self.assertIn("   4: ", out)
+
+	# With speculation, round 0 overlaps the planning call and its reply is used when no plan is needed.
+	def test_speculative_first_round(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			hs = HistoryStore(os.path.join(td, "h.jsonl"))
+			cfg = AgentConfig(enable_planning=True, llm_cache=False, speculative_first_round=True)
+			agent = Agent(history=hs, config=cfg)
+			plan_reply = {"content": '{"needs_plan": false}'}
+			calls: list[str] = []
+
+			def fake_chat(*, messages, tools):
+				if tools is None:
+					calls.append("plan")
+					return {"message": plan_reply}
+				calls.append("round")
+				return {"message": {"role": "assistant", "content": "answer", "tool_calls": []}}
+
+			agent.client.chat = fake_chat  # type: ignore[attr-defined]
+			request = "rename the helper module and update every import across the whole repository"
+
+			self.assertEqual(agent.chat(request), "answer")
+			self.assertEqual(sorted(calls), ["plan", "round"])
+			self.assertEqual([m["role"] for m in agent.messages[-2:]], ["user", "assistant"])
+
+			# A plan wins: the speculative reply is dropped and the plan goes to approval.
+			agent.reset()
+			plan_reply["content"] = '{"needs_plan": true, "steps": ["a", "b"]}'
+			self.assertEqual(agent.chat(request), "__PLAN_APPROVAL_NEEDED__")
+			self.assertFalse(any(m.get("content") == "answer" for m in agent.messages))
+
+	# An abandoned speculative round is cancelled, whether a plan wins or planning fails.
+	def test_speculative_round_cancelled_when_abandoned(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			cfg = AgentConfig(enable_planning=True, llm_cache=False, speculative_first_round=True)
+			agent = Agent(history=HistoryStore(os.path.join(td, "h.jsonl")), config=cfg)
+			plan_reply = {"content": '{"needs_plan": true, "steps": ["a", "b"]}'}
+			agent.client.chat = lambda *, messages, tools: {"message": plan_reply}  # type: ignore[attr-defined]
+			pending: list[Future] = []
+
+			def start(self: Agent, user_text: str) -> Future:
+				pending.append(Future())
+				return pending[-1]
+
+			request = "rename the helper module and update every import across the whole repository"
+			with mock.patch.object(Agent, "_start_speculative_round", start):
+				self.assertEqual(agent.chat(request), "__PLAN_APPROVAL_NEEDED__")
+				self.assertTrue(pending[-1].cancelled())
+
+				agent.reset()
+				with mock.patch.object(Agent, "_generate_plan", side_effect=RuntimeError("offline")):
+					with self.assertRaises(RuntimeError):
+						agent.chat(request)
+			self.assertEqual(len(pending), 2)
+			self.assertTrue(pending[-1].cancelled())
+
+	# Past max_context_messages, older turns are folded into a single summary message.
+	def test_context_is_compacted_with_summary(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			hs = HistoryStore(os.path.join(td, "h.jsonl"))
+			agent = Agent(history=hs, config=AgentConfig(max_tool_rounds=8, enable_planning=False, max_context_messages=8))
+			agent.tools.execute = lambda name, args: {"ok": True}  # type: ignore[method-assign]
+			rounds = {"n": 0}
+
+			def fake_chat(*, messages, tools):
+				if tools is None:
+					return {"message": {"role": "assistant", "content": "listed the dir a few times", "tool_calls": []}}
+				rounds["n"] += 1
+				if rounds["n"] < 6:
+					call = {"id": f"call_{rounds['n']}", "type": "function", "function": {"name": "list_dir", "arguments": "{}"}}
+					return {"message": {"role": "assistant", "content": None, "tool_calls": [call]}}
+				return {"message": {"role": "assistant", "content": "done", "tool_calls": []}}
+
+			agent.client.chat = fake_chat  # type: ignore[attr-defined]
+
+			self.assertEqual(agent.chat("list"), "done")
+			self.assertLessEqual(len(agent.messages), 9)
+			self.assertEqual(agent.messages[0]["content"], DEFAULT_SYSTEM_PROMPT)
+			summary = agent.messages[2]
+			self.assertEqual(summary["role"], "system")
+			self.assertIn("listed the dir a few times", summary["content"])
+			self.assertNotEqual(agent.messages[3]["role"], "tool")
+
+	# With response chaining, later rounds send only new messages plus the previous response id.
+	def test_chain_responses_sends_only_delta(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			hs = HistoryStore(os.path.join(td, "h.jsonl"))
+			agent = Agent(history=hs, config=AgentConfig(max_tool_rounds=4, enable_planning=False, chain_responses=True))
+			agent.tools.execute = lambda name, args: {"ok": True}  # type: ignore[method-assign]
+			sent: list[tuple[str | None, list[dict]]] = []
+
+			def fake_chat(*, messages, tools):
+				sent.append((None, list(messages)))
+				return {
+					"message": {
+						"role": "assistant",
+						"content": None,
+						"tool_calls": [{"id": "call_1", "type": "function", "function": {"name": "list_dir", "arguments": "{}"}}],
+					},
+					"raw": {"id": "resp_1"},
+				}
+
+			def fake_chat_with_prev(messages_delta, tools, *, previous_response_id):
+				sent.append((previous_response_id, list(messages_delta)))
+				return {"message": {"role": "assistant", "content": "done", "tool_calls": []}, "raw": {"id": "resp_2"}}
+
+			agent.client.chat = fake_chat  # type: ignore[attr-defined]
+			agent.client.chat_with_prev = fake_chat_with_prev  # type: ignore[attr-defined]
+
+			self.assertEqual(agent.chat("list"), "done")
+			self.assertEqual(len(sent), 2)
+			self.assertEqual(sent[1][0], "resp_1")
+			self.assertEqual([m["role"] for m in sent[1][1]], ["tool"])
+			self.assertEqual(agent._last_response_id, "resp_2")
+
+	# Tool arguments already decoded to a dict by the provider are passed through as-is.
+	def test_tool_call_with_dict_arguments(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			hs = HistoryStore(os.path.join(td, "h.jsonl"))
+			agent = Agent(history=hs, config=AgentConfig(max_tool_rounds=4, enable_planning=False))
+			seen: list[tuple[str, dict]] = []
+			agent.tools.execute = lambda name, args: seen.append((name, args)) or {"ok": True}  # type: ignore[method-assign]
+			calls = {"n": 0}
+
+			def fake_chat(*, messages, tools):
+				calls["n"] += 1
+				if calls["n"] == 1:
+					return {
+						"message": {
+							"role": "assistant",
+							"content": None,
+							"tool_calls": [{"id": "call_1", "type": "function", "function": {"name": "list_dir", "arguments": {"path": td}}}],
+						}
+					}
+				return {"message": {"role": "assistant", "content": "done", "tool_calls": []}}
+
+			agent.client.chat = fake_chat  # type: ignore[attr-defined]
+
+			self.assertEqual(agent.chat("list"), "done")
+			self.assertEqual(seen, [("list_dir", {"path": td})])
+
+	# Read-only tool calls in one round run concurrently but are reported in call order.
+	def test_parallel_read_only_tool_calls(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			hs = HistoryStore(os.path.join(td, "h.jsonl"))
+			agent = Agent(
+				history=hs,
+				config=AgentConfig(max_tool_rounds=4, debug=False, enable_planning=False, tool_concurrency=4),
+			)
+			barrier = threading.Barrier(2, timeout=5)
+
+			def fake_execute(name, args):
+				# Both calls must be in flight at the same time to get past the barrier.
+				barrier.wait()
+				return {"ok": True, "path": args["path"]}
+
+			agent.tools.execute = fake_execute  # type: ignore[method-assign]
+			calls = {"n": 0}
+
+			def fake_chat(*, messages, tools):
+				calls["n"] += 1
+				if calls["n"] == 1:
+					return {
+						"message": {
+							"role": "assistant",
+							"content": None,
+							"tool_calls": [
+								{"id": f"call_{i}", "type": "function", "function": {"name": "read_file", "arguments": json.dumps({"path": f"p{i}"})}}
+								for i in range(2)
+							],
+						}
+					}
+				return {"message": {"role": "assistant", "content": "done", "tool_calls": []}}
+
+			agent.client.chat = fake_chat  # type: ignore[attr-defined]
+
+			self.assertEqual(agent.chat("read both"), "done")
+			tool_msgs = [m for m in agent.messages if m.get("role") == "tool"]
+			self.assertEqual([m["tool_call_id"] for m in tool_msgs], ["call_0", "call_1"])
+			self.assertEqual([json.loads(m["content"])["path"] for m in tool_msgs], ["p0", "p1"])
+
+	# A call that raises inside the pool becomes an error result; the rest of the batch still runs.
+	def test_parallel_tool_call_error_is_isolated(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			hs = HistoryStore(os.path.join(td, "h.jsonl"))
+			agent = Agent(history=hs, config=AgentConfig(enable_planning=False))
+
+			def fake_execute(name, args):
+				if args["path"] == "bad":
+					raise RuntimeError("boom")
+				return {"ok": True, "path": args["path"]}
+
+			agent.tools.execute = fake_execute  # type: ignore[method-assign]
+
+			results = agent._execute_tool_calls([("read_file", {"path": "bad"}), ("read_file", {"path": "good"})])
+			self.assertEqual(results, [{"ok": False, "error": "boom"}, {"ok": True, "path": "good"}])
+
+	# Streaming mode forwards text deltas and reports that the answer was streamed.
+	def test_stream_forwards_text_deltas(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			hs = HistoryStore(os.path.join(td, "h.jsonl"))
+			deltas: list[str] = []
+			agent = Agent(
+				history=hs,
+				config=AgentConfig(enable_planning=False, stream=True),
+				on_text_delta=deltas.append,
+			)
+
+			def fake_chat_stream(*, messages, tools):
+				yield {"type": "text_delta", "text": "he"}
+				yield {"type": "text_delta", "text": "llo"}
+				yield {"type": "done", "message": {"role": "assistant", "content": "hello", "tool_calls": []}}
+
+			agent.client.chat_stream = fake_chat_stream  # type: ignore[method-assign]
+
+			self.assertEqual(agent.chat("hi"), "hello")
+			self.assertEqual(deltas, ["he", "llo"])
+			self.assertTrue(agent.last_response_streamed)
+
 		# Confirms the guard stops after max_tool_rounds and returns a safe message.
 	def test_max_rounds_guard(self) -> None:
 		with tempfile.TemporaryDirectory() as td:
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import unittest
+
+from agent.context import ContextManager
+
+
+def _conversation() -> list[dict]:
+	msgs = [{"role": "system", "content": "sys"}, {"role": "system", "content": "session"}]
+	for i in range(4):
+		msgs.append({"role": "user", "content": f"q{i}"})
+		msgs.append({"role": "assistant", "content": None, "tool_calls": [{"id": f"c{i}", "function": {"name": "list_dir"}}]})
+		msgs.append({"role": "tool", "tool_call_id": f"c{i}", "content": "{}"})
+	return msgs
+
+
+class TestContextManagerCompact(unittest.TestCase):
+	# The head is kept verbatim and the tail never starts with an orphaned tool result.
+	def test_compact_keeps_head_and_tool_pairs(self) -> None:
+		msgs = _conversation()
+		out = ContextManager().compact(msgs, keep_head=2, keep_tail=1, summarize=lambda middle: f"{len(middle)} folded")
+		self.assertIsNotNone(out)
+		self.assertEqual(out[:2], msgs[:2])
+		self.assertEqual(out[2], {"role": "system", "content": "Prior context summary:\n10 folded"})
+		self.assertEqual([m["role"] for m in out[3:]], ["assistant", "tool"])
+
+	# Folding the same slice again reuses the earlier summary instead of calling the LLM.
+	def test_compact_caches_summary_by_slice(self) -> None:
+		calls: list[int] = []
+
+		def summarize(middle):
+			calls.append(len(middle))
+			return "summary"
+
+		cm = ContextManager()
+		cm.compact(_conversation(), keep_head=2, keep_tail=3, summarize=summarize)
+		cm.compact(_conversation(), keep_head=2, keep_tail=3, summarize=summarize)
+		self.assertEqual(len(calls), 1)
+
+	def test_compact_returns_none_when_nothing_to_fold(self) -> None:
+		msgs = _conversation()[:4]
+		self.assertIsNone(ContextManager().compact(msgs, keep_head=2, keep_tail=2, summarize=lambda m: "x"))
+
+
+
+class TestContextManagerTokens(unittest.TestCase):
+	# The size is a running total of per-message counts, kept in step with compression.
+	def test_context_size_is_incremental(self) -> None:
+		cm = ContextManager()
+		cm.add_message("system", "x" * 10)
+		for _ in range(12):
+			cm.add_message("user", "y" * 8)
+		self.assertEqual(cm.get_context_size(), 3 + 12 * 2)
+		self.assertEqual(cm.messages[1].token_count, 2)
+
+		cm.compress_context()
+		self.assertEqual(cm.get_context_size(), 3 + 10 * 2)
+
+
+	# With a summarizer the dropped middle becomes one summary; if it fails, a plain window is kept.
+	def test_compress_context_summarizes_middle(self) -> None:
+		def build(summarizer):
+			cm = ContextManager(keep_recent=2, summarizer=summarizer)
+			for i in range(6):
+				cm.add_message("user", f"m{i}")
+			return cm
+
+		cm = build(lambda middle: ",".join(m.content for m in middle))
+		out = cm.compress_context()
+		self.assertEqual([m.content for m in out], ["m0", "Prior context summary:\nm1,m2,m3", "m4", "m5"])
+		self.assertTrue(out[1].metadata["summary"])
+		self.assertEqual(cm.get_context_size(), sum(m.tokens() for m in out))
+
+		def broken(middle):
+			raise RuntimeError("offline")
+
+		self.assertEqual([m.content for m in build(broken).compress_context()], ["m0", "m4", "m5"])
+
+
+	# Exports are built once per message and rebuilt only after invalidate().
+	def test_dump_reuses_message_exports(self) -> None:
+		cm = ContextManager()
+		cm.add_message("user", "hi", {"name": "me"})
+		first = cm.dump()
+		self.assertEqual(first, [{"role": "user", "content": "hi", "name": "me"}])
+		self.assertIs(cm.dump()[0], first[0])
+
+		msg = cm.messages[0]
+		msg.content = "hello"
+		msg.invalidate()
+		self.assertEqual(cm.dump()[0]["content"], "hello")
+		self.assertEqual(msg.tokens(), 2)
+
+
+if __name__ == "__main__":
+	unittest.main()
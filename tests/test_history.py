@@ -3,7 +3,9 @@ from __future__ import annotations
 import json
 import os
 import tempfile
+import threading
 import unittest
+from unittest import mock
 
 from agent.history import HistoryStore
 
@@ -33,8 +35,100 @@ class TestHistoryStore(unittest.TestCase):
 			self.assertEqual(rec0["type"], "user")
 			self.assertEqual(rec1["type"], "assistant")
 
+	def test_batch_defers_writes_until_end(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			path = os.path.join(td, "history.jsonl")
+			hs = HistoryStore(path)
+
+			hs.begin_batch()
+			hs.append_event({"type": "user", "text": "hello"})
+			hs.append_event({"type": "assistant", "text": "hi"})
+			self.assertFalse(os.path.exists(path))
+			hs.end_batch()
+
+			with open(path, encoding="utf-8") as f:
+				types = [json.loads(l)["type"] for l in f]
+			self.assertEqual(types, ["user", "assistant"])
+
+	def test_append_event_splices_encoded_values(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			hs = HistoryStore(os.path.join(td, "history.jsonl"))
+			hs.append_event({"type": "tool_result", "name": "read_file"}, encoded={"result": json.dumps({"ok": True, "content": "é"})})
+
+			rec = json.loads(hs.tail(1))
+			self.assertEqual(rec["type"], "tool_result")
+			self.assertEqual(rec["result"], {"ok": True, "content": "é"})
+
 	def test_tail_empty(self) -> None:
 		with tempfile.TemporaryDirectory() as td:
 			path = os.path.join(td, "missing.jsonl")
 			hs = HistoryStore(path)
 			self.assertEqual(hs.tail(10), "(no history yet)")
+
+	# The backward block scan returns the same lines as reading the whole file.
+	def test_tail_reads_backwards_across_blocks(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			path = os.path.join(td, "history.jsonl")
+			hs = HistoryStore(path)
+			lines = [f"line {i} é\n" for i in range(20)]
+			for body in ("".join(lines), "".join(lines) + "partial"):
+				with open(path, "w", encoding="utf-8") as f:
+					f.write(body)
+				with open(path, "r", encoding="utf-8") as f:
+					expected = f.readlines()
+				with mock.patch("agent.history._TAIL_BLOCK", 7):
+					for n in (1, 3, 20, 50):
+						self.assertEqual(hs.tail(n), "".join(expected[-n:]))
+
+	# The background writer keeps order, and flush/tail/close wait for it.
+	def test_background_writer(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			path = os.path.join(td, "sub", "history.jsonl")
+			hs = HistoryStore(path, background=True)
+			for i in range(50):
+				hs.append_event({"type": "user", "text": str(i)})
+			lines = hs.tail(50).splitlines()
+			self.assertEqual([json.loads(l)["text"] for l in lines], [str(i) for i in range(50)])
+			hs.append_event({"type": "user", "text": "last"})
+			hs.close()
+			self.assertFalse(any(t.name == "history-writer" and t.is_alive() for t in threading.enumerate()))
+			with open(path, encoding="utf-8") as f:
+				self.assertEqual(len(f.readlines()), 51)
+
+	# A failing write is reported by flush; the writer survives it, and nothing hangs.
+	def test_background_writer_survives_errors(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			hs = HistoryStore(os.path.join(td, "history.jsonl"), background=True)
+			with mock.patch.object(hs, "_open_append", side_effect=RuntimeError("boom")):
+				hs.append_event({"type": "user", "text": "lost"})
+				with self.assertRaises(RuntimeError):
+					hs.flush()
+			# Lone surrogates (non-UTF-8 file names) are stored as JSON escapes.
+			hs.append_event({"type": "tool_result", "name": "caf\udce9.txt"})
+			self.assertEqual(json.loads(hs.tail(1))["name"], "caf\udce9.txt")
+			hs.close()
+
+	# Ending a batch queues its lines without waiting; a writer error shows up on the next append.
+	def test_end_batch_does_not_wait_for_writer(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			hs = HistoryStore(os.path.join(td, "history.jsonl"), background=True)
+			with mock.patch.object(hs._queue, "join", side_effect=AssertionError("joined")):
+				hs.begin_batch()
+				hs.append_event({"type": "user", "text": "one"})
+				hs.end_batch()
+			self.assertEqual(json.loads(hs.tail(1))["text"], "one")
+			hs._writer_error = RuntimeError("boom")
+			with self.assertRaises(RuntimeError):
+				hs.append_event({"type": "user", "text": "two"})
+			hs.close()
+
+	# The directory is created on first write and recreated if it disappears later.
+	def test_write_recreates_missing_directory(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			path = os.path.join(td, "sub", "history.jsonl")
+			hs = HistoryStore(path)
+			hs.append_event({"type": "user", "text": "one"})
+			os.remove(path)
+			os.rmdir(os.path.dirname(path))
+			hs.append_event({"type": "user", "text": "two"})
+			self.assertEqual(json.loads(hs.tail(1))["text"], "two")
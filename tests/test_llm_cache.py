@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+
+from agent.llm_cache import LLMCache
+from agent.planning import generate_plan
+
+
+class TestLLMCache(unittest.TestCase):
+	# Keys depend on model, messages and tool names, not on tool order.
+	def test_make_key(self) -> None:
+		msgs = [{"role": "user", "content": "hi"}]
+		tools = [{"type": "function", "function": {"name": n}} for n in ("b", "a")]
+		self.assertEqual(LLMCache.make_key("m", msgs, tools), LLMCache.make_key("m", msgs, list(reversed(tools))))
+		self.assertNotEqual(LLMCache.make_key("m", msgs, None), LLMCache.make_key("other", msgs, None))
+
+	def test_get_or_compute_counts_hits_and_misses(self) -> None:
+		cache = LLMCache()
+		calls = []
+
+		def compute():
+			calls.append(1)
+			return {"message": {"content": "x"}, "raw": {"big": "payload"}}
+
+		first = cache.get_or_compute("k", compute)
+		second = cache.get_or_compute("k", compute)
+		self.assertEqual(first["message"], second["message"])
+		self.assertEqual(len(calls), 1)
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+		cache.get_or_compute("k", compute, no_cache=True)
+		self.assertEqual(len(calls), 2)
+
+	def test_disk_backend_survives_new_instance(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			LLMCache(directory=td).set("k", {"message": {"content": "saved"}})
+			self.assertEqual(LLMCache(directory=td).get("k"), {"message": {"content": "saved"}})
+
+	# Repeated planning requests are answered from the cache.
+	def test_generate_plan_uses_cache(self) -> None:
+		calls = []
+
+		class FakeClient:
+			model = "m"
+
+			def chat(self, *, messages, tools):
+				calls.append(messages)
+				return {"message": {"content": '{"needs_plan": true, "steps": ["a", "b", "c"]}'}}
+
+		cache = LLMCache()
+		request = "restructure the repository layout across several packages and update all imports"
+		for _ in range(2):
+			plan = generate_plan(FakeClient(), request, True, cache)
+			self.assertEqual([s.description for s in plan.steps], ["a", "b", "c"])
+		self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+	unittest.main()
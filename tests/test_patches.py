@@ -95,3 +95,63 @@ class TestPatches(unittest.TestCase):
 """
 			apply_v4a_patch(patch)
 			self.assertFalse(os.path.exists(p))
+
+	# One patch can add and update files; an unknown "*** " marker is rejected.
+	def test_multi_file_patch_and_unknown_marker(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			a = os.path.join(td, "a.txt")
+			b = os.path.join(td, "b.txt")
+			with open(b, "w", encoding="utf-8") as f:
+				f.write("keep\nold\n")
+			patch = f"""*** Begin Patch
+*** Add File: {a}
++new
+*** Update File: {b}
+@@
+ keep
+-old
++NEW
+*** End Patch
+"""
+			result = apply_v4a_patch(patch)
+			self.assertEqual([x["action"] for x in result["applied"]], ["add", "update"])
+			with open(a, encoding="utf-8") as f:
+				self.assertEqual(f.read(), "new\n")
+			with open(b, encoding="utf-8") as f:
+				self.assertEqual(f.read(), "keep\nNEW\n")
+
+			with self.assertRaisesRegex(PatchError, "Unexpected patch line"):
+				apply_v4a_patch("*** Begin Patch\n*** Rename File: x\n*** End Patch\n")
+
+	# Matches are whole lines: a needle line never matches part of a longer line.
+	def test_find_lines_matches_whole_lines(self) -> None:
+		from agent.patches import _find_lines
+
+		haystack = ["xab", "b", "c", "b", "cd"]
+		self.assertEqual(_find_lines(haystack, ["b", "c"]), 1)
+		self.assertEqual(_find_lines(haystack, ["b", "cd"]), 3)
+		self.assertIsNone(_find_lines(haystack, ["ab", "b"]))
+		self.assertIsNone(_find_lines([], [""]))
+
+	# Whitespace-tolerant matching keeps working for later chunks after earlier edits.
+	def test_fuzzy_match_across_chunks(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			p = os.path.join(td, "w.txt")
+			with open(p, "w", encoding="utf-8") as f:
+				f.write("a  \nb\n  c\nd\ne\n")
+			patch = f"""*** Begin Patch
+*** Update File: {p}
+@@
+ a
+-b
++B1
++B2
+@@
+ c
+-d
++D
+*** End Patch
+"""
+			apply_v4a_patch(patch)
+			with open(p, encoding="utf-8") as f:
+				self.assertEqual(f.read(), "a\nB1\nB2\nc\nD\ne\n")
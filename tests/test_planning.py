@@ -1,12 +1,18 @@
 """Tests for plan generation and tracking."""
+import os
+import tempfile
 import unittest
+
 from agent.agent_loop import Agent, AgentConfig, Plan, PlanStep
 from agent.history import HistoryStore
+from agent.planning import PlanCache
 
 
 class TestPlanning(unittest.TestCase):
 	def setUp(self):
-		self.history = HistoryStore(":memory:")
+		td = tempfile.TemporaryDirectory()
+		self.addCleanup(td.cleanup)
+		self.history = HistoryStore(os.path.join(td.name, "history.jsonl"))
 
 	# Validates a PlanStep defaults to incomplete with the provided description.
 	def test_plan_step_creation(self):
@@ -100,5 +106,166 @@ class TestPlanning(unittest.TestCase):
 		self.assertEqual(plan.current_step_idx, 0)
 
 
+	# Resetting the context also discards any pending plan and its step outputs.
+	def test_reset_clears_plan_state(self):
+		agent = Agent(history=self.history, config=AgentConfig(enable_planning=True))
+		agent.current_plan = Plan(steps=[PlanStep(description="Inspect")], approved=True)
+		agent._plan_intermediate_outputs.append({"step_idx": 0, "text": "partial"})
+
+		agent.reset()
+
+		self.assertIsNone(agent.current_plan)
+		self.assertEqual(agent._plan_intermediate_outputs, [])
+
+	# An approved plan is appended once as a system message, after the untouched prefix.
+	def test_approved_plan_header_appended_once(self):
+		agent = Agent(history=self.history, config=AgentConfig(enable_planning=True))
+		agent.current_plan = Plan(steps=[PlanStep(description="Inspect"), PlanStep(description="Implement")], approved=True)
+		prefix = list(agent.messages)
+		agent.client.chat = lambda *_, **__: {"message": {"role": "assistant", "content": "ok", "tool_calls": []}}  # type: ignore[attr-defined]
+
+		agent.chat("restructure the repo", auto_approve_plan=True)
+
+		self.assertEqual(agent.messages[: len(prefix)], prefix)
+		header = agent.messages[len(prefix)]
+		self.assertEqual(header["role"], "system")
+		self.assertIn("1. Inspect\n2. Implement", header["content"])
+		self.assertEqual(sum(1 for m in agent.messages if str(m.get("content", "")).startswith("Approved plan:")), 1)
+
+	# Compaction during an active plan keeps the plan header, even if summarizing fails.
+	def test_plan_header_survives_compaction(self):
+		config = AgentConfig(enable_planning=True, max_tool_rounds=8, max_context_messages=8, llm_cache=False)
+		agent = Agent(history=self.history, config=config)
+		agent.current_plan = Plan(steps=[PlanStep(description="Inspect"), PlanStep(description="Implement")], approved=True)
+		agent.tools.execute = lambda name, args: {"ok": True}  # type: ignore[method-assign]
+		rounds = {"n": 0}
+
+		def fake_chat(*, messages, tools):
+			if tools is None:
+				raise RuntimeError("summary failed")
+			rounds["n"] += 1
+			if rounds["n"] < 6:
+				call = {"id": f"call_{rounds['n']}", "type": "function", "function": {"name": "list_dir", "arguments": "{}"}}
+				return {"message": {"role": "assistant", "content": None, "tool_calls": [call]}}
+			return {"message": {"role": "assistant", "content": "done", "tool_calls": []}}
+
+		agent.client.chat = fake_chat  # type: ignore[attr-defined]
+
+		agent.chat("restructure the repo", auto_approve_plan=True)
+
+		headers = [m for m in agent.messages if str(m.get("content", "")).startswith("Approved plan:")]
+		self.assertEqual(len(headers), 1)
+		self.assertIn("1. Inspect\n2. Implement", headers[0]["content"])
+		self.assertTrue(any(str(m.get("content", "")).startswith("Prior context summary:") for m in agent.messages))
+
+	# Completed plans are stored without file paths and found again for similar requests.
+	def test_plan_cache_lookup_and_anonymize(self):
+		with tempfile.TemporaryDirectory() as td:
+			cache = PlanCache(os.path.join(td, "plans.sqlite"))
+			cache.record_success("restructure the repo layout", ["Inspect src/agent/app.py", "Move modules"])
+			cache.record_success("restructure the repo layout", ["Inspect src/agent/app.py", "Move modules"])
+
+			hit = cache.lookup("Restructure the repo layout please", 0.9)
+			self.assertIsNotNone(hit)
+			goal, steps, score = hit
+			self.assertEqual(goal, "restructure the repo layout")
+			self.assertEqual(steps, ["Inspect <path>", "Move modules"])
+			self.assertGreaterEqual(score, 0.9)
+			self.assertIsNone(cache.lookup("fix the failing date parser test", 0.9))
+			cache.close()
+
+	# Only path-shaped text is anonymized; slashes in prose are kept.
+	def test_plan_cache_keeps_slashes_in_prose(self):
+		with tempfile.TemporaryDirectory() as td:
+			cache = PlanCache(os.path.join(td, "plans.sqlite"))
+			cache.record_success("clean up io", ["Update and/or drop the read/write I/O code", "Check ./scripts and ~/.bashrc"])
+			hit = cache.lookup("clean up io", 0.9)
+			self.assertIsNotNone(hit)
+			self.assertEqual(hit[1], ["Update and/or drop the read/write I/O code", "Check <path> and <path>"])
+			cache.close()
+
+	# A cache hit asks the LLM to adapt the stored steps instead of planning from scratch.
+	def test_generate_plan_adapts_cached_plan(self):
+		with tempfile.TemporaryDirectory() as td:
+			config = AgentConfig(enable_planning=True, plan_cache_enabled=True, plan_cache_path=os.path.join(td, "plans.sqlite"))
+			agent = Agent(history=self.history, config=config)
+			agent._plan_cache.record_success("restructure the repo layout", ["Inspect", "Move", "Fix imports"])
+			prompts = []
+
+			def fake_chat(*, messages, tools):
+				prompts.append(messages[0]["content"])
+				return {"message": {"content": '{"steps": ["Inspect", "Move", "Fix imports", "Run tests"]}'}}
+
+			agent.client.chat = fake_chat  # type: ignore[attr-defined]
+
+			plan = agent._generate_plan("restructure the repo layout")
+			self.assertEqual([s.description for s in plan.steps], ["Inspect", "Move", "Fix imports", "Run tests"])
+			self.assertEqual(len(prompts), 1)
+			self.assertIn("Previous steps:", prompts[0])
+			agent._plan_cache.close()
+
+	# Fenced JSON wins over stray braces, and trailing prose after the object is ignored.
+	def test_should_plan_extracts_first_json_object(self):
+		from agent.planning.detector import should_plan
+
+		replies = [
+			'Sure:\n```json\n{"needs_plan": true, "steps": ["a", "b"]}\n```\nThen run `f({})`.',
+			'{"needs_plan": true, "steps": ["a", "b"]} and later {"other": 1}',
+		]
+		for content in replies:
+			client = type("C", (), {"chat": lambda self, _c=content, **_: {"message": {"content": _c}}})()
+			needs, steps, _ = should_plan(client, "restructure the repository layout across several packages please")
+			self.assertTrue(needs)
+			self.assertEqual(steps, ["a", "b"])
+
+	# Each step output is capped before it goes into the summary prompt.
+	def test_finalize_truncates_intermediate_outputs(self):
+		import json
+
+		agent = Agent(history=self.history, config=AgentConfig(llm_cache=False, max_intermediate_chars=10))
+		sent = []
+
+		def fake_chat(*, messages, tools):
+			sent.append(json.loads(messages[-1]["content"]))
+			return {"message": {"content": "done"}}
+
+		agent.client.chat = fake_chat  # type: ignore[attr-defined]
+		plan = Plan(steps=[PlanStep(description="Inspect")], approved=True)
+		out = agent._finalize_plan_response(original_request="r", plan=plan, intermediate_outputs=[{"text": "x" * 50}])
+		self.assertEqual(out, "done")
+		self.assertEqual(sent[0]["intermediate_outputs"], ["xxxxxxx..."])
+
+	# The local classifier rules out planning for clearly simple edits without an LLM call.
+	def test_local_classifier_skips_llm_for_simple_requests(self):
+		from agent.planning.detector import should_plan
+		from agent.planning.detector_local import plan_probability
+
+		self.assertLess(plan_probability("fix the typo in the README heading please"), 0.35)
+		self.assertGreater(plan_probability("refactor the auth module across several packages and update all tests"), 0.65)
+
+		calls = []
+
+		class FakeClient:
+			def chat(self, **_):
+				calls.append(1)
+				return {"message": {"content": '{"needs_plan": true, "steps": ["a", "b"]}'}}
+
+		needs, _, reason = should_plan(FakeClient(), "fix the typo in the README heading please", local_classifier=True)
+		self.assertEqual((needs, reason, calls), (False, "local classifier", []))
+		needs, steps, _ = should_plan(FakeClient(), "refactor the auth module across several packages", local_classifier=True)
+		self.assertEqual((needs, steps), (True, ["a", "b"]))
+		self.assertEqual(len(calls), 1)
+
+	# The quick "simple query" check matches question words only as whole words.
+	def test_quick_heuristic_matches_whole_words(self):
+		from agent.planning.detector import should_plan
+
+		class FakeClient:
+			def chat(self, **_):
+				return {"message": {"content": '{"needs_plan": false, "reasoning": "asked llm"}'}}
+
+		self.assertEqual(should_plan(FakeClient(), "Why does this fail")[2], "simple query")
+		self.assertEqual(should_plan(FakeClient(), "however, rename the listener")[2], "asked llm")
+
 if __name__ == "__main__":
 	unittest.main()
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import unittest
+
+from agent.similarity import dedupe_similar, fact_tokens, text_similarity, word_counts
+
+
+class TestSimilarity(unittest.TestCase):
+	def test_word_counts_drop_case_punctuation_and_stopwords(self) -> None:
+		self.assertEqual(dict(word_counts("Fix the test, then fix it!")), {"fix": 2, "test": 1, "then": 1})
+
+	def test_text_similarity(self) -> None:
+		self.assertAlmostEqual(text_similarity("rename the config loader", "Rename config loader"), 1.0)
+		self.assertGreater(text_similarity("rename the config loader", "rename the config parser"), 0.5)
+		self.assertEqual(text_similarity("rename the config loader", "update the README"), 0.0)
+		self.assertEqual(text_similarity("", "anything"), 0.0)
+
+	def test_dedupe_similar_keeps_latest_per_cluster(self) -> None:
+		texts = [
+			"Read config.py; the loader parses YAML.",
+			"Updated the tests.",
+			"Read config.py: the loader parses YAML files.",
+		]
+		self.assertEqual(dedupe_similar(texts), [texts[2], texts[1]])
+		self.assertEqual(dedupe_similar(["a b", "c d"]), ["a b", "c d"])
+		self.assertEqual(dedupe_similar(["Ran the suite: all tests passed!", "Ran the suite and all tests passed"]), ["Ran the suite and all tests passed"])
+
+	# Texts that differ only in a number or path are different results, not restatements.
+	def test_dedupe_similar_keeps_differing_facts(self) -> None:
+		self.assertEqual(dedupe_similar(["3 tests failed", "0 tests failed"]), ["3 tests failed", "0 tests failed"])
+		self.assertEqual(dedupe_similar(["Edited src/a.py", "Edited src/b.py"]), ["Edited src/a.py", "Edited src/b.py"])
+		self.assertEqual(fact_tokens("Read config.py, then ran v1.2 in src/app."), {"config.py", "v1.2", "src/app"})
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+import json
 import os
 import tempfile
 import time
 import unittest
+from unittest import mock
 
-from agent.terminal import TerminalManager
+from agent.terminal import BackgroundProcess, TerminalError, TerminalManager
 
 
 def vprint(msg: str) -> None:
@@ -63,3 +65,100 @@ class TestTerminalManager(unittest.TestCase):
 			self.assertIn("hi", last["output"])
 
 			term.close()
+
+	# A silent command times out at the deadline instead of blocking until its next line.
+	def test_execute_times_out_on_deadline(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			term = TerminalManager(workdir=td, state_dir=os.path.join(td, ".agent"), shell_path="/bin/sh")
+			try:
+				started = time.monotonic()
+				with self.assertRaisesRegex(TerminalError, "Timeout"):
+					term.execute("sleep 5", timeout_s=1)
+				self.assertLess(time.monotonic() - started, 3)
+			finally:
+				term.close()
+
+
+class TestProcessIndex(unittest.TestCase):
+	# Starts append one line each; a fresh manager rebuilds the index, skipping a torn tail line.
+	def test_index_is_append_only(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			proc_dir = os.path.join(td, ".agent", "proc")
+			os.makedirs(proc_dir)
+			with open(os.path.join(proc_dir, "index.json"), "w", encoding="utf-8") as f:
+				json.dump([{"process_id": "legacy", "pid": 1}], f)
+
+			def put(term: TerminalManager, process_id: str) -> None:
+				term._index_put(BackgroundProcess(process_id, 2, "true", None, "a.log", "a.status", 0.0))
+
+			term = TerminalManager(workdir=td)
+			put(term, "p1")
+			self.assertEqual(term._index_get("p1")["pid"], 2)
+			index_path = os.path.join(proc_dir, "index.jsonl")
+			with open(index_path, "a", encoding="utf-8") as f:
+				f.write('{"process_id": "tor')
+
+			term = TerminalManager(workdir=td)
+			put(term, "p2")
+			self.assertEqual([p["process_id"] for p in term.list_processes()["processes"]], ["legacy", "p1", "p2"])
+			self.assertEqual(len(TerminalManager(workdir=td)._index_all()), 3)
+
+			# Flushing rewrites the legacy and torn entries into one clean log.
+			term.flush_index()
+			self.assertEqual(sorted(os.listdir(proc_dir)), ["index.jsonl"])
+			with open(index_path, encoding="utf-8") as f:
+				self.assertEqual([json.loads(line)["process_id"] for line in f], ["legacy", "p1", "p2"])
+
+	# Using the index registers close() to run at exit, which compacts it; close() unregisters.
+	def test_close_runs_at_exit(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			proc_dir = os.path.join(td, ".agent", "proc")
+			os.makedirs(proc_dir)
+			with open(os.path.join(proc_dir, "index.json"), "w", encoding="utf-8") as f:
+				json.dump([{"process_id": "legacy", "pid": 1}], f)
+			term = TerminalManager(workdir=td)
+			with mock.patch("agent.terminal.atexit") as hooks:
+				term.list_processes()
+				term.list_processes()
+				hooks.register.assert_called_once_with(term.close)
+				hooks.register.call_args.args[0]()
+				hooks.unregister.assert_called_once_with(term.close)
+			self.assertEqual(sorted(os.listdir(proc_dir)), ["index.jsonl"])
+
+
+
+class TestProcessOutput(unittest.TestCase):
+	# Polls append newly logged lines to the in-memory tail; a truncated log is reread.
+	def test_log_tail_reads_incrementally(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			term = TerminalManager(workdir=td)
+			log_path = os.path.join(td, "p.log")
+			term._index_put(BackgroundProcess("p", os.getpid(), "x", None, log_path, log_path + ".status", 0.0))
+			self.assertEqual(term.get_process_output("p")["output"], "")
+
+			with open(log_path, "w", encoding="utf-8") as f:
+				f.write("one\ntw")
+			self.assertEqual(term.get_process_output("p", tail_lines=5)["output"], "one\ntw")
+			with open(log_path, "a", encoding="utf-8") as f:
+				f.write("o\nthree\n")
+			self.assertEqual(term.get_process_output("p", tail_lines=2)["output"], "two\nthree")
+			self.assertEqual(term._tails["p"].offset, os.path.getsize(log_path))
+
+			with open(log_path, "w", encoding="utf-8") as f:
+				f.write("fresh\n")
+			out = term.get_process_output("p", tail_lines=5)
+			self.assertEqual((out["output"], out["running"]), ("fresh", True))
+
+	# On Linux a PID whose start time changed since it was first seen counts as exited (reused).
+	@unittest.skipUnless(os.path.exists("/proc/self/stat"), "needs /proc")
+	def test_pid_reuse_is_not_running(self) -> None:
+		term = TerminalManager(workdir=".")
+		pid = os.getpid()
+		self.assertTrue(term._pid_alive(pid))
+		# Within the recheck window a poll is just kill(pid, 0).
+		with mock.patch("agent.terminal._proc_stat") as proc_stat:
+			self.assertTrue(term._pid_alive(pid))
+			proc_stat.assert_not_called()
+		start, _ = term._liveness[pid]
+		term._liveness[pid] = (start - 1, float("-inf"))
+		self.assertFalse(term._pid_alive(pid))
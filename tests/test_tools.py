@@ -37,6 +37,34 @@ class TestTools(unittest.TestCase):
 			self.assertIn("a.txt", names)
 			self.assertIn("sub", names)
 
+	def test_tool_schemas_json_is_memoized(self) -> None:
+		first = self.tools.tool_schemas_json()
+		self.assertIs(self.tools.tool_schemas_json(), first)
+		self.assertIn('"name":"read_file"', first)
+		self.tools.invalidate_schema_cache()
+		self.assertEqual(self.tools.tool_schemas_json(), first)
+
+	def test_decode_arguments(self) -> None:
+		self.assertEqual(self.tools.decode_arguments("read_file", '{"path": "a.txt"}'), {"path": "a.txt"})
+		self.assertEqual(self.tools.decode_arguments("read_file", {"path": "a.txt"}), {"path": "a.txt"})
+		self.assertEqual(self.tools.decode_arguments("list_processes", ""), {})
+		self.assertEqual(self.tools.decode_arguments("read_file", "[1]"), {"_raw": "[1]"})
+
+	# Only tools with no shared mutable state run in parallel batches.
+	def test_process_tools_are_not_parallel(self) -> None:
+		self.assertTrue(self.tools.is_read_only("grep_search"))
+		self.assertFalse(self.tools.is_read_only("get_process_output"))
+		self.assertFalse(self.tools.is_read_only("list_processes"))
+
+	def test_execute_reports_missing_and_invalid_arguments(self) -> None:
+		res = self.tools.execute("write_file", {"path": "x.txt"})
+		self.assertFalse(res["ok"])
+		self.assertIn("Missing required argument(s) for write_file: content", res["error"])
+
+		res = self.tools.execute("read_file", self.tools.decode_arguments("read_file", "{not json"))
+		self.assertFalse(res["ok"])
+		self.assertIn("Invalid JSON arguments for read_file", res["error"])
+
 	def test_write_and_read_file_with_range(self) -> None:
 		with tempfile.TemporaryDirectory() as td:
 			p = os.path.join(td, "f.txt")
@@ -47,6 +75,21 @@ class TestTools(unittest.TestCase):
 			self.assertTrue(r["ok"])
 			self.assertEqual(r["content"], "l2\nl3")
 
+			r = self.tools.execute("read_file", {"path": p, "start_line": 3})
+			self.assertEqual((r["content"], r["end_line"]), ("l3", 3))
+			self.assertEqual(self.tools.execute("read_file", {"path": p, "end_line": 9})["content"], "l1\nl2\nl3")
+
+	# Overwrites are atomic renames that keep the file's mode and leave no temp file behind.
+	def test_write_file_replaces_atomically(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			p = os.path.join(td, "run.sh")
+			self.tools.execute("write_file", {"path": p, "content": "old"})
+			os.chmod(p, 0o755)
+			res = self.tools.execute("write_file", {"path": p, "content": "né"})
+			self.assertEqual(res["bytes"], 3)
+			self.assertEqual(os.stat(p).st_mode & 0o777, 0o755)
+			self.assertEqual(os.listdir(td), ["run.sh"])
+
 	def test_grep_search(self) -> None:
 		with tempfile.TemporaryDirectory() as td:
 			with open(os.path.join(td, "a.txt"), "w", encoding="utf-8") as f:
@@ -59,6 +102,53 @@ class TestTools(unittest.TestCase):
 			self.assertGreaterEqual(len(res["results"]), 1)
 			self.assertTrue(any("needle" in r["text"] for r in res["results"]))
 
+	# Anchors apply per line, each line is reported once, and max_results stops the scan.
+	def test_grep_search_lines_and_limit(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			p = os.path.join(td, "a.txt")
+			with open(p, "w", encoding="utf-8") as f:
+				f.write("x\nneedle needle\n\nneedle\nlast needle")
+			hits = self.tools.execute("grep_search", {"root": td, "pattern": "^needle"})["results"]
+			self.assertEqual([(r["line"], r["text"]) for r in hits], [(2, "needle needle"), (4, "needle")])
+			hits = self.tools.execute("grep_search", {"root": td, "pattern": "needle$", "max_results": 2})["results"]
+			self.assertEqual([r["line"] for r in hits], [2, 4])
+
+	# Regexes mean what they do on text lines: CRLF endings, Unicode classes, no newline crossing.
+	def test_grep_search_regex_matches_decoded_lines(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			with open(os.path.join(td, "a.txt"), "wb") as f:
+				f.write("foo\r\ncafé\r\nvoilà\r\nx\r\ny\r\n".encode("utf-8"))
+
+			def grep(pattern: str) -> list[tuple[int, str]]:
+				hits = self.tools.execute("grep_search", {"root": td, "pattern": pattern})["results"]
+				return [(r["line"], r["text"]) for r in hits]
+
+			self.assertEqual(grep("foo$"), [(1, "foo")])
+			self.assertEqual(grep(r"^caf\w$"), [(2, "café")])
+			self.assertEqual(grep("[é]"), [(2, "café")])
+			self.assertEqual(grep(r"x\sy"), [])
+			self.assertEqual(grep("^$"), [])
+
+	# Files with a NUL byte near the start are treated as binary and skipped.
+	def test_grep_search_skips_binary_files(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			with open(os.path.join(td, "blob.bin"), "wb") as f:
+				f.write(b"\x89PNG\x00\x00needle\n")
+			with open(os.path.join(td, "a.txt"), "w", encoding="utf-8") as f:
+				f.write("needle\n")
+			hits = self.tools.execute("grep_search", {"root": td, "pattern": "needle"})["results"]
+			self.assertEqual([os.path.basename(r["path"]) for r in hits], ["a.txt"])
+
+	# Files are scanned in parallel batches, but results keep the sequential walk order.
+	def test_grep_search_keeps_walk_order(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			for i in range(40):
+				with open(os.path.join(td, f"f{i}.txt"), "w", encoding="utf-8") as f:
+					f.write("needle\n")
+			walk_order = [os.path.join(td, fn) for fn in next(os.walk(td))[2]]
+			hits = self.tools.execute("grep_search", {"root": td, "pattern": "needle", "max_results": 25})["results"]
+			self.assertEqual([r["path"] for r in hits], walk_order[:25])
+
 	def test_create_diff(self) -> None:
 		with tempfile.TemporaryDirectory() as td:
 			p = os.path.join(td, "x.txt")
@@ -72,6 +162,9 @@ class TestTools(unittest.TestCase):
 			self.assertIn(f"--- a/{p}", d)
 			self.assertIn(f"+++ b/{p}", d)
 
+			same = self.tools.execute("create_diff", {"path": p, "new_content": "old\n"})
+			self.assertEqual(same["diff"], "")
+
 	def test_apply_patch_add_update_delete(self) -> None:
 		with tempfile.TemporaryDirectory() as td:
 			p = os.path.join(td, "t.txt")
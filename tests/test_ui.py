@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 import os
+import signal
+import tempfile
 import unittest
 from unittest import mock
 
-from agent.ui_layer import get_theme, render_markdown
+from agent.ui_layer import get_theme, load_ui_config, render_markdown, save_ui_config, theme
+from agent.ui_layer.theme import _box, _strip_ansi
 
 
 class TestUiMarkdown(unittest.TestCase):
@@ -27,3 +30,72 @@ class TestUiMarkdown(unittest.TestCase):
 			self.assertIn("• item", out)
 			self.assertIn("code (py)", out)
 			self.assertIn("  print(\"hi\")", out)
+
+	# Emphasis markers are unwrapped in plain mode; stray or spaced asterisks stay as typed.
+	def test_render_inline_emphasis_plain(self) -> None:
+		with mock.patch.dict(os.environ, {"NO_COLOR": "1"}):
+			out = render_markdown("2 * 3 is **six**, *really* * not ** here", get_theme("dark"))
+		self.assertEqual(out, "2 * 3 is six, really * not ** here")
+		# A list-marker asterisk is not an emphasis opener.
+		with mock.patch.dict(os.environ, {"NO_COLOR": "1"}):
+			out = render_markdown("* *one* and **two**\n  * nested *x*", get_theme("dark"))
+		self.assertEqual(out, "• one and two\n• nested x")
+		# An empty "****" pair is dropped, as the original renderer did.
+		with mock.patch.dict(os.environ, {"NO_COLOR": "1"}):
+			out = render_markdown("****x and **** a **b", get_theme("dark"))
+		self.assertEqual(out, "x and  a **b")
+
+
+	# Plain prose skips the renderer but still matches its output.
+	def test_render_markdown_plain_prose_fast_path(self) -> None:
+		with mock.patch.dict(os.environ, {"NO_COLOR": "1"}):
+			prose = "Just an answer.\n\nNothing to style here.  \n"
+			self.assertEqual(render_markdown(prose, get_theme("dark")), "Just an answer.\n\nNothing to style here.\n")
+			self.assertEqual(render_markdown("Done\r\n2. next", get_theme("dark")), "Done\n2. next")
+
+	# Repeat renders come from the cache, which is keyed by color mode as well as text and theme.
+	def test_render_markdown_cache(self) -> None:
+		theme = get_theme("dark")
+		with mock.patch.dict(os.environ, {"NO_COLOR": "1"}):
+			plain = render_markdown("# Cached", theme)
+			self.assertIs(render_markdown("# Cached", theme), plain)
+		with mock.patch("agent.ui_layer.theme.supports_color", return_value=True):
+			self.assertIn("\x1b[", render_markdown("# Cached", theme))
+
+
+class TestUiBox(unittest.TestCase):
+	# Widths ignore every CSI sequence, not just color codes, so box borders line up.
+	def test_box_ignores_escape_sequences(self) -> None:
+		self.assertEqual(_strip_ansi("\x1b[38;5;208mab\x1b[0mc\x1b[2K"), "abc")
+		with mock.patch("agent.ui_layer.theme.supports_color", return_value=True):
+			lines = _box(["\x1b[1mbold\x1b[0m", "plain text"], theme=get_theme("dark")).splitlines()
+		self.assertEqual({len(_strip_ansi(l)) for l in lines}, {14})
+
+	# The width is measured once and measured again only after a resize signal.
+	@unittest.skipUnless(hasattr(signal, "SIGWINCH"), "no SIGWINCH")
+	def test_term_width_cached_until_resize(self) -> None:
+		size = os.terminal_size((100, 24))
+		with mock.patch("agent.ui_layer.theme.shutil.get_terminal_size", return_value=size) as get_size:
+			theme._TERM_WIDTH = None
+			self.assertEqual(theme._term_width(), 100)
+			self.assertEqual(theme._term_width(), 100)
+			self.assertEqual(get_size.call_count, 1)
+			signal.raise_signal(signal.SIGWINCH)
+			self.assertEqual(theme._term_width(), 100)
+			self.assertEqual(get_size.call_count, 2)
+		theme._TERM_WIDTH = None
+
+
+class TestUiConfig(unittest.TestCase):
+	# Cached reads hand out copies and pick up rewrites of the file.
+	def test_load_ui_config_cache(self) -> None:
+		with tempfile.TemporaryDirectory() as td:
+			path = os.path.join(td, "ui.json")
+			self.assertEqual(load_ui_config(path), {})
+			save_ui_config(path, {"theme": "dark"})
+			cfg = load_ui_config(path)
+			cfg["theme"] = "mutated"
+			self.assertEqual(load_ui_config(path), {"theme": "dark"})
+			with open(path, "w", encoding="utf-8") as f:
+				f.write('{"theme": "light", "onboarded": true}')
+			self.assertEqual(load_ui_config(path), {"theme": "light", "onboarded": True})